@@ -4,13 +4,13 @@ Coordinates the multi-agent system for AI tutoring
 """
 
 import asyncio
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from enum import Enum
 from .triage_agent import TriageAgent
 from .concepts_agent import ConceptsAgent
 from .code_review_agent import CodeReviewAgent
-from .debug_agent import DebugAgent
-from .exercise_agent import ExerciseAgent
+from .debug_agent import DebugAgent, Runner
+from .exercise_agent import ExerciseAgent, Grader
 from .progress_agent import ProgressAgent
 
 class AgentType(Enum):
@@ -22,17 +22,22 @@ class AgentType(Enum):
     PROGRESS = "progress"
 
 class AgentManager:
-    def __init__(self):
+    def __init__(self, runner: Optional[Runner] = None, grader: Optional[Grader] = None):
+        """
+        Args:
+            runner: Runs code in the sandbox for the debug agent
+            grader: Grades solutions in the sandbox for the exercise agent
+        """
         self.agents: Dict[AgentType, Any] = {}
-        self._initialize_agents()
+        self._initialize_agents(runner, grader)
 
-    def _initialize_agents(self):
+    def _initialize_agents(self, runner: Optional[Runner], grader: Optional[Grader]):
         """Initialize all AI agents"""
         self.agents[AgentType.TRIAGE] = TriageAgent()
         self.agents[AgentType.CONCEPTS] = ConceptsAgent()
         self.agents[AgentType.CODE_REVIEW] = CodeReviewAgent()
-        self.agents[AgentType.DEBUG] = DebugAgent()
-        self.agents[AgentType.EXERCISE] = ExerciseAgent()
+        self.agents[AgentType.DEBUG] = DebugAgent(runner=runner)
+        self.agents[AgentType.EXERCISE] = ExerciseAgent(grader=grader)
         self.agents[AgentType.PROGRESS] = ProgressAgent()
 
     async def route_request(self, user_input: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
@@ -0,0 +1,469 @@
+"""
+Static Analysis Engine for LearnFlow
+Runs registered rules over a program's AST in a single traversal
+
+Rules are registered by name for the node types they inspect and called
+with each such node and the AnalysisContext, in source order. The registry
+is compiled into a node type -> rules dispatch table, once per set of
+disabled rules, so course profiles that turn rules off cost nothing per
+node; a timed engine also counts calls and time per rule. The traversal keeps a
+stack of scopes (module, class, function, lambda, comprehension); each Scope
+records the names it binds, the names it reads and the target names of the
+for loops currently open in it, so rules can share that state instead of
+walking the tree again. Finalizers run once after the traversal, when every
+scope's bindings are known; undefined-name detection is one, since a
+function may read a global that is only assigned further down.
+
+Every node is visited once, so analysis time grows linearly with the size
+of the program, whatever its nesting.
+"""
+import ast
+import builtins
+import time
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple, Type
+
+# Names every module can read without defining them
+IMPLICIT_NAMES = frozenset(dir(builtins)) | {
+    "__name__", "__file__", "__doc__", "__builtins__", "__spec__", "__loader__", "__package__",
+    "__annotations__", "__class__", "__module__", "__qualname__",
+}
+
+
+class Scope:
+    """Names bound and read in one module, class, function, lambda or comprehension body"""
+
+    __slots__ = ("kind", "name", "parent", "defined", "augmented", "global_names", "loads", "loop_targets",
+                 "star_import")
+
+    def __init__(self, kind: str, name: str, parent: Optional["Scope"] = None):
+        self.kind = kind
+        self.name = name
+        self.parent = parent
+        self.defined: Set[str] = set()
+        # Names assigned with `x += ...`, which reads x first: that makes x
+        # local to a function, but does not define it
+        self.augmented: Set[str] = set()
+        # Names declared global, whose bindings belong to the module scope
+        self.global_names: Set[str] = set()
+        # (name, node) for every read, resolved after the traversal
+        self.loads: List[Tuple[str, ast.Name]] = []
+        # Target names of the for loops open at the current point, innermost last
+        self.loop_targets: List[Tuple[ast.AST, Set[str]]] = []
+        self.star_import = False
+
+    def loop_binding(self, name: str) -> Optional[ast.AST]:
+        """The innermost open for loop whose target binds name, if any"""
+        for loop, names in reversed(self.loop_targets):
+            if name in names:
+                return loop
+        return None
+
+    def resolves(self, name: str) -> bool:
+        """Whether a read of name in this scope finds a binding or a builtin"""
+        if name in self.global_names:
+            return name in self.module().defined or name in IMPLICIT_NAMES
+        if name in self.defined:
+            return True
+        if self.kind == "function" and name in self.augmented:
+            return False
+        scope = self.parent
+        while scope is not None:
+            # Class bodies are not visible from the functions defined in them
+            if scope.kind != "class":
+                if name in scope.defined:
+                    return True
+                if scope.kind == "function" and name in scope.augmented:
+                    return False
+            scope = scope.parent
+        return name in IMPLICIT_NAMES
+
+    def module(self) -> "Scope":
+        scope = self
+        while scope.parent is not None:
+            scope = scope.parent
+        return scope
+
+
+class AnalysisContext:
+    """State of one analysis run, passed to every rule"""
+
+    def __init__(self, tree: ast.AST, code: str, lines: Optional[List[str]] = None):
+        self.tree = tree
+        self.lines = lines if lines is not None else code.split("\n")
+        self.module = Scope("module", "<module>")
+        self.scope = self.module
+        self.scopes: List[Scope] = [self.module]
+        self.issues: List[Dict[str, Any]] = []
+
+    def code_line(self, lineno: Optional[int]) -> str:
+        if lineno and lineno <= len(self.lines):
+            return self.lines[lineno - 1]
+        return ""
+
+    def report(self, node: ast.AST, message: str, severity: str = "medium", issue_type: str = "potential_bug"):
+        """Record an issue at node's line"""
+        lineno = getattr(node, "lineno", 0)
+        self.issues.append({
+            "type": issue_type,
+            "severity": severity,
+            "line": lineno,
+            "message": message,
+            "code_line": self.code_line(lineno),
+        })
+
+    def bind(self, name: str, scope: Optional[Scope] = None):
+        """Record that name is bound in scope (the current one by default)"""
+        scope = scope or self.scope
+        if name in scope.global_names:
+            scope = self.module
+        scope.defined.add(name)
+
+    def bind_augmented(self, name: str):
+        """Record that name is assigned with an augmented assignment in the current scope"""
+        scope = self.scope
+        if name in scope.global_names:
+            scope = self.module
+        scope.augmented.add(name)
+
+    def push(self, kind: str, name: str) -> Scope:
+        self.scope = Scope(kind, name, self.scope)
+        self.scopes.append(self.scope)
+        return self.scope
+
+    def pop(self):
+        self.scope = self.scope.parent
+
+
+Rule = Callable[[ast.AST, AnalysisContext], None]
+Finalizer = Callable[[AnalysisContext], None]
+
+
+def target_names(target: ast.AST) -> Set[str]:
+    """Names bound by an assignment or loop target, e.g. {'i', 'x'} for `i, (x, _obj.y)`"""
+    if isinstance(target, ast.Name):
+        return {target.id}
+    if isinstance(target, (ast.Tuple, ast.List)):
+        names = set()
+        for element in target.elts:
+            names |= target_names(element)
+        return names
+    if isinstance(target, ast.Starred):
+        return target_names(target.value)
+    return set()
+
+
+class _Traversal(ast.NodeVisitor):
+    """Visits every node once, dispatching rules and maintaining the scope stack"""
+
+    def __init__(self, dispatch: Dict[Type[ast.AST], Tuple[Rule, ...]], context: AnalysisContext):
+        self.dispatch = dispatch
+        self.context = context
+
+    def visit(self, node: ast.AST):
+        rules = self.dispatch.get(type(node))
+        if rules:
+            for rule in rules:
+                rule(node, self.context)
+        method = getattr(self, "visit_" + node.__class__.__name__, None)
+        if method is not None:
+            method(node)
+        else:
+            self.generic_visit(node)
+
+    def visit_all(self, nodes: Iterable[Optional[ast.AST]]):
+        for node in nodes:
+            if node is not None:
+                self.visit(node)
+
+    # Bindings and reads
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Load):
+            self.context.scope.loads.append((node.id, node))
+        elif isinstance(node.ctx, ast.Store):
+            self.context.bind(node.id)
+
+    def visit_AugAssign(self, node: ast.AugAssign):
+        target = node.target
+        if not isinstance(target, ast.Name):
+            self.generic_visit(node)
+            return
+        # `count += 1` reads count before assigning it, so it is a read, not a definition
+        for rule in self.dispatch.get(ast.Name, ()):
+            rule(target, self.context)
+        self.context.scope.loads.append((target.id, target))
+        self.context.bind_augmented(target.id)
+        self.visit(node.value)
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self.context.bind(alias.asname or alias.name.split(".")[0])
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        for alias in node.names:
+            if alias.name == "*":
+                self.context.scope.star_import = True
+            else:
+                self.context.bind(alias.asname or alias.name)
+
+    def visit_Global(self, node: ast.Global):
+        self.context.scope.global_names.update(node.names)
+
+    def visit_Nonlocal(self, node: ast.Nonlocal):
+        # The enclosing function binds these; reading them here always resolves
+        self.context.scope.defined.update(node.names)
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler):
+        if node.name:
+            self.context.bind(node.name)
+        self.generic_visit(node)
+
+    def visit_NamedExpr(self, node: ast.NamedExpr):
+        self.visit(node.value)
+        # An assignment expression in a comprehension binds in the enclosing function
+        scope = self.context.scope
+        while scope.kind == "comprehension":
+            scope = scope.parent
+        self.context.bind(node.target.id, scope)
+
+    def visit_MatchAs(self, node):
+        if node.name:
+            self.context.bind(node.name)
+        self.generic_visit(node)
+
+    def visit_MatchStar(self, node):
+        if node.name:
+            self.context.bind(node.name)
+
+    def visit_MatchMapping(self, node):
+        if node.rest:
+            self.context.bind(node.rest)
+        self.generic_visit(node)
+
+    # Loops
+
+    def visit_For(self, node: ast.For):
+        self.visit(node.iter)
+        self.visit(node.target)
+        loops = self.context.scope.loop_targets
+        loops.append((node, target_names(node.target)))
+        self.visit_all(node.body)
+        loops.pop()
+        self.visit_all(node.orelse)
+
+    visit_AsyncFor = visit_For
+
+    # Scopes
+
+    def _visit_arguments(self, args: ast.arguments):
+        """Defaults and annotations, evaluated in the enclosing scope"""
+        self.visit_all(args.defaults)
+        self.visit_all(args.kw_defaults)
+        for arg in args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg]:
+            if arg is not None and arg.annotation is not None:
+                self.visit(arg.annotation)
+
+    def _bind_arguments(self, args: ast.arguments):
+        for arg in args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg]:
+            if arg is not None:
+                self.context.bind(arg.arg)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        self.visit_all(node.decorator_list)
+        self._visit_arguments(node.args)
+        if node.returns is not None:
+            self.visit(node.returns)
+        self.context.bind(node.name)
+        self.context.push("function", node.name)
+        self._bind_arguments(node.args)
+        self.visit_all(node.body)
+        self.context.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node: ast.Lambda):
+        self._visit_arguments(node.args)
+        self.context.push("lambda", "<lambda>")
+        self._bind_arguments(node.args)
+        self.visit(node.body)
+        self.context.pop()
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self.visit_all(node.decorator_list)
+        self.visit_all(node.bases)
+        self.visit_all(node.keywords)
+        self.context.bind(node.name)
+        self.context.push("class", node.name)
+        self.visit_all(node.body)
+        self.context.pop()
+
+    def _visit_comprehension(self, node: ast.AST, elements: Sequence[ast.AST]):
+        generators = node.generators
+        # The first iterable is evaluated in the enclosing scope
+        self.visit(generators[0].iter)
+        self.context.push("comprehension", f"<{type(node).__name__.lower()}>")
+        for index, generator in enumerate(generators):
+            if index:
+                self.visit(generator.iter)
+            self.visit(generator.target)
+            self.visit_all(generator.ifs)
+        self.visit_all(elements)
+        self.context.pop()
+
+    def visit_ListComp(self, node: ast.ListComp):
+        self._visit_comprehension(node, [node.elt])
+
+    visit_SetComp = visit_ListComp
+    visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node: ast.DictComp):
+        self._visit_comprehension(node, [node.key, node.value])
+
+
+class AnalysisEngine:
+    def __init__(self, rules: Iterable[Tuple[str, Any, Rule]] = (), finalizers: Iterable[Tuple[str, Finalizer]] = (),
+                 timed: bool = False):
+        """
+        Args:
+            rules: (name, node type or tuple of node types, rule) triples
+            finalizers: (name, finalizer) pairs, called with the context after the traversal
+            timed: Count calls and time spent per rule (see get_stats)
+        """
+        # name -> (node types, rule); finalizers have no node types
+        self._rules: Dict[str, Tuple[Tuple[Type[ast.AST], ...], Callable]] = {}
+        # Disabled rule names -> (node type -> rules, finalizers), compiled on first use
+        self._compiled: Dict[FrozenSet[str], Tuple[Dict[Type[ast.AST], Tuple[Rule, ...]], Tuple[Finalizer, ...]]] = {}
+        self.timed = timed
+        # name -> [calls, seconds]
+        self._timings: Dict[str, List[float]] = {}
+        for name, node_types, rule in rules:
+            self.register(name, node_types, rule)
+        for name, finalizer in finalizers:
+            self.register_finalizer(name, finalizer)
+
+    @property
+    def rule_names(self) -> List[str]:
+        return list(self._rules)
+
+    @property
+    def has_finalizers(self) -> bool:
+        return any(not node_types for node_types, _ in self._rules.values())
+
+    def register(self, name: str, node_types, rule: Rule):
+        """
+        Register a rule for one or more node types
+
+        Args:
+            name: Unique rule name, used to disable it and in timings
+            node_types: An ast node class or a tuple of them
+            rule: Called with each node of those types and the context
+        """
+        if name in self._rules:
+            raise ValueError(f"Rule '{name}' is already registered")
+        if not isinstance(node_types, tuple):
+            node_types = (node_types,)
+        self._rules[name] = (node_types, rule)
+        self._timings[name] = [0, 0.0]
+        self._compiled.clear()
+
+    def register_finalizer(self, name: str, finalizer: Finalizer):
+        """
+        Register a rule that runs once after the traversal
+
+        Args:
+            name: Unique rule name, used to disable it and in timings
+            finalizer: Called with the context
+        """
+        self.register(name, (), finalizer)
+
+    def rule(self, name: str, *node_types):
+        """Decorator form of register"""
+        def decorator(rule: Rule) -> Rule:
+            self.register(name, node_types, rule)
+            return rule
+        return decorator
+
+    def _timed_rule(self, name: str, rule: Callable) -> Callable:
+        timing = self._timings[name]
+        clock = time.perf_counter
+
+        def run(*args):
+            started = clock()
+            try:
+                rule(*args)
+            finally:
+                timing[0] += 1
+                timing[1] += clock() - started
+        return run
+
+    def _compile(self, disabled: FrozenSet[str]):
+        """The dispatch table (node type -> rules) and finalizers with some rules disabled"""
+        compiled = self._compiled.get(disabled)
+        if compiled is None:
+            dispatch: Dict[Type[ast.AST], List[Rule]] = {}
+            finalizers = []
+            for name, (node_types, rule) in self._rules.items():
+                if name in disabled:
+                    continue
+                if self.timed:
+                    rule = self._timed_rule(name, rule)
+                if not node_types:
+                    finalizers.append(rule)
+                for node_type in node_types:
+                    dispatch.setdefault(node_type, []).append(rule)
+            compiled = ({node_type: tuple(rules) for node_type, rules in dispatch.items()}, tuple(finalizers))
+            self._compiled[disabled] = compiled
+        return compiled
+
+    def analyze(self, tree: ast.AST, code: str, disabled: Iterable[str] = (),
+                lines: Optional[List[str]] = None) -> AnalysisContext:
+        """
+        Run the rules over a parsed program
+
+        Args:
+            tree: The program's AST
+            code: The program's source, for the code_line of issues
+            disabled: Names of rules to skip
+            lines: The source split into lines, if already at hand
+
+        Returns:
+            The context, with the issues found and the scopes
+        """
+        dispatch, finalizers = self._compile(frozenset(disabled))
+        context = AnalysisContext(tree, code, lines)
+        _Traversal(dispatch, context).visit(tree)
+        for finalizer in finalizers:
+            finalizer(context)
+        return context
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Calls and time spent per rule, if the engine is timed"""
+        return {
+            name: {
+                "calls": int(calls),
+                "total_ms": round(seconds * 1000, 3),
+                "mean_us": round(seconds / calls * 1e6, 3) if calls else 0.0,
+            }
+            for name, (calls, seconds) in self._timings.items()
+        }
+
+
+def undefined_names(context: AnalysisContext) -> List[Tuple[str, ast.Name]]:
+    """
+    Reads of names that no scope binds and that are not builtins
+
+    Programs with a star import are skipped, since any name may come from it.
+
+    Returns:
+        (name, node) per read, in source order
+    """
+    if any(scope.star_import for scope in context.scopes):
+        return []
+    found = [
+        (name, node)
+        for scope in context.scopes
+        for name, node in scope.loads
+        if not scope.resolves(name)
+    ]
+    found.sort(key=lambda item: (item[1].lineno, item[1].col_offset))
+    return found
@@ -0,0 +1,230 @@
+"""
+Code Analysis for LearnFlow
+Parse-once view of a submission, shared by every agent that looks at it
+
+A CodeAnalysis bundles a program's source, its line index, its AST (or the
+SyntaxError), its tokens and facts derived from the tree, and memoizes the
+findings of each AnalysisEngine run over it. The AI service builds one per
+request with get_code_analysis() and hands it to the agents in their
+context, so reviewing, debugging and evaluating a submission parse it once.
+
+Analyses are memoized by a hash of the source in a bounded LRU, so the
+common review -> debug -> evaluate cycle on the same code, and students
+resubmitting unchanged code, skip parsing and static analysis entirely.
+"""
+import ast
+import hashlib
+import io
+import re
+import tokenize
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from .analysis import AnalysisEngine
+
+CODE_BLOCK = re.compile(r'```(?:python)?\n?(.*?)```', re.DOTALL)
+PYTHON_INDICATORS = ('def ', 'import ', 'class ', '=', 'if ', 'for ', 'while ', 'print(')
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_SOURCE_BYTES = 8 * 1024 * 1024
+
+
+def extract_code(user_input: str) -> str:
+    """
+    Extract Python code from a chat message
+
+    Returns:
+        The first fenced code block, the whole message if it is several lines
+        that look like Python, or "" if there is no code
+    """
+    match = CODE_BLOCK.search(user_input)
+    if match:
+        return match.group(1).strip()
+
+    # If no backticks, check if the entire input looks like code
+    lines = user_input.strip().split('\n')
+    if len(lines) > 1 and any(indicator in user_input for indicator in PYTHON_INDICATORS):
+        return user_input
+    return ""
+
+
+def source_key(code: str) -> bytes:
+    return hashlib.blake2b(code.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+class CodeAnalysis:
+    """A program parsed once, with what the agents derive from it"""
+
+    def __init__(self, source: str, key: Optional[bytes] = None):
+        self.source = source
+        self.key = key or source_key(source)
+        self.lines = source.split("\n")
+        self.syntax_error: Optional[SyntaxError] = None
+        self.tree: Optional[ast.Module] = None
+        try:
+            self.tree = ast.parse(source)
+        except (SyntaxError, ValueError) as e:
+            # ValueError: null bytes in the source
+            self.syntax_error = e if isinstance(e, SyntaxError) else SyntaxError(str(e))
+        self._tokens: Optional[List[tokenize.TokenInfo]] = None
+        self._facts: Optional[Dict[str, bool]] = None
+        # (engine, disabled rules) -> issues
+        self._findings: Dict[Tuple[AnalysisEngine, FrozenSet[str]], List[Dict[str, Any]]] = {}
+
+    def line(self, lineno: Optional[int]) -> str:
+        """Source line by 1-based number, or "" when out of range"""
+        if lineno and 0 < lineno <= len(self.lines):
+            return self.lines[lineno - 1]
+        return ""
+
+    @property
+    def tokens(self) -> List[tokenize.TokenInfo]:
+        """The program's tokens (as far as it tokenizes)"""
+        if self._tokens is None:
+            tokens = []
+            try:
+                for token in tokenize.generate_tokens(io.StringIO(self.source).readline):
+                    tokens.append(token)
+            except (tokenize.TokenError, SyntaxError):
+                pass
+            self._tokens = tokens
+        return self._tokens
+
+    @property
+    def facts(self) -> Dict[str, bool]:
+        """Which constructs the program uses, from one walk of its tree"""
+        if self._facts is None:
+            facts = dict.fromkeys(("calls_print", "defines_function", "defines_class", "has_condition",
+                                   "has_loop", "has_import"), False)
+            if self.tree is not None:
+                for node in ast.walk(self.tree):
+                    node_type = type(node)
+                    if node_type is ast.Call:
+                        if isinstance(node.func, ast.Name) and node.func.id == "print":
+                            facts["calls_print"] = True
+                    elif node_type in (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda):
+                        facts["defines_function"] = True
+                    elif node_type is ast.ClassDef:
+                        facts["defines_class"] = True
+                    elif node_type in (ast.If, ast.IfExp, ast.Match):
+                        facts["has_condition"] = True
+                    elif node_type in (ast.For, ast.AsyncFor, ast.While, ast.comprehension):
+                        facts["has_loop"] = True
+                    elif node_type in (ast.Import, ast.ImportFrom):
+                        facts["has_import"] = True
+            self._facts = facts
+        return self._facts
+
+    def findings(self, engine: AnalysisEngine, disabled: Iterable[str] = (),
+                 compute: Optional[Callable[["CodeAnalysis", FrozenSet[str]], List[Dict[str, Any]]]] = None
+                 ) -> List[Dict[str, Any]]:
+        """
+        Issues an engine finds in the program, computed once per engine and rule selection
+
+        Args:
+            engine: Engine to run
+            disabled: Names of rules to skip
+            compute: Computes the issues instead of running the engine over
+                the whole tree, e.g. IncrementalAnalyzer.findings
+
+        Returns:
+            A new list of the issues ([] if the program does not parse)
+        """
+        if self.tree is None:
+            return []
+        key = (engine, frozenset(disabled))
+        issues = self._findings.get(key)
+        if issues is None:
+            if compute is not None:
+                issues = compute(self, key[1])
+            else:
+                issues = engine.analyze(self.tree, self.source, disabled=key[1], lines=self.lines).issues
+            self._findings[key] = issues
+        return list(issues)
+
+
+class CodeAnalysisCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_source_bytes: int = DEFAULT_MAX_SOURCE_BYTES):
+        """
+        Args:
+            max_entries: Analyses kept; 0 disables the cache
+            max_source_bytes: Source characters kept over all entries (their
+                trees take several times as much)
+        """
+        self.max_entries = max_entries
+        self.max_source_bytes = max_source_bytes
+        self._entries: "OrderedDict[bytes, CodeAnalysis]" = OrderedDict()
+        self._source_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, code: str) -> CodeAnalysis:
+        """
+        The analysis of a program, built on first use
+
+        Args:
+            code: Program source
+
+        Returns:
+            CodeAnalysis shared by everyone asking for the same source
+        """
+        key = source_key(code)
+        analysis = self._entries.get(key)
+        if analysis is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return analysis
+
+        self.misses += 1
+        analysis = CodeAnalysis(code, key)
+        if self.max_entries > 0 and len(code) <= self.max_source_bytes:
+            self._entries[key] = analysis
+            self._source_bytes += len(code)
+            while len(self._entries) > self.max_entries or self._source_bytes > self.max_source_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._source_bytes -= len(evicted.source)
+        return analysis
+
+    def clear(self):
+        self._entries.clear()
+        self._source_bytes = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "source_bytes": self._source_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+
+# Global analysis cache
+analysis_cache = CodeAnalysisCache()
+
+
+def get_code_analysis(code: str) -> CodeAnalysis:
+    """
+    Convenience function to get a program's analysis from the global cache
+
+    Args:
+        code: Program source
+
+    Returns:
+        CodeAnalysis for the program
+    """
+    return analysis_cache.get(code)
+
+
+def request_analysis(user_input: str, context: Optional[Dict[str, Any]] = None) -> Optional[CodeAnalysis]:
+    """
+    The analysis an agent request is about
+
+    Args:
+        user_input: The chat message
+        context: Request context; its "analysis", if any, is used as is
+
+    Returns:
+        The context's analysis, else that of the code in the message, or None
+        if the message has no code
+    """
+    analysis = (context or {}).get("analysis")
+    if analysis is not None:
+        return analysis
+    code = extract_code(user_input)
+    return get_code_analysis(code) if code else None
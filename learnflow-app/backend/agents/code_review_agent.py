@@ -5,25 +5,169 @@ Reviews Python code and suggests improvements
 
 import ast
 import re
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, List, Optional
 import asyncio
 
+from .analysis import AnalysisContext, AnalysisEngine
+from .code_analysis import CodeAnalysis, request_analysis
+from .incremental import IncrementalAnalyzer
+
+SNAKE_CASE = re.compile(r'^_*[a-z][a-z0-9_]*$')
+UPPER_CASE = re.compile(r'^_*[A-Z][A-Z0-9_]*$')
+PASCAL_CASE = re.compile(r'^_*[A-Z][a-zA-Z0-9]*$')
+DUNDER = re.compile(r'^__[a-z][a-z0-9_]*__$')
+CREDENTIAL_NAME = re.compile(r'password|passwd|secret|token|api_?key|private_?key', re.IGNORECASE)
+DEBUG_TEXT = re.compile(r'debug|temp|test', re.IGNORECASE)
+
+# Numbers common enough not to need a name
+COMMON_NUMBERS = frozenset({0, 1, 2, 10, 100, 1000})
+
+# Issue types reported as suggestions rather than issues
+SUGGESTION_TYPES = frozenset({"improvement", "cleanup"})
+
+
+def _check_variable_name(node: ast.Name, context: AnalysisContext):
+    if not isinstance(node.ctx, ast.Store) or node.id == "_" or SNAKE_CASE.match(node.id):
+        return
+    # Module-level UPPER_CASE names are constants
+    if context.scope.kind == "module" and UPPER_CASE.match(node.id):
+        return
+    context.report(
+        node, f"Variable '{node.id}' doesn't follow Python naming conventions. Use snake_case for variables.",
+        issue_type="naming_convention"
+    )
+
+
+def _check_function_name(node: ast.FunctionDef, context: AnalysisContext):
+    if not SNAKE_CASE.match(node.name) and not DUNDER.match(node.name):
+        context.report(
+            node, f"Function '{node.name}' doesn't follow Python naming conventions. Use snake_case for functions.",
+            issue_type="naming_convention"
+        )
+
+
+def _check_class_name(node: ast.ClassDef, context: AnalysisContext):
+    if not PASCAL_CASE.match(node.name):
+        context.report(
+            node, f"Class '{node.name}' doesn't follow Python naming conventions. Use PascalCase for classes.",
+            issue_type="naming_convention"
+        )
+
+
+def _check_bare_except(node: ast.ExceptHandler, context: AnalysisContext):
+    if node.type is None:
+        context.report(
+            node, "Avoid bare except clauses. Use 'except Exception:' instead of bare 'except:'.",
+            severity="high", issue_type="best_practice"
+        )
+
+
+def _check_hardcoded_credential(node: ast.Assign, context: AnalysisContext):
+    if not (isinstance(node.value, ast.Constant) and isinstance(node.value.value, str) and node.value.value):
+        return
+    for target in node.targets:
+        if isinstance(target, ast.Name) and CREDENTIAL_NAME.search(target.id):
+            context.report(
+                node, f"Avoid hardcoding sensitive information like '{target.id}'. Use environment variables instead.",
+                severity="high", issue_type="security"
+            )
+
+
+def _check_magic_number(node: ast.Constant, context: AnalysisContext):
+    value = node.value
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value not in COMMON_NUMBERS:
+        context.report(
+            node, f"Consider defining the number {value} as a named constant for better readability.",
+            severity="low", issue_type="improvement"
+        )
+
+
+def _check_debug_print(node: ast.Call, context: AnalysisContext):
+    if (isinstance(node.func, ast.Name) and node.func.id == 'print' and node.args and
+            isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str) and
+            DEBUG_TEXT.search(node.args[0].value)):
+        context.report(
+            node, "Remove debugging print statements before production.", issue_type="cleanup"
+        )
+
+
+def review_engine(timed: bool = True) -> AnalysisEngine:
+    """The review rules, compiled into one traversal"""
+    return AnalysisEngine(rules=[
+        ("variable-naming", ast.Name, _check_variable_name),
+        ("function-naming", (ast.FunctionDef, ast.AsyncFunctionDef), _check_function_name),
+        ("class-naming", ast.ClassDef, _check_class_name),
+        ("bare-except", ast.ExceptHandler, _check_bare_except),
+        ("hardcoded-credential", ast.Assign, _check_hardcoded_credential),
+        ("magic-number", ast.Constant, _check_magic_number),
+        ("debug-print", ast.Call, _check_debug_print),
+    ], timed=timed)
+
+
+# Course -> rules its reviews run: {"enable": [...]} runs only those,
+# {"disable": [...]} runs all but those; other courses run every rule
+COURSE_PROFILES: Dict[str, Dict[str, List[str]]] = {
+    # First programs are full of literal numbers and throwaway prints
+    "python-basics": {"disable": ["magic-number", "debug-print"]},
+}
+
 class CodeReviewAgent:
-    def __init__(self):
+    def __init__(self, profiles: Optional[Dict[str, Dict[str, List[str]]]] = None, incremental: bool = True):
+        """
+        Args:
+            profiles: Per-course rule selection (defaults to COURSE_PROFILES)
+            incremental: Reuse the findings of top-level functions, classes
+                and statements reviewed before, so an edited resubmission
+                only re-reviews what changed (see incremental.py)
+        """
         self.name = "Code Review Agent"
         self.description = "Reviews Python code and suggests improvements"
+        self.engine = review_engine()
+        self.incremental = IncrementalAnalyzer(self.engine) if incremental else None
+        # course -> disabled rule names
+        self._disabled: Dict[str, frozenset] = {}
+        for course, profile in (COURSE_PROFILES if profiles is None else profiles).items():
+            self.set_course_profile(course, enable=profile.get("enable"), disable=profile.get("disable"))
+
+    def set_course_profile(self, course: str, enable: Optional[Iterable[str]] = None,
+                           disable: Optional[Iterable[str]] = None):
+        """
+        Choose the rules reviews for a course run
+
+        Args:
+            course: Course id, as passed in the review context
+            enable: Run only these rules
+            disable: Run every rule but these
+
+        Raises:
+            ValueError: If a rule name is unknown
+        """
+        names = set(self.engine.rule_names)
+        selected = set(enable if enable is not None else names) - set(disable or ())
+        unknown = (set(enable or ()) | set(disable or ())) - names
+        if unknown:
+            raise ValueError(f"Unknown review rules: {', '.join(sorted(unknown))}")
+        self._disabled[course] = frozenset(names - selected)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Calls and time spent per review rule, and reuse of incremental reviews"""
+        return {
+            "rules": self.engine.get_stats(),
+            "profiles": {course: sorted(disabled) for course, disabled in self._disabled.items()},
+            "incremental": self.incremental.get_stats() if self.incremental is not None else None,
+        }
 
     async def process(self, user_input: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Process user's code for review"""
-        # Extract code from user input if present
-        code_snippet = await self._extract_code(user_input)
+        # The code from the context's analysis or the message, parsed once
+        analysis = request_analysis(user_input, context)
 
-        if code_snippet:
-            review_results = await self._review_code(code_snippet)
+        if analysis is not None:
+            review_results = await self._review_code(analysis, (context or {}).get("course"))
 
             response = {
                 "agent": "code_review",
-                "original_code": code_snippet,
+                "original_code": analysis.source,
                 "review": review_results,
                 "suggestions": review_results.get("suggestions", []),
                 "issues_found": len(review_results.get("issues", [])),
@@ -39,36 +183,13 @@ class CodeReviewAgent:
 
         return response
 
-    async def _extract_code(self, user_input: str) -> str:
-        """Extract Python code from user input"""
-        # Look for code in triple backticks
-        code_pattern = r'```(?:python)?\n?(.*?)```'
-        matches = re.findall(code_pattern, user_input, re.DOTALL)
-
-        if matches:
-            return matches[0].strip()
-
-        # If no backticks, check if the entire input looks like code
-        lines = user_input.strip().split('\n')
-        if len(lines) > 1:
-            # Simple heuristic: if multiple lines with Python-like syntax
-            python_indicators = ['def ', 'import ', 'class ', '=', 'if ', 'for ', 'while ', 'print(']
-            indicators_found = sum(1 for indicator in python_indicators if any(indicator in line for line in lines))
-
-            if indicators_found > 0:
-                return user_input
-
-        return ""
-
-    async def _review_code(self, code: str) -> Dict[str, Any]:
+    async def _review_code(self, analysis: CodeAnalysis, course: Optional[str] = None) -> Dict[str, Any]:
         """Perform code review on the provided code"""
         issues = []
         suggestions = []
 
-        try:
-            # Parse the code to check for syntax errors
-            tree = ast.parse(code)
-        except SyntaxError as e:
+        if analysis.syntax_error is not None:
+            e = analysis.syntax_error
             issues.append({
                 "type": "syntax_error",
                 "severity": "high",
@@ -77,134 +198,15 @@ class CodeReviewAgent:
             })
             return {"issues": issues, "suggestions": suggestions}
 
-        # Perform various checks
-        issues.extend(self._check_naming_conventions(tree, code))
-        issues.extend(self._check_for_common_issues(tree, code))
-        suggestions.extend(self._suggest_improvements(tree, code))
+        # Every enabled rule runs in one traversal, once per analysis and course profile,
+        # over the units that changed since they were last reviewed
+        compute = self.incremental.findings if self.incremental is not None else None
+        found = analysis.findings(self.engine, self._disabled.get(course, ()), compute=compute)
+        for finding in found:
+            (suggestions if finding["type"] in SUGGESTION_TYPES else issues).append(finding)
 
         return {"issues": issues, "suggestions": suggestions}
 
-    def _check_naming_conventions(self, tree: ast.AST, code: str) -> List[Dict[str, Any]]:
-        """Check for Python naming convention issues"""
-        issues = []
-        lines = code.split('\n')
-
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
-                # Variable assignment
-                if not self._is_valid_variable_name(node.id):
-                    issues.append({
-                        "type": "naming_convention",
-                        "severity": "medium",
-                        "line": node.lineno,
-                        "message": f"Variable '{node.id}' doesn't follow Python naming conventions. Use snake_case for variables."
-                    })
-            elif isinstance(node, ast.FunctionDef):
-                # Function definition
-                if not self._is_valid_function_name(node.name):
-                    issues.append({
-                        "type": "naming_convention",
-                        "severity": "medium",
-                        "line": node.lineno,
-                        "message": f"Function '{node.name}' doesn't follow Python naming conventions. Use snake_case for functions."
-                    })
-            elif isinstance(node, ast.ClassDef):
-                # Class definition
-                if not self._is_valid_class_name(node.name):
-                    issues.append({
-                        "type": "naming_convention",
-                        "severity": "medium",
-                        "line": node.lineno,
-                        "message": f"Class '{node.name}' doesn't follow Python naming conventions. Use PascalCase for classes."
-                    })
-
-        return issues
-
-    def _is_valid_variable_name(self, name: str) -> bool:
-        """Check if variable name follows snake_case convention"""
-        import re
-        return bool(re.match(r'^[a-z][a-z0-9_]*$', name))
-
-    def _is_valid_function_name(self, name: str) -> bool:
-        """Check if function name follows snake_case convention"""
-        return self._is_valid_variable_name(name)
-
-    def _is_valid_class_name(self, name: str) -> bool:
-        """Check if class name follows PascalCase convention"""
-        import re
-        return bool(re.match(r'^[A-Z][a-zA-Z0-9]*$', name))
-
-    def _check_for_common_issues(self, tree: ast.AST, code: str) -> List[Dict[str, Any]]:
-        """Check for common Python issues"""
-        issues = []
-        lines = code.split('\n')
-
-        for node in ast.walk(tree):
-            # Check for bare except clauses
-            if isinstance(node, ast.ExceptHandler) and node.type is None:
-                issues.append({
-                    "type": "best_practice",
-                    "severity": "high",
-                    "line": node.lineno,
-                    "message": "Avoid bare except clauses. Use 'except Exception:' instead of bare 'except:'."
-                })
-
-            # Check for hardcoded passwords/credentials
-            if isinstance(node, ast.Assign):
-                for target in node.targets:
-                    if isinstance(target, ast.Name) and hasattr(node, 'value') and isinstance(node.value, ast.Constant):
-                        if isinstance(node.value.value, str):
-                            lower_val = node.value.value.lower()
-                            if any(cred_word in lower_val for cred_word in ['password', 'secret', 'token', 'key']):
-                                issues.append({
-                                    "type": "security",
-                                    "severity": "high",
-                                    "line": node.lineno,
-                                    "message": f"Avoid hardcoding sensitive information like '{target.id}'. Use environment variables instead."
-                                })
-
-        return issues
-
-    def _suggest_improvements(self, tree: ast.AST, code: str) -> List[Dict[str, Any]]:
-        """Suggest code improvements"""
-        suggestions = []
-        lines = code.split('\n')
-
-        # Check for magic numbers
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
-                # Skip common constants
-                if node.value in [0, 1, 2, 10, 100, 1000]:
-                    continue
-
-                suggestions.append({
-                    "type": "improvement",
-                    "severity": "low",
-                    "line": node.lineno,
-                    "message": f"Consider defining the number {node.value} as a named constant for better readability."
-                })
-
-        # Check for print statements that might be debugging
-        for node in ast.walk(tree):
-            if (isinstance(node, ast.Call) and
-                isinstance(node.func, ast.Name) and
-                node.func.id == 'print'):
-
-                # Check if it's likely a debugging print
-                if len(node.args) > 0 and isinstance(node.args[0], ast.Constant):
-                    arg_value = node.args[0].value
-                    if isinstance(arg_value, str) and ('debug' in arg_value.lower() or
-                                                      'temp' in arg_value.lower() or
-                                                      'test' in arg_value.lower()):
-                        suggestions.append({
-                            "type": "cleanup",
-                            "severity": "medium",
-                            "line": node.lineno,
-                            "message": "Remove debugging print statements before production."
-                        })
-
-        return suggestions
-
     def provide_best_practices_advice(self) -> List[str]:
         """Provide general Python best practices advice"""
         return [
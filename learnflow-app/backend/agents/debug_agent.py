@@ -4,31 +4,89 @@ Helps students debug their Python code
 """
 
 import ast
-import traceback
 import re
-from typing import Dict, Any, List
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 import asyncio
-import sys
-from io import StringIO
-from contextlib import redirect_stdout, redirect_stderr
+
+from .analysis import AnalysisContext, AnalysisEngine, undefined_names
+from .code_analysis import CodeAnalysis, request_analysis
+
+# Runs a program for a user in the sandbox and returns the executor's result
+Runner = Callable[[str, str], Awaitable[Dict[str, Any]]]
+
+# The exception line that ends a traceback, e.g. "ZeroDivisionError: division by zero"
+EXCEPTION_LINE = re.compile(r'^([A-Za-z_][\w.]*)(?::\s?(.*))?$')
+
+# What a run stopped by a sandbox limit is reported as
+LIMIT_ERRORS = {
+    "timeout": ("TimeoutError", "The code did not finish within the time limit"),
+    "cpu": ("TimeoutError", "The code used more CPU time than allowed"),
+    "memory": ("MemoryError", "The code used more memory than allowed"),
+    "output": ("OutputLimitExceeded", "The code printed more output than allowed"),
+}
+
+
+def _check_division_by_zero(node: ast.BinOp, context: AnalysisContext):
+    # `"%d" % 0` is string formatting, not a modulo
+    is_formatting = isinstance(node.left, (ast.Constant, ast.JoinedStr)) and isinstance(
+        getattr(node.left, "value", ""), (str, bytes))
+    if (isinstance(node.op, (ast.Div, ast.FloorDiv, ast.Mod)) and not is_formatting and
+            isinstance(node.right, ast.Constant) and
+            not isinstance(node.right.value, (str, bytes, bool)) and
+            node.right.value == 0):
+        context.report(node, "Potential division by zero detected", severity="high")
+
+
+def _check_loop_variable_reassignment(node: ast.Name, context: AnalysisContext):
+    if isinstance(node.ctx, ast.Store) and context.scope.loop_binding(node.id) is not None:
+        context.report(
+            node, f"Modifying loop variable '{node.id}' inside for loop may cause unexpected behavior"
+        )
+
+
+def _check_undefined_names(context: AnalysisContext):
+    reported = set()
+    for name, node in undefined_names(context):
+        # One issue per name is enough to point the student at it
+        if name not in reported:
+            reported.add(name)
+            context.report(node, f"Name '{name}' is used but never defined", severity="high")
+
+
+# Static checks, run in one pass over the program (see analysis.py)
+STATIC_ANALYSIS = AnalysisEngine(
+    rules=[
+        ("division-by-zero", ast.BinOp, _check_division_by_zero),
+        ("loop-variable-reassignment", ast.Name, _check_loop_variable_reassignment),
+    ],
+    finalizers=[("undefined-name", _check_undefined_names)],
+)
 
 class DebugAgent:
-    def __init__(self):
+    def __init__(self, runner: Optional[Runner] = None):
+        """
+        Args:
+            runner: Runs the code in the sandbox to find runtime errors (see
+                services/code_execution/code_executor.py); without one, code
+                is only analyzed statically
+        """
         self.name = "Debug Agent"
         self.description = "Helps students debug their Python code"
+        self.runner = runner
 
     async def process(self, user_input: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Process user's debugging request"""
-        # Extract code and error from user input
-        code_snippet = await self._extract_code(user_input)
+        # The code from the context's analysis or the message, parsed once
+        analysis = request_analysis(user_input, context)
         error_message = await self._extract_error(user_input)
 
-        if code_snippet:
-            debug_result = await self._debug_code(code_snippet, error_message)
+        if analysis is not None:
+            user_id = (context or {}).get("user_id", "anonymous")
+            debug_result = await self._debug_code(analysis, error_message, user_id)
 
             response = {
                 "agent": "debug",
-                "original_code": code_snippet,
+                "original_code": analysis.source,
                 "debug_analysis": debug_result,
                 "suggested_fixes": debug_result.get("suggested_fixes", []),
                 "error_type": debug_result.get("error_type", "unknown"),
@@ -44,27 +102,6 @@ class DebugAgent:
 
         return response
 
-    async def _extract_code(self, user_input: str) -> str:
-        """Extract Python code from user input"""
-        # Look for code in triple backticks
-        code_pattern = r'```(?:python)?\n?(.*?)```'
-        matches = re.findall(code_pattern, user_input, re.DOTALL)
-
-        if matches:
-            return matches[0].strip()
-
-        # If no backticks, check if the entire input looks like code
-        lines = user_input.strip().split('\n')
-        if len(lines) > 1:
-            # Simple heuristic: if multiple lines with Python-like syntax
-            python_indicators = ['def ', 'import ', 'class ', '=', 'if ', 'for ', 'while ', 'print(']
-            indicators_found = sum(1 for indicator in python_indicators if any(indicator in line for line in lines))
-
-            if indicators_found > 0:
-                return user_input
-
-        return ""
-
     async def _extract_error(self, user_input: str) -> str:
         """Extract error message from user input"""
         # Look for common error patterns
@@ -81,33 +118,36 @@ class DebugAgent:
 
         return ""
 
-    async def _debug_code(self, code: str, error_msg: str = "") -> Dict[str, Any]:
+    async def _debug_code(self, analysis: CodeAnalysis, error_msg: str = "",
+                          user_id: str = "anonymous") -> Dict[str, Any]:
         """Analyze and debug the provided code"""
         issues = []
         suggested_fixes = []
+        code = analysis.source
 
         # First, check for syntax errors
-        try:
-            tree = ast.parse(code)
-        except SyntaxError as e:
+        if analysis.syntax_error is not None:
+            e = analysis.syntax_error
             issues.append({
                 "type": "syntax_error",
                 "severity": "critical",
                 "line": e.lineno or 0,
                 "column": e.offset or 0,
                 "message": f"SyntaxError: {str(e.msg)}",
-                "code_line": code.split('\n')[e.lineno - 1] if e.lineno and e.lineno <= len(code.split('\n')) else ""
+                "code_line": analysis.line(e.lineno)
             })
-            suggested_fixes.extend(self._suggest_syntax_fixes(str(e.msg), code, e.lineno))
+            suggested_fixes.extend(self._suggest_syntax_fixes(str(e.msg), analysis, e.lineno))
             return {
                 "issues": issues,
                 "suggested_fixes": suggested_fixes,
                 "error_type": "syntax_error"
             }
 
-        # If no syntax errors, try to run the code safely
+        # If no syntax errors, run the code in the sandbox
+        execution_note = None
         if not issues:
-            execution_result = await self._safe_execute_code(code)
+            execution_result = await self._safe_execute_code(code, user_id)
+            execution_note = execution_result.get("note")
             if execution_result["has_error"]:
                 issues.append({
                     "type": "runtime_error",
@@ -119,8 +159,7 @@ class DebugAgent:
                 suggested_fixes.extend(self._analyze_runtime_error(execution_result["error_type"], execution_result["error_message"], code))
 
         # Perform static analysis for common bugs
-        static_issues = self._static_analysis(tree, code)
-        issues.extend(static_issues)
+        issues.extend(self._static_analysis(analysis))
 
         error_type = "none"
         if any(issue["type"] == "syntax_error" for issue in issues):
@@ -130,13 +169,16 @@ class DebugAgent:
         elif issues:
             error_type = "logical_error"
 
-        return {
+        result = {
             "issues": issues,
             "suggested_fixes": suggested_fixes,
             "error_type": error_type
         }
+        if execution_note:
+            result["execution_note"] = execution_note
+        return result
 
-    def _suggest_syntax_fixes(self, error_msg: str, code: str, line_no: int = None) -> List[str]:
+    def _suggest_syntax_fixes(self, error_msg: str, analysis: CodeAnalysis, line_no: int = None) -> List[str]:
         """Suggest fixes for syntax errors"""
         fixes = []
 
@@ -149,8 +191,8 @@ class DebugAgent:
         if "EOL while scanning string literal" in error_msg.lower():
             fixes.append("Check for unclosed quotes in strings.")
 
-        if line_no and line_no <= len(code.split('\n')):
-            line = code.split('\n')[line_no - 1]
+        if line_no and line_no <= len(analysis.lines):
+            line = analysis.line(line_no)
             if line.count('(') != line.count(')'):
                 fixes.append("Check for mismatched parentheses.")
             if line.count('[') != line.count(']'):
@@ -160,94 +202,71 @@ class DebugAgent:
 
         return fixes
 
-    def _static_analysis(self, tree: ast.AST, code: str) -> List[Dict[str, Any]]:
+    def _static_analysis(self, analysis: CodeAnalysis) -> List[Dict[str, Any]]:
         """Perform static analysis to find potential bugs"""
-        issues = []
-        lines = code.split('\n')
-
-        for node in ast.walk(tree):
-            # Check for undefined variables
-            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
-                # This is a simplification - in a real system, we'd need proper scoping analysis
-                pass
-
-            # Check for potential division by zero
-            if (isinstance(node, ast.BinOp) and
-                isinstance(node.op, ast.Div) and
-                isinstance(node.right, ast.Constant) and
-                node.right.value == 0):
-                issues.append({
-                    "type": "potential_bug",
-                    "severity": "high",
-                    "line": node.lineno,
-                    "message": "Potential division by zero detected",
-                    "code_line": lines[node.lineno - 1] if node.lineno <= len(lines) else ""
-                })
+        return analysis.findings(STATIC_ANALYSIS)
 
-            # Check for modifying loop variable inside for loop
-            if isinstance(node, ast.For):
-                for inner_node in ast.walk(node):
-                    if (isinstance(inner_node, ast.Name) and
-                        isinstance(inner_node.ctx, ast.Store) and
-                        isinstance(inner_node.id, str) and
-                        inner_node.id == node.target.id):
-                        issues.append({
-                            "type": "potential_bug",
-                            "severity": "medium",
-                            "line": inner_node.lineno,
-                            "message": f"Modifying loop variable '{inner_node.id}' inside for loop may cause unexpected behavior",
-                            "code_line": lines[inner_node.lineno - 1] if inner_node.lineno <= len(lines) else ""
-                        })
-
-        return issues
-
-    async def _safe_execute_code(self, code: str) -> Dict[str, Any]:
-        """Safely execute code and capture any runtime errors"""
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
-        stdout_capture = StringIO()
-        stderr_capture = StringIO()
-
-        try:
-            # Redirect stdout and stderr to capture output
-            sys.stdout = stdout_capture
-            sys.stderr = stderr_capture
+    async def _safe_execute_code(self, code: str, user_id: str = "anonymous") -> Dict[str, Any]:
+        """
+        Run code in the sandbox and capture any runtime error
 
-            # Execute the code
-            local_vars = {}
-            exec(code, {}, local_vars)
+        The run gets the executor's timeout, resource limits and output caps
+        and is queued fairly with everyone else's runs, so a program that
+        never ends only costs its own time slot.
+        """
+        if self.runner is None:
+            return {"has_error": False, "note": "The code was not run; only static checks were done"}
 
-            # Restore stdout and stderr
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
+        try:
+            result = await self.runner(code, user_id)
+        except Exception as e:
+            # Blocked by the safety checks, or no capacity to run it right now
+            return {"has_error": False, "note": f"The code was not run: {str(e)}"}
 
+        if result.get("status") == "success":
             return {
                 "has_error": False,
-                "output": stdout_capture.getvalue(),
-                "errors": stderr_capture.getvalue(),
-                "local_vars": local_vars
+                "output": result.get("output", ""),
+                "errors": result.get("errors", "")
             }
-        except Exception as e:
-            # Restore stdout and stderr
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
 
-            # Capture the traceback
-            tb_str = traceback.format_exc()
+        errors = result.get("errors") or ""
+        if result.get("limit_exceeded") in LIMIT_ERRORS:
+            error_type, error_message = LIMIT_ERRORS[result["limit_exceeded"]]
+        else:
+            error_type, error_message = self._parse_exception(errors, result.get("return_code"))
 
-            return {
-                "has_error": True,
-                "error_type": type(e).__name__,
-                "error_message": str(e),
-                "traceback": tb_str
-            }
+        return {
+            "has_error": True,
+            "error_type": error_type,
+            "error_message": error_message,
+            "traceback": errors,
+            "output": result.get("output", "")
+        }
+
+    @staticmethod
+    def _parse_exception(errors: str, return_code: Optional[int]) -> tuple:
+        """Exception type and message from the last line of a traceback"""
+        lines = [line for line in errors.strip().splitlines() if line.strip()]
+        if lines:
+            match = EXCEPTION_LINE.match(lines[-1])
+            if match:
+                return match.group(1).rsplit(".", 1)[-1], match.group(2) or ""
+            return "Exception", lines[-1]
+        return "SystemExit", f"The program exited with code {return_code}"
+
+    @staticmethod
+    def _quoted_name(error_msg: str, default: str) -> str:
+        """The last quoted name in an error message, e.g. 'x' in: name 'x' is not defined"""
+        names = re.findall(r'[\'"]([^\'"]+)[\'"]', error_msg)
+        return names[-1] if names else default
 
     def _analyze_runtime_error(self, error_type: str, error_msg: str, code: str) -> List[str]:
         """Analyze runtime errors and suggest fixes"""
         fixes = []
 
         if error_type == "NameError":
-            fixes.append(f"Check if '{error_msg.split('\"')[1] if '\"' in error_msg else 'the variable'}' is defined before use.")
+            fixes.append(f"Check if '{self._quoted_name(error_msg, 'the variable')}' is defined before use.")
 
         elif error_type == "TypeError":
             fixes.append("Check if you're using the correct data types for operations.")
@@ -262,7 +281,7 @@ class DebugAgent:
             fixes.append("Use .get() method or 'in' operator to check for key existence.")
 
         elif error_type == "AttributeError":
-            fixes.append(f"Check if the object has the attribute '{error_msg.split('\"')[1] if '\"' in error_msg else 'mentioned'}'.")
+            fixes.append(f"Check if the object has the attribute '{self._quoted_name(error_msg, 'mentioned')}'.")
             fixes.append("Verify you're calling the correct method or accessing the correct property.")
 
         elif error_type == "ValueError":
@@ -271,4 +290,17 @@ class DebugAgent:
         elif error_type == "ZeroDivisionError":
             fixes.append("Add a check to ensure the divisor is not zero before division.")
 
+        elif error_type == "EOFError":
+            fixes.append("Your code calls input(), but debug runs get no input. Try it with a fixed value instead.")
+
+        elif error_type in ("TimeoutError", "RecursionError"):
+            fixes.append("Check that every loop ends: the loop condition must eventually become false.")
+            fixes.append("Check that recursive functions have a base case that is always reached.")
+
+        elif error_type == "MemoryError":
+            fixes.append("Check for lists or strings that keep growing, e.g. inside an endless loop.")
+
+        elif error_type == "OutputLimitExceeded":
+            fixes.append("Check for a loop that keeps printing without ever ending.")
+
         return fixes
\ No newline at end of file
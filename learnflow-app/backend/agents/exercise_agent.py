@@ -4,27 +4,41 @@ Generates Python programming exercises and evaluates solutions
 """
 
 import random
-import re
-from typing import Dict, Any, List
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 import asyncio
 
+from .code_analysis import CodeAnalysis, get_code_analysis, request_analysis
+
+# Runs a solution against test cases for a user and returns a grading report
+Grader = Callable[[str, List[Dict[str, Any]], str], Awaitable[Dict[str, Any]]]
+
 class ExerciseAgent:
-    def __init__(self):
+    def __init__(self, grader: Optional[Grader] = None):
+        """
+        Args:
+            grader: Runs a solution against an exercise's test_cases (see
+                services/code_execution/grading.py); without one, solutions
+                only get feedback on their structure
+        """
         self.name = "Exercise Agent"
         self.description = "Generates Python programming exercises and evaluates solutions"
+        self.grader = grader
 
         # Define different exercise categories and templates
         self.exercises = {
             "basics": [
                 {
+                    "id": "basics-print",
                     "title": "Print Statement",
                     "difficulty": "beginner",
                     "description": "Create a program that prints 'Hello, World!'",
                     "solution": "print('Hello, World!')",
                     "hints": ["Use the print() function", "Don't forget quotes around the string"],
+                    "test_cases": [{"expected_output": "Hello, World!"}],
                     "category": "basics"
                 },
                 {
+                    "id": "basics-variables",
                     "title": "Variable Assignment",
                     "difficulty": "beginner",
                     "description": "Create a variable called 'name' and assign it your name, then print it",
@@ -35,31 +49,45 @@ class ExerciseAgent:
             ],
             "conditionals": [
                 {
+                    "id": "conditionals-even-odd",
                     "title": "Even or Odd",
                     "difficulty": "beginner",
                     "description": "Write a program that takes a number and prints 'even' if it's even, 'odd' if it's odd",
                     "solution": "num = int(input('Enter a number: '))\nif num % 2 == 0:\n    print('even')\nelse:\n    print('odd')",
                     "hints": ["Use the modulo operator (%) to check divisibility", "Use an if/else statement"],
+                    "test_cases": [
+                        {"input": "4", "expected_output": "even"},
+                        {"input": "7", "expected_output": "odd"},
+                        {"input": "0", "expected_output": "even"},
+                        {"input": "-3", "expected_output": "odd"}
+                    ],
                     "category": "conditionals"
                 }
             ],
             "loops": [
                 {
+                    "id": "loops-sum",
                     "title": "Sum of Numbers",
                     "difficulty": "beginner",
                     "description": "Write a program that calculates the sum of numbers from 1 to 10 using a loop",
                     "solution": "total = 0\nfor i in range(1, 11):\n    total += i\nprint(total)",
                     "hints": ["Initialize a variable to store the sum", "Use a for loop with range()"],
+                    "test_cases": [{"expected_output": "55"}],
                     "category": "loops"
                 }
             ],
             "functions": [
                 {
+                    "id": "functions-greet",
                     "title": "Simple Function",
                     "difficulty": "beginner",
                     "description": "Write a function called 'greet' that takes a name and returns a greeting",
                     "solution": "def greet(name):\n    return f'Hello, {name}!'\n\nprint(greet('Alice'))",
                     "hints": ["Use the def keyword to define the function", "Return a formatted string"],
+                    "test_cases": [
+                        {"call": "greet", "args": ["Alice"], "expected": "Hello, Alice!"},
+                        {"call": "greet", "args": ["Bob"], "expected": "Hello, Bob!"}
+                    ],
                     "category": "functions"
                 }
             ]
@@ -70,11 +98,15 @@ class ExerciseAgent:
         user_input_lower = user_input.lower()
 
         # Check if user is submitting a solution
-        if any(word in user_input_lower for word in ['solution', 'answer', 'my code', 'i wrote']):
-            # Extract submitted code and evaluate
-            submitted_code = await self._extract_code(user_input)
-            if submitted_code:
-                evaluation = await self._evaluate_solution(submitted_code, context)
+        if (context or {}).get("solution") or any(word in user_input_lower for word in ['solution', 'answer', 'my code', 'i wrote']):
+            # The submitted code, parsed once
+            solution = (context or {}).get("solution")
+            if solution and "analysis" not in (context or {}):
+                analysis = get_code_analysis(solution)
+            else:
+                analysis = request_analysis(user_input, context)
+            if analysis is not None:
+                evaluation = await self._evaluate_solution(analysis, context)
                 return {
                     "agent": "exercise",
                     "type": "solution_evaluation",
@@ -99,27 +131,6 @@ class ExerciseAgent:
             "message": f"Here's an exercise for you: {exercise['title']}"
         }
 
-    async def _extract_code(self, user_input: str) -> str:
-        """Extract Python code from user input"""
-        # Look for code in triple backticks
-        code_pattern = r'```(?:python)?\n?(.*?)```'
-        matches = re.findall(code_pattern, user_input, re.DOTALL)
-
-        if matches:
-            return matches[0].strip()
-
-        # If no backticks, check if the entire input looks like code
-        lines = user_input.strip().split('\n')
-        if len(lines) > 1:
-            # Simple heuristic: if multiple lines with Python-like syntax
-            python_indicators = ['def ', 'import ', 'class ', '=', 'if ', 'for ', 'while ', 'print(']
-            indicators_found = sum(1 for indicator in python_indicators if any(indicator in line for line in lines))
-
-            if indicators_found > 0:
-                return user_input
-
-        return ""
-
     def _detect_difficulty(self, user_input: str) -> str:
         """Detect requested difficulty level"""
         user_input_lower = user_input.lower()
@@ -177,40 +188,42 @@ class ExerciseAgent:
 
         return None
 
-    async def _evaluate_solution(self, submitted_code: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
+    def get_exercise(self, exercise_id: str) -> Optional[Dict[str, Any]]:
+        """Get an exercise by its id"""
+        for category_exercises in self.exercises.values():
+            for exercise in category_exercises:
+                if exercise.get("id") == exercise_id:
+                    return exercise
+        return None
+
+    async def _evaluate_solution(self, analysis: CodeAnalysis, context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Evaluate the user's submitted solution"""
-        # This is a simplified evaluation - in a real system, we'd run tests
-        # against the submitted code to check correctness
+        submitted_code = analysis.source
+        exercise = self.get_exercise((context or {}).get("exercise_id"))
+        if self.grader is not None and exercise is not None and exercise.get("test_cases"):
+            return await self._grade_solution(submitted_code, exercise, context.get("user_id", "anonymous"))
 
-        # For now, just provide feedback on code structure and execution
+        # Without test cases, just provide feedback on code structure
         feedback_points = []
 
         # Check for basic Python syntax
-        try:
-            import ast
-            ast.parse(submitted_code)
-            feedback_points.append("✓ Code has valid Python syntax")
-        except SyntaxError as e:
+        if analysis.syntax_error is not None:
             return {
                 "is_correct": False,
-                "feedback": f"✗ Syntax error: {str(e)}",
+                "feedback": f"✗ Syntax error: {str(analysis.syntax_error)}",
                 "score": 0
             }
+        feedback_points.append("✓ Code has valid Python syntax")
 
         # Analyze code for common elements
-        lines = submitted_code.strip().split('\n')
-        has_print = any('print(' in line for line in lines)
-        has_function = any('def ' in line for line in lines)
-        has_condition = any('if ' in line for line in lines) or any('elif ' in line for line in lines) or any('else:' in line for line in lines)
-        has_loop = any('for ' in line for line in lines) or any('while ' in line for line in lines)
-
-        if has_print:
+        facts = analysis.facts
+        if facts["calls_print"]:
             feedback_points.append("✓ Good use of print statements for output")
-        if has_function:
+        if facts["defines_function"]:
             feedback_points.append("✓ Functions defined properly")
-        if has_condition:
+        if facts["has_condition"]:
             feedback_points.append("✓ Conditional statements used")
-        if has_loop:
+        if facts["has_loop"]:
             feedback_points.append("✓ Loops implemented correctly")
 
         # Simple heuristic for correctness
@@ -230,6 +243,49 @@ class ExerciseAgent:
             "submitted_code": submitted_code
         }
 
+    async def _grade_solution(self, submitted_code: str, exercise: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+        """Run the solution against the exercise's test cases"""
+        try:
+            report = await self.grader(submitted_code, exercise["test_cases"], user_id)
+        except Exception as e:
+            # E.g. the solution uses something the sandbox does not allow
+            return {
+                "is_correct": False,
+                "feedback": f"✗ Your solution could not be run: {str(e)}",
+                "score": 0,
+                "submitted_code": submitted_code
+            }
+
+        feedback_points = []
+        if report.get("error"):
+            feedback_points.append(f"✗ {report['error'].strip()}")
+        for case in report["cases"]:
+            if case["passed"]:
+                feedback_points.append(f"✓ {case['name']} passed")
+            elif case["status"] == "failed":
+                feedback_points.append(f"✗ {case['name']}: expected {case['expected']!r}, got {case['actual']!r}")
+            elif case["status"] == "timeout":
+                feedback_points.append(f"✗ {case['name']}: took too long (is there an endless loop?)")
+            elif not report.get("error"):
+                error = case["errors"].strip().splitlines()
+                feedback_points.append(f"✗ {case['name']}: {error[-1] if error else case['status']}")
+
+        is_correct = report["passed"] == report["total"]
+        if is_correct:
+            feedback_points.append("🎉 Well done! Your solution passes every test!")
+        else:
+            feedback_points.append("Keep working on it! Consider the hints provided with the exercise.")
+
+        return {
+            "is_correct": is_correct,
+            "feedback": " ".join(feedback_points),
+            "score": report["score"],
+            "passed": report["passed"],
+            "total": report["total"],
+            "test_results": report["cases"],
+            "submitted_code": submitted_code
+        }
+
     def get_available_categories(self) -> List[str]:
         """Get list of available exercise categories"""
         return list(self.exercises.keys())
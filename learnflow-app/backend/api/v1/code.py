@@ -2,11 +2,14 @@
 Code Execution API endpoints for LearnFlow
 """
 from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from typing import Dict, Any
 import asyncio
+import json
 
 from ...services.learnflow_service import get_learnflow_service
 from ...services.code_execution.code_executor import execute_code
+from ...services.code_execution.scheduler import SchedulerOverloaded
 
 router = APIRouter()
 
@@ -34,9 +37,72 @@ async def execute_user_code(request_data: Dict[str, Any]):
 
     except HTTPException:
         raise
+    except SchedulerOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error executing code: {str(e)}")
 
+def _sse(event: Dict[str, Any]) -> str:
+    """Format an execution event as a server-sent event"""
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+@router.post("/stream")
+async def stream_user_code(request_data: Dict[str, Any]):
+    """
+    Execute code submitted by a user, streaming its output as server-sent events
+
+    Events are "started" (with the run_id used to cancel), "stdout" and
+    "stderr" as the program prints, and finally "result" with the same
+    document POST / returns. Disconnecting stops the program.
+    """
+    user_id = request_data.get("user_id")
+    code_text = request_data.get("code")
+    input_data = request_data.get("input", "")
+
+    if not user_id or not code_text:
+        raise HTTPException(status_code=400, detail="user_id and code are required")
+
+    # Get the LearnFlow service
+    service = get_learnflow_service()
+    events = service.stream_user_code(user_id, code_text, input_data)
+
+    # Wait for the run to start, so a busy executor is still answered with a 503
+    try:
+        first = await events.__anext__()
+    except SchedulerOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error executing code: {str(e)}")
+
+    async def body():
+        try:
+            yield _sse(first)
+            async for event in events:
+                yield _sse(event)
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/stream/{run_id}/cancel")
+async def cancel_user_code(run_id: str, request_data: Dict[str, Any]):
+    """
+    Cancel a streamed run; its stream ends with a "cancelled" result
+    """
+    user_id = request_data.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=400, detail="user_id is required")
+
+    service = get_learnflow_service()
+    if not service.cancel_user_code(user_id, run_id):
+        raise HTTPException(status_code=404, detail="No running execution with that run_id")
+    return {"run_id": run_id, "status": "cancelling"}
+
 @router.post("/evaluate-exercise")
 async def evaluate_exercise_solution(request_data: Dict[str, Any]):
     """
@@ -77,7 +77,7 @@ async def review_code(request_data: Dict[str, Any]):
         service = get_learnflow_service()
 
         # Review the code
-        result = await service.review_code(user_id, code_text)
+        result = await service.review_code(user_id, code_text, course=request_data.get("course"))
 
         return result
 
@@ -0,0 +1,91 @@
+"""
+Code Analysis Cache Benchmark for LearnFlow
+Measures a review -> debug -> evaluate cycle on the same code with and without the shared analysis
+
+Each cycle passes the code the way the AI service does: review, debug
+(static checks only, no sandbox run) and structural evaluation. Without
+the cache every agent parses the code and runs its rules itself; with it
+the first cycle builds one CodeAnalysis and later cycles (the student
+asking again about unchanged code) reuse its tree and findings. Reports
+p50/p99 per cycle for programs of growing size.
+
+Usage (from learnflow-app/backend):
+    python benchmarks/code_analysis_bench.py --cycles 50 --sizes 100 1000 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.code_analysis import analysis_cache, get_code_analysis
+from agents.code_review_agent import CodeReviewAgent
+from agents.debug_agent import DebugAgent
+from agents.exercise_agent import ExerciseAgent
+
+UNIT = """
+def score_{n}(values, bonus=3):
+    total = 0
+    for index, value in enumerate(values):
+        if value % 2 == 0:
+            total += value * bonus
+        else:
+            total -= index
+    return total
+
+
+print(score_{n}([4, 7, 12]))
+"""
+
+
+def program(lines: int) -> str:
+    units = []
+    count = 0
+    while count < lines:
+        unit = UNIT.format(n=len(units))
+        units.append(unit)
+        count += unit.count("\n")
+    return "".join(units)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p50 = samples[int(0.50 * (len(samples) - 1))] * 1000
+    p99 = samples[int(0.99 * (len(samples) - 1))] * 1000
+    return f"p50 {p50:>8.2f} ms   p99 {p99:>8.2f} ms"
+
+
+async def cycle(agents, code: str):
+    review, debug, exercise = agents
+    await review.process(code, {"analysis": get_code_analysis(code)})
+    await debug.process(code, {"analysis": get_code_analysis(code)})
+    await exercise.process(code, {"solution": code, "analysis": get_code_analysis(code)})
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=50)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    # No sandbox runs or grading: only the parsing and analysis are measured
+    agents = (CodeReviewAgent(), DebugAgent(), ExerciseAgent())
+    max_entries = analysis_cache.max_entries
+
+    for size in args.sizes:
+        code = program(size)
+        for label, entries in (("no cache", 0), ("shared analysis", max_entries)):
+            analysis_cache.max_entries = entries
+            analysis_cache.clear()
+            samples = []
+            for _ in range(args.cycles):
+                started = time.perf_counter()
+                await cycle(agents, code)
+                samples.append(time.perf_counter() - started)
+            print(f"{code.count(chr(10)):>6} lines  {label:<16}{percentiles(samples)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
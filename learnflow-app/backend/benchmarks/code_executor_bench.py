@@ -0,0 +1,73 @@
+"""
+Code Executor Benchmark for LearnFlow
+Compares spawning a fresh interpreter per run with the warm sandbox worker pool
+
+Runs a typical short student program through CodeExecutor.execute_python_code
+on both paths and reports p50/p99 latency and runs/sec.
+
+Usage (from learnflow-app/backend):
+    python benchmarks/code_executor_bench.py --runs 200 --concurrency 4 --pool-size 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.code_execution.code_executor import CodeExecutor
+
+STUDENT_PROGRAM = """
+numbers = [3, 1, 4, 1, 5, 9, 2, 6]
+total = sum(numbers)
+print(f"Total: {total}")
+print(f"Average: {total / len(numbers):.2f}")
+"""
+
+
+async def measure(name: str, executor: CodeExecutor, runs: int, concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            result = await executor.execute_python_code(STUDENT_PROGRAM)
+            latencies.append(time.perf_counter() - started)
+            assert result["status"] == "success", result
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(runs)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = latencies[int(0.50 * (len(latencies) - 1))] * 1000
+    p99 = latencies[int(0.99 * (len(latencies) - 1))] * 1000
+    print(f"{name:<22} p50 {p50:>8.2f} ms   p99 {p99:>8.2f} ms   {runs / elapsed:>8.1f} runs/s")
+    return runs / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--pool-size", type=int, default=4)
+    args = parser.parse_args()
+
+    # No result cache: every run must reach the sandbox
+    spawn = CodeExecutor(timeout=10, cache_size=0)
+    before = await measure("spawn per run", spawn, args.runs, args.concurrency)
+
+    pool = CodeExecutor(timeout=10, pool_size=args.pool_size, cache_size=0)
+    await pool.start()
+    try:
+        after = await measure(f"warm pool ({args.pool_size})", pool, args.runs, args.concurrency)
+    finally:
+        await pool.close()
+
+    print(f"\nspeedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
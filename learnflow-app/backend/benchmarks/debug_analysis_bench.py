@@ -0,0 +1,114 @@
+"""
+Debug Static Analysis Benchmark for LearnFlow
+Compares DebugAgent's old per-loop ast.walk analysis with the single-pass engine
+
+Programs are generated at growing sizes in two shapes: "flat" (many small
+functions with loops nested three deep) and "nested" (one chain of loops
+whose depth grows with the program). The old analysis walks the whole tree
+and then walks every for loop's subtree again, so its cost on nested loops
+grows with depth times size; the engine visits each node once. Reports the
+time per run and per line for both; parsing is excluded, as both share it.
+
+Usage (from learnflow-app/backend):
+    python benchmarks/debug_analysis_bench.py --sizes 500 1000 2000 4000 8000
+"""
+import argparse
+import ast
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.debug_agent import STATIC_ANALYSIS
+
+FLAT_UNIT = """
+def compute_{n}(values):
+    total = 0
+    for i in range(len(values)):
+        for j in range(i):
+            for k in range(j):
+                total += values[k] * {n} / (i + 1)
+    return total
+"""
+
+
+def flat_program(lines: int) -> str:
+    units = []
+    count = 0
+    while count < lines:
+        unit = FLAT_UNIT.format(n=len(units))
+        units.append(unit)
+        count += unit.count("\n")
+    return "".join(units) + "print(compute_0([1, 2, 3]))\n"
+
+
+def nested_program(lines: int) -> str:
+    # Each level opens a loop and does a little work; CPython's parser
+    # limits nesting, so the chain restarts every 90 levels
+    out = ["total = 0"]
+    depth = 0
+    while len(out) < lines:
+        if depth == 90:
+            depth = 0
+        indent = "    " * depth
+        out.append(f"{indent}for v{depth} in range(2):")
+        out.append(f"{indent}    total += v{depth} * 3")
+        depth += 1
+    out.append("print(total)")
+    return "\n".join(out) + "\n"
+
+
+def legacy_static_analysis(tree: ast.AST, code: str):
+    """DebugAgent._static_analysis before the engine (for loops with plain name targets only)"""
+    issues = []
+    lines = code.split('\n')
+
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.BinOp) and
+            isinstance(node.op, ast.Div) and
+            isinstance(node.right, ast.Constant) and
+            node.right.value == 0):
+            issues.append({"line": node.lineno, "code_line": lines[node.lineno - 1]})
+
+        if isinstance(node, ast.For):
+            for inner_node in ast.walk(node):
+                if (isinstance(inner_node, ast.Name) and
+                    isinstance(inner_node.ctx, ast.Store) and
+                    isinstance(inner_node.id, str) and
+                    inner_node.id == node.target.id):
+                    issues.append({"line": inner_node.lineno, "code_line": lines[inner_node.lineno - 1]})
+
+    return issues
+
+
+def time_per_run(analyze, tree, code, min_seconds: float = 0.2) -> float:
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        analyze(tree, code)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return elapsed / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000, 4000, 8000])
+    args = parser.parse_args()
+
+    print(f"{'shape':<8}{'lines':>7}{'old ms':>10}{'old us/line':>13}{'engine ms':>11}{'engine us/line':>16}")
+    for shape, generate in (("flat", flat_program), ("nested", nested_program)):
+        for size in args.sizes:
+            code = generate(size)
+            tree = ast.parse(code)
+            lines = code.count("\n")
+            legacy = time_per_run(legacy_static_analysis, tree, code)
+            engine = time_per_run(STATIC_ANALYSIS.analyze, tree, code)
+            print(f"{shape:<8}{lines:>7}{legacy * 1000:>10.1f}{legacy / lines * 1e6:>13.1f}"
+                  f"{engine * 1000:>11.1f}{engine / lines * 1e6:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
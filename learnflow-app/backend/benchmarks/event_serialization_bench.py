@@ -0,0 +1,102 @@
+"""
+Event Serialization Benchmark for LearnFlow
+Measures bytes per event and encode/decode throughput for each event format
+
+Events are built the same way as the KafkaService.send_*_event methods build
+them. ai_interaction events carry realistic tutor query/response text, since
+the ai-interactions topic is the largest one.
+
+Usage (from learnflow-app/backend):
+    python benchmarks/event_serialization_bench.py --iterations 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.kafka.serialization import SERIALIZERS, SerializationError, decode_event, get_serializer
+
+AI_RESPONSE = (
+    "A for loop in Python iterates over the items of any sequence, such as a list or a string, "
+    "in the order they appear. For example:\n\n```python\nfor fruit in ['apple', 'banana']:\n"
+    "    print(fruit)\n```\n\nUse range() when you need to repeat an action a fixed number of times. "
+) * 6
+
+
+def sample_events():
+    now = time.time()
+    return {
+        "user_interaction": {
+            "event_type": "user_interaction",
+            "user_id": "3f2b8c1e-7d4a-4b7e-9a61-2c5d8e9f0a1b",
+            "interaction_type": "code_execution",
+            "timestamp": now,
+            "data": {
+                "code_preview": "for i in range(10):\n    print(i * i)",
+                "execution_status": "success",
+                "execution_time": 0.0421,
+            },
+        },
+        "progress_update": {
+            "event_type": "progress_update",
+            "user_id": "3f2b8c1e-7d4a-4b7e-9a61-2c5d8e9f0a1b",
+            "timestamp": now,
+            "progress_data": {
+                "lesson_id": "loops-101",
+                "updated_fields": {"status": "completed", "score": 90, "attempts": 2},
+                "timestamp": "2024-05-01T12:00:00",
+            },
+        },
+        "ai_interaction": {
+            "event_type": "ai_interaction",
+            "user_id": "3f2b8c1e-7d4a-4b7e-9a61-2c5d8e9f0a1b",
+            "query": "Can you explain how for loops work in Python and when I should use range()?",
+            "response": AI_RESPONSE,
+            "agent_type": "concepts",
+            "timestamp": now,
+        },
+    }
+
+
+def measure(encode, decode, event, iterations):
+    encoded = encode(event)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encode(event)
+    encode_rate = iterations / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decode(encoded)
+    decode_rate = iterations / (time.perf_counter() - start)
+    return len(encoded), encode_rate, decode_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    codecs = [("json.dumps (before)", lambda event: json.dumps(event).encode('utf-8'),
+               lambda value: json.loads(value.decode('utf-8')))]
+    for name in SERIALIZERS:
+        try:
+            serializer = get_serializer(name)
+        except SerializationError as e:
+            print(f"skipping {name}: {e}")
+            continue
+        codecs.append((name, serializer.encode, decode_event))
+
+    for event_type, event in sample_events().items():
+        print(f"\n{event_type}")
+        print(f"  {'format':<22}{'bytes':>8}{'encode/s':>14}{'decode/s':>14}")
+        for name, encode, decode in codecs:
+            size, encode_rate, decode_rate = measure(encode, decode, event, args.iterations)
+            print(f"  {name:<22}{size:>8}{encode_rate:>14,.0f}{decode_rate:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Grading Benchmark for LearnFlow
+Compares grading one execution per test case with the single-sandbox grading runner
+
+Grades the Even or Odd exercise solution against N stdin test cases, first by
+calling execute_python_code once per case (one sandbox each), then with
+grade_python_code (one sandbox for all cases), and reports p50/p99 latency
+per grading.
+
+Usage (from learnflow-app/backend):
+    python benchmarks/grading_bench.py --cases 20 --runs 20 --pool-size 0
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.code_execution.code_executor import CodeExecutor
+from services.code_execution.grading import normalize_output
+
+SOLUTION = """
+num = int(input('Enter a number: '))
+if num % 2 == 0:
+    print('even')
+else:
+    print('odd')
+"""
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p50 = samples[int(0.50 * (len(samples) - 1))] * 1000
+    p99 = samples[int(0.99 * (len(samples) - 1))] * 1000
+    return f"p50 {p50:>8.1f} ms   p99 {p99:>8.1f} ms"
+
+
+async def grade_per_case(executor: CodeExecutor, cases) -> int:
+    passed = 0
+    for case in cases:
+        result = await executor.execute_python_code(SOLUTION, case["input"])
+        # The prompt is part of the output here
+        passed += normalize_output(result["output"]).endswith(case["expected_output"])
+    return passed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=0)
+    args = parser.parse_args()
+
+    cases = [{"input": str(n), "expected_output": "even" if n % 2 == 0 else "odd"} for n in range(args.cases)]
+    # No result cache: every run must reach the sandbox
+    executor = CodeExecutor(timeout=10, pool_size=args.pool_size, cache_size=0)
+    await executor.start()
+    try:
+        per_case, runner = [], []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            assert await grade_per_case(executor, cases) == len(cases)
+            per_case.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            report = await executor.grade_python_code(SOLUTION, cases)
+            assert report["passed"] == len(cases), report
+            runner.append(time.perf_counter() - started)
+    finally:
+        await executor.close()
+
+    print(f"{args.cases} cases, pool size {args.pool_size}")
+    print(f"{'one execution per case':<26}{percentiles(per_case)}")
+    print(f"{'grading runner':<26}{percentiles(runner)}")
+    print(f"\nspeedup: {sorted(per_case)[len(per_case) // 2] / sorted(runner)[len(runner) // 2]:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Incremental Review Benchmark for LearnFlow
+Measures the edit-resubmit loop with full and incremental code review
+
+A long program is reviewed, then resubmitted many times, each time with one
+small edit in a random function or class (a changed default or constant)
+and sometimes a line inserted near the top, which moves every later unit.
+Reports p50/p99 per resubmission for the full review and the incremental
+one, with and without parsing (a new submission always has to be parsed),
+and checks that both give the same findings.
+
+Usage (from learnflow-app/backend):
+    python benchmarks/incremental_review_bench.py --sizes 1000 5000 --edits 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.code_analysis import CodeAnalysis
+from agents.code_review_agent import CodeReviewAgent
+
+UNIT = """
+def process_batch_{n}(records, threshold=25):
+    validCount = 0
+    for index, record in enumerate(records):
+        if record > threshold:
+            validCount += record * 3
+        elif record < 0:
+            print("debug: negative record", index)
+    return validCount / 7.5
+
+
+class Report{n}:
+    def __init__(self, title):
+        self.title = title
+        self.rows = []
+
+    def add_row(self, value):
+        self.rows.append(value * 42)
+"""
+
+
+def program(lines: int) -> str:
+    units = []
+    count = 0
+    while count < lines:
+        unit = UNIT.format(n=len(units))
+        units.append(unit)
+        count += unit.count("\n")
+    return "".join(units)
+
+
+def edit(code: str, rng: random.Random) -> str:
+    lines = code.split("\n")
+    targets = [i for i, line in enumerate(lines) if "threshold=" in line or "* 42" in line]
+    i = rng.choice(targets)
+    lines[i] = lines[i].replace("25", str(rng.randint(26, 99))).replace("* 42", f"* {rng.randint(43, 99)}")
+    if rng.random() < 0.3:
+        lines.insert(1, f"# revision {rng.randint(0, 10 ** 6)}")
+    return "\n".join(lines)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p50 = samples[int(0.50 * (len(samples) - 1))] * 1000
+    p99 = samples[int(0.99 * (len(samples) - 1))] * 1000
+    return f"p50 {p50:>8.2f} ms   p99 {p99:>8.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--edits", type=int, default=50)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        full_agent = CodeReviewAgent(incremental=False)
+        incremental_agent = CodeReviewAgent(incremental=True)
+        rng = random.Random(size)
+        code = program(size)
+        # The first submission is reviewed in full either way
+        asyncio.run(incremental_agent._review_code(CodeAnalysis(code)))
+
+        timings = {"full": [], "full+parse": [], "incremental": [], "incremental+parse": []}
+        for _ in range(args.edits):
+            code = edit(code, rng)
+            reviews = {}
+            for label, agent in (("full", full_agent), ("incremental", incremental_agent)):
+                started = time.perf_counter()
+                analysis = CodeAnalysis(code)
+                parsed = time.perf_counter()
+                reviews[label] = asyncio.run(agent._review_code(analysis))
+                done = time.perf_counter()
+                timings[label].append(done - parsed)
+                timings[label + "+parse"].append(done - started)
+            assert reviews["full"] == reviews["incremental"], "incremental review differs from the full review"
+
+        print(f"{code.count(chr(10))} lines, {args.edits} edited resubmissions")
+        for label, samples in timings.items():
+            print(f"  {label:<20}{percentiles(samples)}")
+        print(f"  units: {incremental_agent.incremental.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Kafka Consumer Benchmark for LearnFlow
+Compares the original per-message poll loop with the batched consumer engine
+
+Both paths consume pre-generated `user-interactions` events from an in-memory
+consumer stand-in on a single core, so the numbers reflect client-side cost
+(polling, decoding, logging, committing) rather than broker throughput.
+
+Usage (from learnflow-app/backend):
+    python benchmarks/kafka_consumer_bench.py --messages 200000 --users 1000
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.kafka.consumer_engine import BatchConsumer
+
+
+class _Message:
+    __slots__ = ("_topic", "_partition", "_offset", "_key", "_value")
+
+    def __init__(self, topic, partition, offset, key, value):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return None
+
+
+class InMemoryConsumer:
+    """Minimal stand-in for confluent_kafka.Consumer over a fixed message list"""
+
+    def __init__(self, messages):
+        self._messages = messages
+        self._position = 0
+        self.commits = 0
+
+    def poll(self, timeout=None):
+        if self._position >= len(self._messages):
+            return None
+        msg = self._messages[self._position]
+        self._position += 1
+        return msg
+
+    def consume(self, num_messages=1, timeout=None):
+        batch = self._messages[self._position:self._position + num_messages]
+        self._position += len(batch)
+        return batch
+
+    def commit(self, offsets=None, asynchronous=True):
+        self.commits += 1
+
+    def get_watermark_offsets(self, partition, cached=False):
+        return 0, len(self._messages)
+
+    @property
+    def exhausted(self):
+        return self._position >= len(self._messages)
+
+
+def generate_messages(count: int, users: int, partitions: int = 6):
+    messages = []
+    offsets = [0] * partitions
+    for i in range(count):
+        user_id = f"user-{i % users}"
+        partition = hash(user_id) % partitions
+        event = {
+            "event_type": "user_interaction",
+            "user_id": user_id,
+            "interaction_type": "code_execution",
+            "timestamp": time.time(),
+            "data": {"execution_status": "error" if i % 3 else "success", "execution_time": 0.05},
+        }
+        messages.append(_Message("user-interactions", partition, offsets[partition],
+                                 user_id.encode(), json.dumps(event).encode("utf-8")))
+        offsets[partition] += 1
+    return messages
+
+
+def struggle_handler():
+    """Lightweight stand-in for struggle detection: track consecutive failures per user"""
+    failures = {}
+
+    def handle(event):
+        user_id = event["user_id"]
+        if event["data"]["execution_status"] == "error":
+            failures[user_id] = failures.get(user_id, 0) + 1
+        else:
+            failures[user_id] = 0
+
+    return handle
+
+
+def legacy_loop(consumer: InMemoryConsumer, handler):
+    """The original KafkaService.consume_events loop body"""
+    logger = logging.getLogger("legacy-consumer")
+    while not consumer.exhausted:
+        msg = consumer.poll(timeout=1.0)
+        if msg is None:
+            continue
+        if msg.error():
+            continue
+        try:
+            event_data = json.loads(msg.value().decode('utf-8'))
+            handler(event_data)
+            logger.info(f"Processed message from topic {msg.topic()}")
+        except json.JSONDecodeError:
+            logger.error(f"Failed to decode JSON from message: {msg.value()}")
+        except Exception as e:
+            logger.error(f"Error processing message: {str(e)}")
+
+
+def run(name: str, messages, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    rate = len(messages) / elapsed
+    print(f"{name:<32} {rate:>12,.0f} msg/s   ({elapsed:.2f}s)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    # Same logging setup as main.py, but writing to memory instead of a terminal
+    logging.basicConfig(level=logging.INFO, stream=io.StringIO())
+
+    messages = generate_messages(args.messages, args.users)
+    print(f"{args.messages} messages from {args.users} users\n")
+
+    consumer = InMemoryConsumer(messages)
+    before = run("per-message poll loop (before)", messages, lambda: legacy_loop(consumer, struggle_handler()))
+
+    consumer = InMemoryConsumer(messages)
+    engine = BatchConsumer(consumer, struggle_handler(), batch_size=args.batch_size, max_workers=1)
+    after = run("batched engine, inline", messages, lambda: engine.run(lambda: not consumer.exhausted))
+
+    consumer = InMemoryConsumer(messages)
+    engine = BatchConsumer(consumer, struggle_handler(), batch_size=args.batch_size, max_workers=4)
+    run("batched engine, 4 workers", messages, lambda: engine.run(lambda: not consumer.exhausted))
+
+    print(f"\nspeedup (inline): {after / before:.1f}x, commits: {consumer.commits}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Kafka Producer Benchmark for LearnFlow
+Compares flush-per-event sending with the non-blocking batched producer
+
+Runs against an in-process broker stand-in that acknowledges each producer
+batch after a fixed round-trip time, so no Kafka cluster is required.
+
+Usage (from learnflow-app/backend):
+    python benchmarks/kafka_producer_bench.py --requests 2000 --concurrency 50 --rtt-ms 2
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.kafka.kafka_service import KafkaService
+
+
+class _Message:
+    def __init__(self, topic: str, partition: int = 0):
+        self._topic = topic
+        self._partition = partition
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+
+class LocalBrokerProducer:
+    """
+    Minimal stand-in for confluent_kafka.Producer
+
+    Messages produced within `linger` seconds of each other share a batch and
+    the whole batch is acknowledged `rtt` seconds after it is sent.
+    """
+
+    def __init__(self, rtt: float, linger: float = 0.0):
+        self.rtt = rtt
+        self.linger = linger
+        self._batch = []
+        self._batch_opened = 0.0
+        self._in_flight = deque()  # (ack_time, [(callback, message), ...])
+
+    def __len__(self):
+        return len(self._batch) + sum(len(batch) for _, batch in self._in_flight)
+
+    def _seal_batch(self, now: float):
+        if self._batch:
+            self._in_flight.append((now + self.rtt, self._batch))
+            self._batch = []
+
+    def produce(self, topic, value=None, key=None, callback=None, **kwargs):
+        now = time.perf_counter()
+        if self._batch and now - self._batch_opened >= self.linger:
+            self._seal_batch(now)
+        if not self._batch:
+            self._batch_opened = now
+        self._batch.append((callback, _Message(topic)))
+
+    def poll(self, timeout=0):
+        now = time.perf_counter()
+        if self._batch and now - self._batch_opened >= self.linger:
+            self._seal_batch(now)
+        served = 0
+        while self._in_flight and self._in_flight[0][0] <= now:
+            _, batch = self._in_flight.popleft()
+            for callback, message in batch:
+                if callback:
+                    callback(None, message)
+                served += 1
+        return served
+
+    def flush(self, timeout=None):
+        self._seal_batch(time.perf_counter())
+        while self._in_flight:
+            wait = self._in_flight[-1][0] - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            self.poll(0)
+        return 0
+
+
+async def _tutor_request(service: KafkaService, user_id: str, wait_for_delivery: bool) -> float:
+    """Mimic LearnFlowService.process_tutor_request, which emits two events"""
+    start = time.perf_counter()
+    await service.send_event("ai-interactions", {"user_id": user_id, "query": "q" * 200,
+                                                 "response": "r" * 800}, key=user_id,
+                             wait_for_delivery=wait_for_delivery)
+    await service.send_event("user-interactions", {"user_id": user_id, "interaction_type": "tutor_request"},
+                             key=user_id, wait_for_delivery=wait_for_delivery)
+    return time.perf_counter() - start
+
+
+async def run_scenario(name: str, requests: int, concurrency: int, rtt: float, linger: float,
+                       flush_on_send: bool, wait_for_delivery: bool = False):
+    service = KafkaService(flush_on_send=flush_on_send, poll_interval=0.001)
+    service.producer = LocalBrokerProducer(rtt=rtt, linger=linger)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            latencies.append(await _tutor_request(service, f"user-{i % 500}", wait_for_delivery))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    await service.close()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<28} {requests * 2 / elapsed:>12,.0f} events/s"
+          f"   p50 {statistics.median(latencies) * 1000:>8.3f} ms"
+          f"   p99 {p99 * 1000:>8.3f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=2.0)
+    parser.add_argument("--linger-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    rtt = args.rtt_ms / 1000
+    linger = args.linger_ms / 1000
+    print(f"{args.requests} tutor requests, concurrency {args.concurrency}, "
+          f"broker RTT {args.rtt_ms} ms, linger {args.linger_ms} ms\n")
+    await run_scenario("flush per event (before)", args.requests, args.concurrency, rtt, 0.0, flush_on_send=True)
+    await run_scenario("batched, fire-and-forget", args.requests, args.concurrency, rtt, linger, flush_on_send=False)
+    await run_scenario("batched, await delivery", args.requests, args.concurrency, rtt, linger,
+                       flush_on_send=False, wait_for_delivery=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
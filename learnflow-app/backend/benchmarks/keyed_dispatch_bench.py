@@ -0,0 +1,117 @@
+"""
+Keyed Dispatch Benchmark for LearnFlow
+Measures how event processing scales with the number of dispatcher lanes
+
+Two handler shapes are measured over the same in-memory `user-interactions`
+stream:
+    io   coroutine handler that awaits a fixed latency per event, like the
+         Redis round trips made by struggle detection
+    cpu  plain handler doing a fixed amount of Python work per event, run in
+         one process per lane (only scales when more than one core is free)
+
+Each run also checks that every user's events were handled in offset order.
+
+Usage (from learnflow-app/backend):
+    python benchmarks/keyed_dispatch_bench.py --messages 20000 --users 500 --lanes 1 4 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.kafka_consumer_bench import InMemoryConsumer, generate_messages
+from services.kafka.async_consumer import AsyncConsumer
+
+
+class PausableConsumer(InMemoryConsumer):
+    """InMemoryConsumer with the assignment/pause/resume calls AsyncConsumer uses"""
+
+    def assignment(self):
+        return []
+
+    def pause(self, partitions):
+        pass
+
+    def resume(self, partitions):
+        pass
+
+    def close(self):
+        pass
+
+
+def cpu_handler(event):
+    """Fixed amount of pure-Python work per event"""
+    total = 0
+    for i in range(2000):
+        total += i * i
+    return total
+
+
+async def run_stream(messages, handler, lanes: int, use_processes: bool = False) -> float:
+    consumer = PausableConsumer(messages)
+    async_consumer = AsyncConsumer(consumer, max_in_flight=2000)
+    task = asyncio.create_task(async_consumer.run(handler, lanes=lanes, use_processes=use_processes))
+
+    start = time.perf_counter()
+    while True:
+        await asyncio.sleep(0.005)
+        dispatcher = async_consumer.dispatcher
+        if consumer.exhausted and dispatcher is not None and dispatcher.in_flight == 0:
+            break
+    elapsed = time.perf_counter() - start
+
+    async_consumer.stop()
+    await task
+    return elapsed
+
+
+def report(name: str, count: int, elapsed: float, baseline: float):
+    print(f"{name:<28} {count / elapsed:>12,.0f} events/s   ({elapsed:.2f}s, {baseline / elapsed:.1f}x)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--lanes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--latency", type=float, default=0.0005, help="Seconds awaited per event by the io handler")
+    args = parser.parse_args()
+
+    messages = generate_messages(args.messages, args.users)
+    print(f"{args.messages} messages from {args.users} users, {os.cpu_count()} cores\n")
+
+    print("io handler")
+    baseline = None
+    for lanes in args.lanes:
+        last_seen = {}
+        out_of_order = 0
+
+        async def io_handler(event):
+            nonlocal out_of_order
+            await asyncio.sleep(args.latency)
+            user_id = event["user_id"]
+            if event["timestamp"] < last_seen.get(user_id, 0):
+                out_of_order += 1
+            last_seen[user_id] = event["timestamp"]
+
+        elapsed = await run_stream(messages, io_handler, lanes)
+        baseline = baseline or elapsed
+        report(f"  {lanes} lanes", len(messages), elapsed, baseline)
+        if out_of_order:
+            print(f"  !! {out_of_order} events handled out of order")
+
+    print("\ncpu handler (process lanes)")
+    baseline = None
+    for lanes in args.lanes:
+        if lanes > (os.cpu_count() or 1) * 2:
+            continue
+        elapsed = await run_stream(messages, cpu_handler, lanes, use_processes=True)
+        baseline = baseline or elapsed
+        report(f"  {lanes} lanes", len(messages), elapsed, baseline)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,185 @@
+"""
+Safety Analyzer Benchmark for LearnFlow
+Compares the old substring scan with the AST safety analyzer on speed and precision
+
+The corpus is the exercise solutions shipped in agents/exercise_agent.py plus
+typical student submissions. Speed is measured per program and on large
+inputs built by concatenating the corpus; the analyzer is timed cold (parse
+every time) and memoized (resubmission of the same source), on the corpus
+and on its programs without imports, which the prefilter passes without
+parsing. The speed table ignores the analyzer's source size cap; the
+executor refuses longer programs unparsed. The longest event loop stall is
+measured for a cold analysis of the largest input under the cap, called
+directly and through analyze_async(). Precision is checked on labeled
+programs the substring scan gets wrong in both directions, and on ways around
+the analyzer found in review.
+
+Usage (from learnflow-app/backend):
+    python benchmarks/safety_analyzer_bench.py --rounds 200
+"""
+import argparse
+import ast
+import asyncio
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from services.code_execution.safety import DEFAULT_MAX_SOURCE_CHARS, SafetyAnalyzer
+
+SUBMISSIONS = [
+    "name = input('What is your name? ')\nprint(f'Hello, {name}!')",
+    "def factorial(n):\n    if n <= 1:\n        return 1\n    return n * factorial(n - 1)\n\nfor i in range(10):\n    print(i, factorial(i))",
+    "import math\n\ndef area(r):\n    return math.pi * r ** 2\n\nprint(round(area(3), 2))",
+    "from collections import Counter\n\ntext = 'the quick brown fox jumps over the lazy dog the end'\ncounts = Counter(text.split())\nfor word, n in counts.most_common(3):\n    print(word, n)",
+    "class Stack:\n    def __init__(self):\n        self.items = []\n\n    def push(self, item):\n        self.items.append(item)\n\n    def pop(self):\n        return self.items.pop()\n\n    def __len__(self):\n        return len(self.items)\n\ns = Stack()\nfor x in 'abc':\n    s.push(x)\nprint(s.pop(), len(s))",
+    "numbers = [int(x) for x in input().split()]\nevens = [n for n in numbers if n % 2 == 0]\nprint(sum(evens))",
+    "import random\n\nsecret = random.randint(1, 10)\nguess = 5\nprint('higher' if secret > guess else 'lower or equal')",
+    "def fib():\n    a, b = 0, 1\n    while True:\n        yield a\n        a, b = b, a + b\n\ngen = fib()\nprint([next(gen) for _ in range(15)])",
+    "grades = {'alice': [90, 85], 'bob': [70, 75]}\nfor student, scores in sorted(grades.items()):\n    avg = sum(scores) / len(scores)\n    print(f'{student:>6}: {avg:.1f}')",
+    "try:\n    value = int('abc')\nexcept ValueError as e:\n    print('Could not convert:', e)\nfinally:\n    print('done')",
+    "from dataclasses import dataclass\n\n@dataclass\nclass Point:\n    x: int\n    y: int\n\nprint(Point(1, 2))",
+    "import json\n\ndata = {'name': 'Ada', 'langs': ['python', 'c']}\ntext = json.dumps(data)\nprint(json.loads(text)['langs'][0])",
+]
+
+# (program, should be blocked)
+PRECISION_CASES = [
+    ("def reopen(path):\n    return path\nprint(reopen('a'))", False),
+    ("print('type input( to read a line')", False),
+    ("n = int(input())\nprint(n * 2)", False),
+    ("# we never call eval( here\nprint(1)", False),
+    ("import osmosis_notes_are_not_imports\n", True),
+    ("from os import system\nsystem('id')", True),
+    ("import os as o\no.listdir('/')", True),
+    ("f = eval\nprint(f('1 + 1'))", True),
+    ("print(().__class__.__bases__[0].__subclasses__())", True),
+    ("import random\nrandom._os.system('id')", True),
+    ("import dataclasses\ndataclasses.builtins.open('/etc/passwd')", True),
+    ("from importlib import import_module\nimport_module('os')", True),
+    ("import random; m = random; m._os.popen('echo escaped').read()", True),
+    ("import typing; t = typing; t.sys.modules['os']", True),
+    ("if True:\n    if True:\n        if True:\n            if True:\n                if True:\n"
+     "                    import random\nrandom._os.system('id')", True),
+    ("def load(module):\n    return module._os\n\nimport random\nload(random).system('id')", True),
+    ("class Account:\n    def __init__(self):\n        self._balance = 0\n\nprint(Account()._balance)", False),
+]
+
+
+def legacy_contains_dangerous_operations(code: str) -> bool:
+    """The substring scan CodeExecutor used before the AST analyzer"""
+    dangerous_patterns = [
+        'import os', 'import sys', 'import subprocess', 'import shutil',
+        'import urllib', 'import requests', 'import http', 'import socket',
+        '__import__', 'exec(', 'eval(', 'open(', 'file(',
+        'getattr(', 'setattr(', 'delattr(', 'compile(',
+        'globals()', 'locals()', 'vars(',
+        'input(',
+    ]
+    code_lower = code.lower()
+    for pattern in dangerous_patterns:
+        if pattern in code_lower:
+            return True
+    return False
+
+
+def exercise_solutions():
+    """The "solution" strings of agents/exercise_agent.py, read without importing it"""
+    with open(os.path.join(BACKEND_DIR, "agents", "exercise_agent.py")) as f:
+        tree = ast.parse(f.read())
+    solutions = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Dict):
+            for key, value in zip(node.keys, node.values):
+                if isinstance(key, ast.Constant) and key.value == "solution" and isinstance(value, ast.Constant):
+                    solutions.append(value.value)
+    return solutions
+
+
+def time_per_call(check, programs, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for program in programs:
+            check(program)
+    return (time.perf_counter() - started) / (rounds * len(programs)) * 1e6
+
+
+async def loop_stall(check, program: str) -> float:
+    """Longest gap, in ms, between ticks of a 1 ms timer while check(program) runs"""
+    gaps = []
+
+    async def ticker():
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            gaps.append(time.perf_counter() - started)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    gaps.clear()
+    result = check(program)
+    if asyncio.iscoroutine(result):
+        await result
+    await asyncio.sleep(0.01)
+    task.cancel()
+    return max(gaps) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = exercise_solutions() + SUBMISSIONS
+    corpus_text = "\n\n".join(corpus)
+    plain_text = "\n\n".join(program for program in corpus if "import" not in program)
+    sizes = {
+        "corpus (per program)": corpus,
+        f"large ({corpus_text.count(chr(10)) * 10} lines)": ["\n\n".join([corpus_text] * 10)],
+        f"huge ({corpus_text.count(chr(10)) * 100} lines)": ["\n\n".join([corpus_text] * 100)],
+        f"no imports ({plain_text.count(chr(10)) * 100} lines)": ["\n\n".join([plain_text] * 100)],
+    }
+    print(f"corpus: {len(corpus)} programs ({len(exercise_solutions())} exercise solutions)\n")
+
+    print(f"{'input':<26}{'substring scan':>16}{'AST cold':>12}{'AST memoized':>15}")
+    for label, programs in sizes.items():
+        rounds = max(1, args.rounds // max(1, sum(len(p) for p in programs) // 2000))
+        memoized = SafetyAnalyzer(max_source_chars=None)
+        for program in programs:
+            memoized.analyze(program)
+        legacy = time_per_call(legacy_contains_dangerous_operations, programs, rounds)
+        cold = time_per_call(SafetyAnalyzer._analyze, programs, rounds)
+        warm = time_per_call(memoized.analyze, programs, rounds)
+        print(f"{label:<26}{legacy:>13.1f} us{cold:>9.1f} us{warm:>12.1f} us")
+
+    capped = ("\n\n".join([corpus_text] * 100))[:DEFAULT_MAX_SOURCE_CHARS]
+    print(f"\nevent loop stall, cold analysis of {capped.count(chr(10))} lines (the size cap):")
+    print(f"  analyze()        {asyncio.run(loop_stall(SafetyAnalyzer().analyze, capped)):>8.1f} ms")
+    async_analyzer = SafetyAnalyzer()
+    # Start the worker process first, as a running backend will have
+    asyncio.run(async_analyzer.analyze_async(capped[:-1]))
+    print(f"  analyze_async()  {asyncio.run(loop_stall(async_analyzer.analyze_async, capped)):>8.1f} ms")
+    async_analyzer.shutdown()
+
+    analyzer = SafetyAnalyzer()
+    blocked_corpus = [program for program in corpus if legacy_contains_dangerous_operations(program)]
+    print(f"\ncorpus programs blocked: substring scan {len(blocked_corpus)}, "
+          f"AST {sum(not analyzer.analyze(program).allowed for program in corpus)}")
+
+    print(f"\n{'labeled case':<48}{'expected':>10}{'substring':>11}{'AST':>8}")
+    legacy_wrong = ast_wrong = 0
+    for program, dangerous in PRECISION_CASES:
+        legacy = legacy_contains_dangerous_operations(program)
+        verdict = not analyzer.analyze(program).allowed
+        legacy_wrong += legacy != dangerous
+        ast_wrong += verdict != dangerous
+        label = program.splitlines()[0][:46]
+        print(f"{label:<48}{'block' if dangerous else 'allow':>10}"
+              f"{'block' if legacy else 'allow':>11}{'block' if verdict else 'allow':>8}")
+    print(f"\nwrong verdicts: substring scan {legacy_wrong}/{len(PRECISION_CASES)}, "
+          f"AST {ast_wrong}/{len(PRECISION_CASES)}")
+
+
+if __name__ == "__main__":
+    main()
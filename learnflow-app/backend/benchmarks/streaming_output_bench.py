@@ -0,0 +1,76 @@
+"""
+Streaming Output Benchmark for LearnFlow
+Measures how soon a client sees a program's first output, buffered vs streamed
+
+Runs a program that prints a line and then keeps working. execute_python_code
+only answers once the program has finished; stream_python_code yields the
+first line as soon as it is printed. Reports p50/p99 of time to the first
+output and to the final result for both, next to the time it takes to start
+an empty sandbox process.
+
+Usage (from learnflow-app/backend):
+    python benchmarks/streaming_output_bench.py --runs 20 --work 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.code_execution.code_executor import CodeExecutor
+
+PROGRAM = """
+import time
+print("Starting...")
+time.sleep({work})
+print("Done")
+"""
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p50 = samples[int(0.50 * (len(samples) - 1))] * 1000
+    p99 = samples[int(0.99 * (len(samples) - 1))] * 1000
+    return f"p50 {p50:>8.1f} ms   p99 {p99:>8.1f} ms"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--work", type=float, default=0.5, help="seconds the program keeps running after its first line")
+    args = parser.parse_args()
+
+    # No result cache: every run must reach the sandbox
+    executor = CodeExecutor(timeout=10, cache_size=0)
+    program = PROGRAM.format(work=args.work)
+
+    startup = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        await executor.execute_python_code("pass")
+        startup.append(time.perf_counter() - started)
+
+    buffered = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        await executor.execute_python_code(program)
+        buffered.append(time.perf_counter() - started)
+
+    first_output, streamed = [], []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        async for event in executor.stream_python_code(program):
+            if event["event"] == "stdout" and len(first_output) < len(streamed) + 1:
+                first_output.append(time.perf_counter() - started)
+        streamed.append(time.perf_counter() - started)
+
+    print(f"{'empty program (startup)':<34}{percentiles(startup)}")
+    print(f"{'buffered: first output = result':<34}{percentiles(buffered)}")
+    print(f"{'streamed: first output':<34}{percentiles(first_output)}")
+    print(f"{'streamed: result':<34}{percentiles(streamed)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
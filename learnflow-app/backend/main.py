@@ -11,7 +11,8 @@ from .models.user import User
 from .models.lesson import Lesson
 from .models.progress import Progress
 from .api.v1 import api_router
-from .services.learnflow_service import init_learnflow_service
+from .services.learnflow_service import init_learnflow_service, shutdown_learnflow_service
+from .services.metrics import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -42,6 +43,11 @@ async def startup_event():
     await init_learnflow_service()
     logger.info("LearnFlow services initialized")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush pending events on shutdown"""
+    await shutdown_learnflow_service()
+
 @app.get("/")
 async def root():
     return {
@@ -65,19 +71,27 @@ async def health_check():
     # Check database connection
     db_healthy = db_service.health_check()
 
-    # For Kafka, we'll just return a simple status since checking Kafka requires more setup
-    kafka_healthy = True  # This would be checked properly in a real implementation
+    # Check Kafka broker connectivity
+    kafka_health = await kafka_service.health_check()
+    kafka_healthy = kafka_health["healthy"]
 
     return {
-        "status": "healthy",
+        "status": "healthy" if db_healthy and kafka_healthy else "degraded",
         "service": "learnflow-backend",
         "checks": {
             "database": "healthy" if db_healthy else "unhealthy",
             "kafka": "healthy" if kafka_healthy else "unhealthy"
         },
+        "kafka": kafka_health,
+        "kafka_outbox_backlog": kafka_service.outbox.backlog if kafka_service.outbox else 0,
         "timestamp": __import__('datetime').datetime.utcnow().isoformat()
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """In-process metrics: counters, Kafka client statistics and component stats"""
+    return metrics.snapshot()
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
\ No newline at end of file
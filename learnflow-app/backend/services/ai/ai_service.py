@@ -4,7 +4,7 @@ Handles communication with AI agents and manages AI-related functionality
 """
 import asyncio
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from agents.agent_manager import AgentManager
 from agents.triage_agent import TriageAgent
 from agents.concepts_agent import ConceptsAgent
@@ -12,17 +12,26 @@ from agents.code_review_agent import CodeReviewAgent
 from agents.debug_agent import DebugAgent
 from agents.exercise_agent import ExerciseAgent
 from agents.progress_agent import ProgressAgent
+from agents.code_analysis import analysis_cache, get_code_analysis
+from ..code_execution.code_executor import execute_code, grade_code
+from ..metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 class AIService:
     def __init__(self):
-        self.agent_manager = AgentManager()
+        # Debug runs go through the sandboxed executor, with its limits and fair queuing
+        runner = lambda code, user_id: execute_code(code, user_id=user_id)
+        # Tutor chat requests are routed to the manager's agents, so they get the sandbox too
+        self.agent_manager = AgentManager(runner=runner, grader=grade_code)
         self.triage_agent = TriageAgent()
         self.concepts_agent = ConceptsAgent()
         self.code_review_agent = CodeReviewAgent()
-        self.debug_agent = DebugAgent()
-        self.exercise_agent = ExerciseAgent()
+        metrics.register_source("code_review", self.code_review_agent.get_stats)
+        metrics.register_source("code_analysis_cache", analysis_cache.get_stats)
+        self.debug_agent = DebugAgent(runner=runner)
+        # Solutions are graded against the exercise's test cases in the sandbox
+        self.exercise_agent = ExerciseAgent(grader=grade_code)
         self.progress_agent = ProgressAgent()
 
     async def process_tutor_request(self, user_input: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
@@ -71,19 +80,20 @@ class AIService:
                 "message": f"Could not find explanation for concept: {concept_name}"
             }
 
-    async def review_code(self, code: str) -> Dict[str, Any]:
+    async def review_code(self, code: str, course: Optional[str] = None) -> Dict[str, Any]:
         """
         Review code and provide suggestions for improvement
 
         Args:
             code: Code to review
+            course: Course the code was written for, which selects the review rules
 
         Returns:
             Code review results
         """
         try:
-            # Create a mock context for the code review agent
-            context = {"source": "frontend_request"}
+            # The code is parsed once and shared with the other agents via the analysis cache
+            context = {"source": "frontend_request", "course": course, "analysis": get_code_analysis(code)}
             result = await self.code_review_agent.process(code, context)
             return result
         except Exception as e:
@@ -93,13 +103,14 @@ class AIService:
                 "message": "Could not review code at this time"
             }
 
-    async def debug_code(self, code: str, error_msg: str = "") -> Dict[str, Any]:
+    async def debug_code(self, code: str, error_msg: str = "", user_id: str = "anonymous") -> Dict[str, Any]:
         """
         Help debug code with error message if available
 
         Args:
             code: Code to debug
             error_msg: Optional error message to help with debugging
+            user_id: User the debug run is for, for fair queuing
 
         Returns:
             Debug analysis results
@@ -109,7 +120,7 @@ class AIService:
             if error_msg:
                 user_input += f"\nError message: {error_msg}"
 
-            context = {"source": "frontend_request"}
+            context = {"source": "frontend_request", "user_id": user_id, "analysis": get_code_analysis(code)}
             result = await self.debug_agent.process(user_input, context)
             return result
         except Exception as e:
@@ -119,20 +130,23 @@ class AIService:
                 "message": "Could not debug code at this time"
             }
 
-    async def evaluate_exercise_solution(self, exercise_id: str, solution: str) -> Dict[str, Any]:
+    async def evaluate_exercise_solution(self, exercise_id: str, solution: str,
+                                         user_id: str = "anonymous") -> Dict[str, Any]:
         """
         Evaluate a student's exercise solution
 
         Args:
             exercise_id: ID of the exercise
             solution: Student's solution code
+            user_id: Student the grading run is queued for
 
         Returns:
             Evaluation results
         """
         try:
             user_input = f"Evaluate this solution for exercise {exercise_id}: {solution}"
-            context = {"exercise_id": exercise_id, "source": "exercise_evaluation"}
+            context = {"exercise_id": exercise_id, "source": "exercise_evaluation", "solution": solution,
+                       "user_id": user_id, "analysis": get_code_analysis(solution)}
             result = await self.exercise_agent.process(user_input, context)
             return result
         except Exception as e:
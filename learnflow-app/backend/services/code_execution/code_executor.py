@@ -3,15 +3,27 @@ Secure Code Executor for LearnFlow
 Safely executes Python code with resource limits and security measures
 """
 import asyncio
+import codecs
+import json
 import subprocess
-import tempfile
 import os
 import signal
+import sys
 import logging
-from typing import Dict, Any, Optional
+import uuid
+from typing import AsyncIterator, Callable, Dict, Any, List, Optional, Tuple
 from contextlib import contextmanager
 import time
 
+from .grading import DEFAULT_CASE_TIMEOUT, build_report, normalize_cases
+from .limits import CgroupManager, ResourceLimits
+from .remote import RemoteExecutionError, RemoteExecutor
+from .result_cache import ResultCache
+from .safety import analyzer
+from .scheduler import PRIORITY_GRADING, PRIORITY_SCRATCH, ExecutionScheduler
+from .worker_pool import WORKER_SCRIPT, WorkerError, WorkerPool
+from ..metrics import metrics
+
 logger = logging.getLogger(__name__)
 
 class CodeExecutionError(Exception):
@@ -19,63 +31,489 @@ class CodeExecutionError(Exception):
     pass
 
 class CodeExecutor:
-    def __init__(self, timeout: int = 10, memory_limit_mb: int = 100):
+    def __init__(self, timeout: int = 10, memory_limit_mb: int = 100, pool_size: int = 0,
+                 max_jobs_per_worker: int = 100, cpu_time_limit: Optional[float] = None,
+                 max_processes: Optional[int] = 0, cgroup_root: Optional[str] = None,
+                 max_output_bytes: int = 1024 * 1024, max_concurrency: Optional[int] = None,
+                 max_queue: int = 100, max_queued_per_user: int = 5, cache_size: int = 1024,
+                 cache_ttl: float = 3600.0, cache_redis_url: Optional[str] = None, remote: bool = False,
+                 remote_timeout: float = 30.0, remote_max_pending: int = 1000):
+        """
+        Args:
+            timeout: Seconds a program may run (wall clock)
+            memory_limit_mb: Address space limit for the sandbox interpreter
+            pool_size: Warm sandbox workers to keep; 0 spawns a fresh
+                interpreter for every run
+            max_jobs_per_worker: Runs a warm worker handles before it is replaced
+            cpu_time_limit: CPU seconds a program may use (defaults to timeout)
+            max_processes: RLIMIT_NPROC for the sandbox; 0 blocks fork and threads
+            cgroup_root: Delegated cgroup v2 directory for per-run scopes
+            max_output_bytes: Bytes kept per output stream; a program that
+                prints more is stopped and its output truncated
+            max_concurrency: Programs running at once (defaults to the CPU count)
+            max_queue: Programs waiting for a slot at once before requests are shed
+            max_queued_per_user: Programs one user may have waiting
+            cache_size: Results of deterministic runs kept in memory; 0 disables the cache
+            cache_ttl: Seconds a cached result is served
+            cache_redis_url: Redis URL for a result cache shared between instances
+            remote: Run programs on executor workers behind the job queue
+                (see remote.py) instead of in local sandboxes; streamed runs
+                stay local
+            remote_timeout: Seconds a remote job may wait for a worker, on
+                top of the time it may run
+            remote_max_pending: Remote jobs waiting at once before requests are shed
+        """
         self.timeout = timeout
         self.memory_limit_mb = memory_limit_mb
-
-    async def execute_python_code(self, code: str, input_data: str = "", language: str = "python") -> Dict[str, Any]:
+        self.limits = ResourceLimits(
+            memory_mb=memory_limit_mb,
+            cpu_seconds=cpu_time_limit if cpu_time_limit is not None else timeout,
+            max_processes=max_processes,
+            max_output_bytes=max_output_bytes,
+        )
+        self.cgroups = CgroupManager(cgroup_root) if cgroup_root else None
+        self.pool = WorkerPool(
+            pool_size, max_jobs_per_worker=max_jobs_per_worker, limits=self.limits, cgroups=self.cgroups
+        ) if pool_size > 0 else None
+        self.scheduler = ExecutionScheduler(
+            max_concurrency=max_concurrency, max_queue=max_queue, max_queued_per_user=max_queued_per_user
+        )
+        self.cache = ResultCache(
+            max_entries=cache_size, ttl=cache_ttl, redis_url=cache_redis_url
+        ) if cache_size > 0 else None
+        self.remote = RemoteExecutor(max_pending=remote_max_pending) if remote else None
+        self.remote_timeout = remote_timeout
+        # run_id -> (user_id, task) for streamed runs, so they can be cancelled
+        self._streams: Dict[str, Tuple[str, asyncio.Task]] = {}
+        self._latency = metrics.latency("code_execution_seconds")
+        metrics.register_source("code_executor", self.get_stats)
+
+    async def start(self):
+        """Warm up the worker pool and start reading remote results, as configured"""
+        if self.pool is not None:
+            await self.pool.start()
+        if self.remote is not None:
+            await self.remote.start()
+
+    async def close(self):
+        """Stop the worker pool and remote client and close the result cache"""
+        if self.pool is not None:
+            await self.pool.close()
+        if self.remote is not None:
+            await self.remote.close()
+        if self.cache is not None:
+            await self.cache.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get latency for the pool and spawn paths and pool occupancy"""
+        return {
+            "mode": "remote" if self.remote is not None else "pool" if self.pool is not None else "spawn",
+            "limits": self.limits.to_worker(),
+            "cgroups": self.cgroups is not None and self.cgroups.available,
+            "pool": self.pool.get_stats() if self.pool is not None else None,
+            "scheduler": self.scheduler.get_stats(),
+            "cache": self.cache.get_stats() if self.cache is not None else None,
+            "streams": len(self._streams),
+            "safety": analyzer.get_stats(),
+            "remote": self.remote.get_stats() if self.remote is not None else None,
+            "latency": {
+                "pool": self._latency.summary(path="pool"),
+                "spawn": self._latency.summary(path="spawn"),
+                "grade": self._latency.summary(path="grade"),
+            },
+        }
+
+    async def execute_python_code(self, code: str, input_data: str = "", language: str = "python",
+                                  user_id: str = "anonymous", priority: str = PRIORITY_SCRATCH) -> Dict[str, Any]:
         """
         Execute Python code in a secure sandbox environment
 
+        Identical earlier runs of a deterministic program are served from the
+        result cache. Other runs wait for a slot from the scheduler, queued
+        fairly against other users' runs, or in remote mode are sent to an
+        executor worker, whose scheduler queues them.
+
         Args:
             code: Python code to execute
             input_data: Input data to provide to the code
             language: Programming language (currently only supports Python)
+            user_id: User the run is for, for fair queuing
+            priority: PRIORITY_GRADING or PRIORITY_SCRATCH
 
         Returns:
-            Dictionary with execution results
+            Dictionary with execution results; besides execution_time (the
+            run, including sandbox startup) and queue_time (waiting for a
+            slot) it reports the program's wall_time, cpu_time and
+            peak_rss_kb (None when the sandbox was killed before reporting),
+            limit_exceeded ("cpu", "memory", "output", "timeout" or None),
+            truncated (output was cut at max_output_bytes per stream) and
+            cached (served from the result cache)
+
+        Raises:
+            CodeExecutionError: If the language is unsupported or the code is blocked
+            SchedulerOverloaded: If the run could not be queued
         """
-        if language.lower() != "python":
-            raise CodeExecutionError(f"Language {language} not supported. Only Python is supported.")
+        await self._validate(code, language)
+
+        queued_at = time.time()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = ResultCache.make_key(code, input_data, self._cache_scope())
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                cached.update(execution_time=time.time() - queued_at, queue_time=0.0, cached=True)
+                return cached
+
+        if self.remote is not None:
+            result = await self._execute_remote(code, input_data, user_id, priority)
+        else:
+            async with self.scheduler.slot(user_id, priority):
+                start_time = time.time()
+                if self.pool is not None:
+                    result = await self._execute_on_pool(code, input_data, start_time)
+                else:
+                    result = await self._execute_spawned(code, input_data, start_time)
+            result["queue_time"] = start_time - queued_at
+            result["cached"] = False
+
+        if cache_key is not None:
+            await self.cache.put(cache_key, code, result)
+        return result
+
+    async def stream_python_code(self, code: str, input_data: str = "", language: str = "python",
+                                 user_id: str = "anonymous",
+                                 priority: str = PRIORITY_SCRATCH) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Execute Python code and yield its output as it is produced
 
+        Streamed runs always use a fresh sandbox interpreter with line-buffered
+        stdout, since a warm worker only returns output when the program has
+        finished. Events:
+
+        - {"event": "started", "run_id", "queue_time", "cached"} once the run
+          holds a slot (or was found in the result cache); run_id is what
+          cancel_stream() takes
+        - {"event": "stdout" | "stderr", "data"} for output; chunks that
+          arrive while the consumer is busy are merged
+        - {"event": "result", "data"} last, with the document
+          execute_python_code() returns; status is "cancelled" if the run was
+          cancelled
+
+        Closing the generator early (the client went away) kills the program.
+        Errors are raised before the first event.
+
+        Args:
+            code: Python code to execute
+            input_data: Input data to provide to the code
+            language: Programming language (currently only supports Python)
+            user_id: User the run is for, for fair queuing and cancellation
+            priority: PRIORITY_GRADING or PRIORITY_SCRATCH
+
+        Raises:
+            CodeExecutionError: If the language is unsupported or the code is blocked
+            SchedulerOverloaded: If the run could not be queued
+        """
+        await self._validate(code, language)
+        run_id = uuid.uuid4().hex
+
+        queued_at = time.time()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = ResultCache.make_key(code, input_data, self._cache_scope())
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                cached.update(execution_time=time.time() - queued_at, queue_time=0.0, cached=True)
+                yield {"event": "started", "run_id": run_id, "queue_time": 0.0, "cached": True}
+                for stream, key in (("stdout", "output"), ("stderr", "errors")):
+                    if cached[key]:
+                        yield {"event": stream, "data": cached[key]}
+                yield {"event": "result", "data": cached}
+                return
+
+        # Output not yet yielded, as [stream, text] in arrival order
+        pending: List[List[str]] = []
+        ready = asyncio.Event()
+        # Chunks are cut at arbitrary byte offsets, so decode incrementally
+        decoders = {stream: codecs.getincrementaldecoder("utf-8")("replace") for stream in ("stdout", "stderr")}
+        received = {"stdout": [], "stderr": []}
+
+        def on_output(stream: str, chunk: bytes):
+            text = decoders[stream].decode(chunk)
+            if not text:
+                return
+            received[stream].append(text)
+            if pending and pending[-1][0] == stream:
+                pending[-1][1] += text
+            else:
+                pending.append([stream, text])
+            ready.set()
+
+        def take_pending() -> List[Dict[str, Any]]:
+            taken = [{"event": stream, "data": text} for stream, text in pending]
+            pending.clear()
+            ready.clear()
+            return taken
+
+        async with self.scheduler.slot(user_id, priority):
+            start_time = time.time()
+            task = asyncio.ensure_future(self._execute_spawned(code, input_data, start_time, on_output=on_output))
+            self._streams[run_id] = (user_id, task)
+            try:
+                yield {"event": "started", "run_id": run_id, "queue_time": start_time - queued_at, "cached": False}
+                while not task.done():
+                    waiter = asyncio.ensure_future(ready.wait())
+                    await asyncio.wait({waiter, task}, return_when=asyncio.FIRST_COMPLETED)
+                    waiter.cancel()
+                    for event in take_pending():
+                        yield event
+                for event in take_pending():
+                    yield event
+            finally:
+                self._streams.pop(run_id, None)
+                if not task.done():
+                    # The consumer went away: kill the program before giving up the slot
+                    task.cancel()
+                    await asyncio.wait({task})
+
+        if task.cancelled():
+            wall_time = time.time() - start_time
+            result = {
+                "output": "".join(received["stdout"]),
+                "errors": "".join(received["stderr"]) + "Execution cancelled",
+                "status": "cancelled",
+                "execution_time": wall_time,
+                "return_code": -1,
+                **self._usage(None, wall_time)
+            }
+        else:
+            result = task.result()
+        result["queue_time"] = start_time - queued_at
+        result["cached"] = False
+
+        if cache_key is not None:
+            await self.cache.put(cache_key, code, result)
+        yield {"event": "result", "data": result}
+
+    def cancel_stream(self, run_id: str, user_id: str) -> bool:
+        """
+        Cancel a streamed run; the stream then ends with a "cancelled" result
+
+        Args:
+            run_id: run_id from the stream's "started" event
+            user_id: User cancelling; must be the user the run is for
+
+        Returns:
+            Whether a running program was cancelled
+        """
+        entry = self._streams.get(run_id)
+        if entry is None or entry[0] != user_id:
+            return False
+        return entry[1].cancel()
+
+    async def grade_python_code(self, code: str, test_cases: List[Dict[str, Any]], user_id: str = "anonymous",
+                                priority: str = PRIORITY_GRADING,
+                                case_timeout: float = DEFAULT_CASE_TIMEOUT) -> Dict[str, Any]:
+        """
+        Grade a program against test cases in a single sandbox
+
+        The program is compiled (and, for function cases, loaded) once, then
+        every case runs with its own stdin, output capture, timeout and CPU
+        limit, so grading costs about one execution rather than one per case.
+        See grading.py for the test case format.
+
+        Args:
+            code: Python code to grade
+            test_cases: Test cases to run
+            user_id: User the run is for, for fair queuing
+            priority: PRIORITY_GRADING or PRIORITY_SCRATCH
+            case_timeout: Seconds for cases that do not set a timeout; no case
+                may run longer than the executor's timeout
+
+        Returns:
+            Dictionary with passed, total, score (0-100), error (why cases
+            could not run, or None), cases (name, passed, status, expected,
+            actual, output, errors, wall_time, cpu_time and limit_exceeded
+            per case), execution_time, queue_time, cpu_time and peak_rss_kb
+
+        Raises:
+            CodeExecutionError: If the code is blocked or the test cases are malformed
+            SchedulerOverloaded: If the run could not be queued
+        """
+        await self._validate(code, "python")
+        try:
+            cases = normalize_cases(test_cases, default_timeout=case_timeout, max_timeout=self.timeout)
+        except ValueError as e:
+            raise CodeExecutionError(f"Invalid test cases: {str(e)}")
+        # Every case may use its whole timeout, plus loading the program once
+        timeout = self.timeout + sum(case["timeout"] for case in cases)
+
+        if self.remote is not None:
+            return await self._grade_remote(code, cases, user_id, priority, timeout)
+
+        queued_at = time.time()
+        async with self.scheduler.slot(user_id, priority):
+            start_time = time.time()
+            try:
+                if self.pool is not None:
+                    raw = await self.pool.run(code, timeout=timeout, cases=cases)
+                else:
+                    raw = await self._grade_spawned(code, cases, timeout)
+            except asyncio.TimeoutError:
+                raw = {"error": f"Grading exceeded {timeout:.0f} second timeout"}
+            except Exception as e:
+                logger.error(f"Error grading code: {str(e)}")
+                raw = {"error": "Grading failed: the sandbox process exited unexpectedly"}
+            finally:
+                self._latency.observe(time.time() - start_time, path="grade")
+
+        report = build_report(cases, raw)
+        report.update(
+            execution_time=time.time() - start_time,
+            queue_time=start_time - queued_at,
+            cpu_time=raw.get("cpu_time"),
+            peak_rss_kb=raw.get("peak_rss_kb"),
+        )
+        return report
+
+    async def _execute_remote(self, code: str, input_data: str, user_id: str, priority: str) -> Dict[str, Any]:
+        """
+        Execute code on an executor worker
+
+        Returns:
+            The worker's execution result, or an error result if no worker
+            answered in time
+
+        Raises:
+            CodeExecutionError: If the worker refused the code
+            SchedulerOverloaded: If the job was shed here or by the worker
+        """
         start_time = time.time()
+        job = {"code": code, "input_data": input_data, "priority": priority}
+        try:
+            return await self.remote.submit("execute", job, user_id, timeout=self.timeout + self.remote_timeout)
+        except asyncio.TimeoutError:
+            errors = "Execution timed out"
+            limit_exceeded = "timeout"
+        except RemoteExecutionError as e:
+            if e.error_type == "CodeExecutionError":
+                raise CodeExecutionError(str(e))
+            logger.error(f"Remote execution failed: {str(e)}")
+            errors = "Execution failed: no executor worker could run the program"
+            limit_exceeded = None
+        wall_time = time.time() - start_time
+        return {
+            "output": "",
+            "errors": errors,
+            "status": "error",
+            "execution_time": wall_time,
+            "return_code": -1,
+            "queue_time": 0.0,
+            "cached": False,
+            **self._usage(None, wall_time, limit_exceeded=limit_exceeded)
+        }
+
+    async def _grade_remote(self, code: str, cases: List[Dict[str, Any]], user_id: str, priority: str,
+                            timeout: float) -> Dict[str, Any]:
+        """
+        Grade code on an executor worker
+
+        Returns:
+            The worker's grading report, or a report with every case failed
+            if no worker answered in time
 
-        # Validate code for dangerous operations
-        if self._contains_dangerous_operations(code):
-            raise CodeExecutionError("Code contains potentially dangerous operations and was blocked.")
+        Raises:
+            CodeExecutionError: If the worker refused the code
+            SchedulerOverloaded: If the job was shed here or by the worker
+        """
+        start_time = time.time()
+        job = {"code": code, "test_cases": cases, "priority": priority}
+        try:
+            return await self.remote.submit("grade", job, user_id, timeout=timeout + self.remote_timeout)
+        except asyncio.TimeoutError:
+            raw = {"error": f"Grading exceeded {timeout:.0f} second timeout"}
+        except RemoteExecutionError as e:
+            if e.error_type == "CodeExecutionError":
+                raise CodeExecutionError(str(e))
+            logger.error(f"Remote grading failed: {str(e)}")
+            raw = {"error": "Grading failed: no executor worker could run the program"}
+        report = build_report(cases, raw)
+        report.update(execution_time=time.time() - start_time, queue_time=0.0, cpu_time=None, peak_rss_kb=None)
+        return report
+
+    async def _grade_spawned(self, code: str, cases: List[Dict[str, Any]], timeout: float) -> Dict[str, Any]:
+        """
+        Grade code in a fresh sandbox interpreter
 
+        Returns:
+            What the sandbox reported (see build_report)
+        """
+        result, usage = await self._run_code_with_timeout(code, json.dumps(cases), mode="grade", timeout=timeout)
+        if result.returncode != 0 or usage["truncated"]:
+            # Killed mid-run (memory, CPU ignoring SIGXCPU) or a report over the budget
+            limit = usage["limit_exceeded"]
+            return {"error": f"The grading run was stopped ({limit} limit exceeded)" if limit
+                    else "Grading failed: the sandbox process exited unexpectedly",
+                    "cpu_time": usage["cpu_time"], "peak_rss_kb": usage["peak_rss_kb"]}
         try:
-            # Create a temporary file for the code
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as temp_file:
-                temp_file.write(code)
-                temp_file_path = temp_file.name
-
-            # Create a temporary file for input data
-            input_file_path = None
-            if input_data:
-                with tempfile.NamedTemporaryFile(mode='w', delete=False) as input_file:
-                    input_file.write(input_data)
-                    input_file_path = input_file.name
+            raw = json.loads(result.stdout)
+        except ValueError:
+            return {"error": "Grading failed: the sandbox sent an unreadable report"}
+        # Prefer the cgroup's accounting when there is one
+        raw.update(cpu_time=usage["cpu_time"], peak_rss_kb=usage["peak_rss_kb"])
+        return raw
+
+    async def _validate(self, code: str, language: str):
+        """
+        Raises:
+            CodeExecutionError: If the language is unsupported or the code is blocked
+        """
+        if language.lower() != "python":
+            raise CodeExecutionError(f"Language {language} not supported. Only Python is supported.")
 
-            try:
-                # Execute the code with timeout and resource limits
-                result = await self._run_code_with_timeout(temp_file_path, input_file_path)
+        # Validate code for dangerous operations (memoized; a large first parse runs off the event loop)
+        verdict = await analyzer.analyze_async(code)
+        if not verdict.allowed:
+            violations = "; ".join(verdict.violations)
+            logger.warning(f"Dangerous operations detected: {violations}")
+            raise CodeExecutionError(f"Code contains potentially dangerous operations and was blocked: {violations}")
+
+    def _cache_scope(self) -> Dict[str, Any]:
+        """Executor settings that can change a program's result"""
+        return {**self.limits.to_worker(), "timeout": self.timeout}
 
-                execution_time = time.time() - start_time
+    async def _execute_spawned(self, code: str, input_data: str, start_time: float,
+                               on_output: Optional[Callable[[str, bytes], None]] = None) -> Dict[str, Any]:
+        """
+        Execute code in a fresh sandbox interpreter
 
-                return {
-                    "output": result.stdout,
-                    "errors": result.stderr,
-                    "status": "success" if result.returncode == 0 else "error",
-                    "execution_time": execution_time,
-                    "return_code": result.returncode
-                }
+        Args:
+            code: Python code to execute
+            input_data: Input data to provide to the code
+            start_time: When the run got its slot, for execution_time
+            on_output: Called with ("stdout" or "stderr", chunk) as output arrives
 
+        Returns:
+            Dictionary with execution results
+        """
+        try:
+            # Source and stdin go straight through a memfd/pipe and stdin, no temp files
+            try:
+                result, usage = await self._run_code_with_timeout(
+                    code, input_data, on_output, mode="stream" if on_output is not None else "run"
+                )
             finally:
-                # Clean up temporary files
-                os.unlink(temp_file_path)
-                if input_file_path:
-                    os.unlink(input_file_path)
+                self._latency.observe(time.time() - start_time, path="spawn")
+
+            execution_time = time.time() - start_time
+
+            return {
+                "output": result.stdout,
+                "errors": result.stderr,
+                "status": "success" if result.returncode == 0 else "error",
+                "execution_time": execution_time,
+                "return_code": result.returncode,
+                **usage
+            }
 
         except asyncio.TimeoutError:
             return {
@@ -83,7 +521,8 @@ class CodeExecutor:
                 "errors": "Execution timed out",
                 "status": "error",
                 "execution_time": time.time() - start_time,
-                "return_code": -1
+                "return_code": -1,
+                **self._usage(None, time.time() - start_time, limit_exceeded="timeout")
             }
         except Exception as e:
             logger.error(f"Error executing code: {str(e)}")
@@ -92,107 +531,369 @@ class CodeExecutor:
                 "errors": str(e),
                 "status": "error",
                 "execution_time": time.time() - start_time,
-                "return_code": -1
+                "return_code": -1,
+                **self._usage(None, time.time() - start_time)
+            }
+
+    async def _execute_on_pool(self, code: str, input_data: str, start_time: float) -> Dict[str, Any]:
+        """
+        Execute code on a warm sandbox worker
+
+        Args:
+            code: Python code to execute
+            input_data: Input data to provide to the code
+            start_time: When the run got its slot, for execution_time
+
+        Returns:
+            Dictionary with execution results
+        """
+        try:
+            result = await self.pool.run(code, input_data, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return {
+                "output": "",
+                "errors": "Execution timed out",
+                "status": "error",
+                "execution_time": time.time() - start_time,
+                "return_code": -1,
+                **self._usage(None, time.time() - start_time, limit_exceeded="timeout")
+            }
+        except WorkerError as e:
+            logger.error(f"Sandbox worker failed: {str(e)}")
+            return {
+                "output": "",
+                "errors": "Execution failed: the sandbox process exited unexpectedly",
+                "status": "error",
+                "execution_time": time.time() - start_time,
+                "return_code": -1,
+                **self._usage(None, time.time() - start_time)
             }
 
-    def _contains_dangerous_operations(self, code: str) -> bool:
+        return {
+            "output": result["stdout"],
+            "errors": result["stderr"],
+            "status": "success" if result["return_code"] == 0 else "error",
+            "execution_time": time.time() - start_time,
+            "return_code": result["return_code"],
+            **self._usage(result, result["run_time"])
+        }
+
+    @staticmethod
+    def _usage(stats: Optional[Dict[str, Any]], wall_time: float,
+               limit_exceeded: Optional[str] = None) -> Dict[str, Any]:
         """
-        Check if code contains potentially dangerous operations
+        Resource accounting fields for a result
 
         Args:
-            code: Python code to check
+            stats: Usage reported by the sandbox or its cgroup, if any
+            wall_time: Wall time to report when the sandbox did not measure it
+            limit_exceeded: Limit to report when the sandbox did not
+        """
+        stats = stats or {}
+        return {
+            "wall_time": stats.get("run_time", wall_time),
+            "cpu_time": stats.get("cpu_time"),
+            "peak_rss_kb": stats.get("peak_rss_kb"),
+            "limit_exceeded": stats.get("limit_exceeded") or limit_exceeded,
+            "truncated": stats.get("truncated", False),
+        }
+
+    def _program_fd(self, source: bytes) -> Tuple[int, Optional[int]]:
+        """
+        Make the program source readable through a file descriptor
 
         Returns:
-            True if dangerous operations found, False otherwise
+            (fd to hand to the child, write end of a pipe still to be filled or None)
         """
-        dangerous_patterns = [
-            'import os', 'import sys', 'import subprocess', 'import shutil',
-            'import urllib', 'import requests', 'import http', 'import socket',
-            '__import__', 'exec(', 'eval(', 'open(', 'file(',
-            'getattr(', 'setattr(', 'delattr(', 'compile(',
-            'globals()', 'locals()', 'vars(',
-            'input(',  # Insecure input functions
-        ]
+        if hasattr(os, "memfd_create"):
+            fd = os.memfd_create("learnflow-program", os.MFD_CLOEXEC)
+            view = memoryview(source)
+            while view:
+                view = view[os.write(fd, view):]
+            os.lseek(fd, 0, os.SEEK_SET)
+            return fd, None
+        # No memfd (e.g. macOS): a pipe, filled once the child is reading
+        read_fd, write_fd = os.pipe()
+        return read_fd, write_fd
+
+    @staticmethod
+    def _write_all(fd: int, data: bytes):
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        except BrokenPipeError:
+            pass
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _read_stats(fd: int) -> Optional[Dict[str, Any]]:
+        """Read the usage report a finished sandbox wrote to its stats pipe"""
+        os.set_blocking(fd, False)
+        data = b""
+        try:
+            while True:
+                chunk = os.read(fd, 4096)
+                if not chunk:
+                    break
+                data += chunk
+        except BlockingIOError:
+            # Something the program started still holds the write end
+            pass
+        try:
+            return json.loads(data) if data else None
+        except ValueError:
+            return None
 
-        # Convert code to lowercase for comparison
-        code_lower = code.lower()
+    async def _read_bounded(self, stream: asyncio.StreamReader, on_overflow,
+                            on_chunk: Optional[Callable[[bytes], None]] = None,
+                            budget: Optional[int] = None) -> bytes:
+        """
+        Read a pipe until EOF, keeping at most max_output_bytes
 
-        for pattern in dangerous_patterns:
-            if pattern in code_lower:
-                logger.warning(f"Dangerous pattern detected: {pattern}")
-                return True
+        Args:
+            stream: Child's stdout or stderr
+            on_overflow: Called once when the budget is exceeded
+            on_chunk: Called with each chunk kept, as it arrives
+            budget: Bytes to keep instead of max_output_bytes
 
-        return False
+        Returns:
+            The output, cut at the budget
+        """
+        budget = budget or self.limits.max_output_bytes
+        chunks = []
+        size = 0
+        while True:
+            chunk = await stream.read(64 * 1024)
+            if not chunk:
+                return b"".join(chunks)
+            if budget is not None and size + len(chunk) > budget:
+                chunk = chunk[:budget - size]
+                chunks.append(chunk)
+                if on_chunk is not None and chunk:
+                    on_chunk(chunk)
+                on_overflow()
+                return b"".join(chunks)
+            chunks.append(chunk)
+            size += len(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk)
+
+    async def _collect_output(self, process: asyncio.subprocess.Process, input_bytes: bytes,
+                              on_output: Optional[Callable[[str, bytes], None]] = None,
+                              budget: Optional[int] = None) -> Tuple[bytes, bytes, bool]:
+        """
+        Feed stdin and read stdout/stderr incrementally under the output budget
+
+        Unlike communicate(), memory stays bounded by the budget: the first
+        stream to go over it kills the process.
+
+        Args:
+            process: The sandbox process
+            input_bytes: Program stdin
+            on_output: Called with ("stdout" or "stderr", chunk) as output arrives
+            budget: Bytes kept per stream, None for max_output_bytes
+
+        Returns:
+            (stdout, stderr, whether output was truncated)
+        """
+        truncated = False
+
+        def overflow():
+            nonlocal truncated
+            truncated = True
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
 
-    async def _run_code_with_timeout(self, code_file_path: str, input_file_path: Optional[str]) -> subprocess.CompletedProcess:
+        async def feed():
+            try:
+                if input_bytes:
+                    process.stdin.write(input_bytes)
+                    await process.stdin.drain()
+                process.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                # The program exited (or was killed) without reading all of stdin
+                pass
+
+        def forward(stream: str):
+            if on_output is None:
+                return None
+            return lambda chunk: on_output(stream, chunk)
+
+        stdout, stderr, _ = await asyncio.gather(
+            self._read_bounded(process.stdout, overflow, forward("stdout"), budget),
+            self._read_bounded(process.stderr, overflow, forward("stderr"), budget),
+            feed(),
+        )
+        await process.wait()
+        return stdout, stderr, truncated
+
+    async def _run_code_with_timeout(self, code: str, input_data: str,
+                                     on_output: Optional[Callable[[str, bytes], None]] = None,
+                                     mode: str = "run", timeout: Optional[float] = None
+                                     ) -> Tuple[subprocess.CompletedProcess, Dict[str, Any]]:
         """
         Run Python code with timeout protection
 
+        The source is handed to a one-shot sandbox interpreter through an
+        inherited memfd (or pipe) and stdin is fed through the stdin pipe, so
+        nothing is written to the filesystem and a read-only root works. The
+        sandbox applies the executor's resource limits to itself and reports
+        its usage through a second pipe.
+
         Args:
-            code_file_path: Path to the temporary code file
-            input_file_path: Path to the input file (optional)
+            code: Python code to execute
+            input_data: Input data to provide to the code
+            on_output: Called with ("stdout" or "stderr", chunk) as output arrives
+            mode: Sandbox mode: "run", "stream" (stdout flushed after every
+                line) or "grade" (input_data is the test cases, stdout the report)
+            timeout: Seconds the sandbox may run, instead of the executor's timeout
 
         Returns:
-            CompletedProcess result
-        """
-        # Prepare the command
-        cmd = ['python', code_file_path]
-
-        # Prepare input
-        stdin_data = None
-        if input_file_path:
-            with open(input_file_path, 'r') as input_file:
-                stdin_data = input_file.read()
-
-        # Execute with timeout
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            limit=1024 * 1024  # 1MB buffer limit
-        )
+            CompletedProcess result and the resource accounting fields
+        """
+        program_fd, pending_write_fd = self._program_fd(code.encode('utf-8'))
+        stats_read_fd, stats_write_fd = os.pipe()
+        scope = self.cgroups.create_scope(self.limits) if self.cgroups is not None else None
+        limits = json.dumps(self.limits.to_worker(cgroup=scope.path if scope is not None else None))
+        cmd = [sys.executable, '-I', WORKER_SCRIPT, mode, limits, str(program_fd), str(stats_write_fd)]
+        timeout = timeout or self.timeout
+        budget = self.limits.max_output_bytes
+        if mode == "grade" and budget is not None:
+            # The report holds every case's capped output, plus JSON overhead
+            budget = 2 * budget + 64 * 1024
 
         try:
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(input=stdin_data.encode() if stdin_data else None),
-                timeout=self.timeout
-            )
-        except asyncio.TimeoutError:
-            # Terminate the process if it times out
             try:
-                process.kill()
-            except ProcessLookupError:
-                pass  # Process already terminated
-            raise asyncio.TimeoutError(f"Code execution exceeded {self.timeout} second timeout")
+                # Execute with timeout
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    pass_fds=(program_fd, stats_write_fd),
+                    # Neutral working directory: the parser reads SyntaxError lines
+                    # from a real main.py if one exists in the cwd
+                    cwd="/",
+                    limit=1024 * 1024  # 1MB buffer limit
+                )
+            except BaseException:
+                if pending_write_fd is not None:
+                    os.close(pending_write_fd)
+                raise
+            finally:
+                os.close(program_fd)
+                os.close(stats_write_fd)
+
+            if pending_write_fd is not None:
+                asyncio.get_running_loop().run_in_executor(None, self._write_all, pending_write_fd, code.encode('utf-8'))
 
-        return subprocess.CompletedProcess(
+            started = time.perf_counter()
+            try:
+                stdout, stderr, truncated = await asyncio.wait_for(
+                    self._collect_output(process, input_data.encode() if input_data else b"", on_output, budget),
+                    timeout=timeout
+                )
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                # Terminate the process if it times out or the run is cancelled
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass  # Process already terminated
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                raise asyncio.TimeoutError(f"Code execution exceeded {timeout} second timeout")
+            wall_time = time.perf_counter() - started
+
+            stats = self._read_stats(stats_read_fd)
+            if scope is not None:
+                # The cgroup also saw a sandbox the kernel killed
+                stats = {**(stats or {}), **scope.usage()}
+            if truncated:
+                stats = {**(stats or {}), "truncated": True, "limit_exceeded": "output"}
+            elif process.returncode in (-signal.SIGKILL, -signal.SIGXCPU) and not (stats or {}).get("limit_exceeded"):
+                # Killed by the hard RLIMIT_CPU after ignoring SIGXCPU
+                stats = {**(stats or {}), "limit_exceeded": "cpu"}
+        finally:
+            os.close(stats_read_fd)
+            if scope is not None:
+                scope.remove()
+
+        result = subprocess.CompletedProcess(
             args=cmd,
             returncode=process.returncode,
-            stdout=stdout.decode('utf-8'),
-            stderr=stderr.decode('utf-8')
+            # A budget cut can split a multi-byte character
+            stdout=stdout.decode('utf-8', errors='replace'),
+            stderr=stderr.decode('utf-8', errors='replace')
         )
+        return result, self._usage(stats, wall_time)
 
-    async def execute_multiple_codes(self, codes: List[str]) -> List[Dict[str, Any]]:
+    async def execute_multiple_codes(self, codes: List[str], user_id: str = "anonymous",
+                                     priority: str = PRIORITY_SCRATCH) -> List[Dict[str, Any]]:
         """
-        Execute multiple code snippets sequentially
+        Execute multiple code snippets concurrently, as far as the scheduler allows
 
         Args:
             codes: List of code snippets to execute
+            user_id: User the runs are for
+            priority: Priority class for every run
 
         Returns:
-            List of execution results
+            List of execution results, in the order of codes
         """
-        results = []
-        for code in codes:
-            result = await self.execute_python_code(code)
-            results.append(result)
-        return results
+        # Submit no more than the user may queue, so the batch does not shed itself
+        submitting = asyncio.Semaphore(self.scheduler.max_queued_per_user)
+
+        async def run(code: str) -> Dict[str, Any]:
+            async with submitting:
+                return await self.execute_python_code(code, user_id=user_id, priority=priority)
+
+        return list(await asyncio.gather(*(run(code) for code in codes)))
+
+def executor_from_env(mode: Optional[str] = None) -> CodeExecutor:
+    """
+    Create an executor configured from CODE_EXECUTOR_* environment variables
+
+    Args:
+        mode: "local" or "remote" (defaults to CODE_EXECUTOR_MODE); execution
+            workers always pass "local"
+
+    Returns:
+        The configured CodeExecutor
+    """
+    mode = mode or os.getenv("CODE_EXECUTOR_MODE", "local")
+    if mode not in ("local", "remote"):
+        raise ValueError(f"Unknown code executor mode: {mode}")
+    return CodeExecutor(
+        timeout=10,
+        memory_limit_mb=int(os.getenv("CODE_EXECUTOR_MEMORY_LIMIT_MB", "100")),
+        pool_size=int(os.getenv("CODE_EXECUTOR_POOL_SIZE", "0")),
+        max_jobs_per_worker=int(os.getenv("CODE_EXECUTOR_MAX_JOBS_PER_WORKER", "100")),
+        cpu_time_limit=float(os.getenv("CODE_EXECUTOR_CPU_TIME_LIMIT", "5")),
+        cgroup_root=os.getenv("CODE_EXECUTOR_CGROUP_ROOT") or None,
+        max_output_bytes=int(os.getenv("CODE_EXECUTOR_MAX_OUTPUT_KB", "1024")) * 1024,
+        max_concurrency=int(os.getenv("CODE_EXECUTOR_MAX_CONCURRENCY", "0")) or None,
+        max_queue=int(os.getenv("CODE_EXECUTOR_MAX_QUEUE", "100")),
+        max_queued_per_user=int(os.getenv("CODE_EXECUTOR_MAX_QUEUED_PER_USER", "5")),
+        cache_size=int(os.getenv("CODE_EXECUTOR_CACHE_SIZE", "1024")),
+        cache_ttl=float(os.getenv("CODE_EXECUTOR_CACHE_TTL", "3600")),
+        cache_redis_url=os.getenv("CODE_EXECUTOR_CACHE_REDIS_URL") or None,
+        remote=mode == "remote",
+        remote_timeout=float(os.getenv("CODE_EXECUTOR_REMOTE_TIMEOUT", "30"))
+    )
+
 
 # Global executor instance
-executor = CodeExecutor(timeout=10, memory_limit_mb=100)
+executor = executor_from_env()
+
+# Execution worker started by start_code_executor, if any
+_local_worker: Optional[asyncio.Task] = None
 
-async def execute_code(code: str, input_data: str = "", language: str = "python") -> Dict[str, Any]:
+async def execute_code(code: str, input_data: str = "", language: str = "python", user_id: str = "anonymous",
+                       priority: str = PRIORITY_SCRATCH) -> Dict[str, Any]:
     """
     Convenience function to execute code using the global executor
 
@@ -200,8 +901,83 @@ async def execute_code(code: str, input_data: str = "", language: str = "python"
         code: Code to execute
         input_data: Input data for the code
         language: Programming language
+        user_id: User the run is for, for fair queuing
+        priority: PRIORITY_GRADING or PRIORITY_SCRATCH
 
     Returns:
         Execution results
     """
-    return await executor.execute_python_code(code, input_data, language)
\ No newline at end of file
+    return await executor.execute_python_code(code, input_data, language, user_id=user_id, priority=priority)
+
+
+def stream_code(code: str, input_data: str = "", language: str = "python", user_id: str = "anonymous",
+                priority: str = PRIORITY_SCRATCH) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Convenience function to stream a run's output using the global executor
+
+    Returns:
+        Async iterator of the events described in CodeExecutor.stream_python_code
+    """
+    return executor.stream_python_code(code, input_data, language, user_id=user_id, priority=priority)
+
+
+def cancel_code_stream(run_id: str, user_id: str) -> bool:
+    """
+    Convenience function to cancel a streamed run on the global executor
+
+    Returns:
+        Whether a running program was cancelled
+    """
+    return executor.cancel_stream(run_id, user_id)
+
+
+async def grade_code(code: str, test_cases: List[Dict[str, Any]], user_id: str = "anonymous",
+                     priority: str = PRIORITY_GRADING) -> Dict[str, Any]:
+    """
+    Convenience function to grade code against test cases using the global executor
+
+    Args:
+        code: Code to grade
+        test_cases: Test cases, as described in grading.py
+        user_id: User the run is for, for fair queuing
+        priority: PRIORITY_GRADING or PRIORITY_SCRATCH
+
+    Returns:
+        Grading report
+    """
+    return await executor.grade_python_code(code, test_cases, user_id=user_id, priority=priority)
+
+
+async def start_code_executor():
+    """
+    Warm up the global executor's worker pool
+
+    In remote mode with CODE_EXECUTOR_RUN_WORKER=true this process also runs
+    an execution worker, e.g. with EVENT_BUS=memory, where no other process
+    can reach the job queue.
+    """
+    global _local_worker
+    await executor.start()
+    if executor.remote is not None and os.getenv("CODE_EXECUTOR_RUN_WORKER", "false").lower() == "true":
+        from .remote import run_execution_worker
+        worker_executor = executor_from_env(mode="local")
+        # The worker's executor reports under "execution_worker"; keep this one as "code_executor"
+        metrics.register_source("code_executor", executor.get_stats)
+        _local_worker = asyncio.get_running_loop().create_task(run_execution_worker(worker_executor))
+
+
+async def close_code_executor():
+    """
+    Stop the global executor's worker pool, the execution worker, if any, and
+    the safety analyzer's worker processes
+    """
+    global _local_worker
+    if _local_worker is not None:
+        _local_worker.cancel()
+        try:
+            await _local_worker
+        except asyncio.CancelledError:
+            pass
+        _local_worker = None
+    await executor.close()
+    analyzer.shutdown()
@@ -0,0 +1,150 @@
+"""
+Exercise Grading for LearnFlow
+Test case definitions and pass/fail reports for grading runs
+
+A grading run loads the student's program once in one sandbox and runs every
+test case against it (see sandbox_worker.py). A test case is a dict of one of
+two kinds:
+
+- Program cases run the whole program with their own stdin:
+  {"input": "4\n", "expected_output": "even"}
+- Function cases call a function the program defines:
+  {"call": "greet", "args": ["Bob"], "expected": "Hello, Bob!"}
+
+Either kind may also carry "name" and "timeout" (seconds). Prompts passed to
+input() are not echoed while grading, so they never count as output. Outputs
+are compared line by line, ignoring trailing whitespace and trailing blank
+lines; return values are compared as JSON values.
+"""
+from typing import Any, Dict, List, Optional
+
+# Seconds a test case may run when it does not say
+DEFAULT_CASE_TIMEOUT = 2.0
+
+# Most test cases one grading run accepts
+MAX_TEST_CASES = 100
+
+
+def normalize_cases(test_cases: List[Dict[str, Any]], default_timeout: float = DEFAULT_CASE_TIMEOUT,
+                    max_timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Validate test cases and fill in names and timeouts
+
+    Args:
+        test_cases: Test cases as described in the module docstring
+        default_timeout: Timeout for cases that do not set one
+        max_timeout: Upper bound for any case's timeout
+
+    Returns:
+        The cases as sent to the sandbox
+
+    Raises:
+        ValueError: If a case is malformed or there are too many
+    """
+    if not test_cases:
+        raise ValueError("At least one test case is required")
+    if len(test_cases) > MAX_TEST_CASES:
+        raise ValueError(f"At most {MAX_TEST_CASES} test cases are allowed")
+
+    cases = []
+    for index, case in enumerate(test_cases):
+        if not isinstance(case, dict):
+            raise ValueError(f"Test case {index} is not an object")
+        timeout = float(case.get("timeout") or default_timeout)
+        if max_timeout is not None:
+            timeout = min(timeout, max_timeout)
+        normalized = {
+            "name": str(case.get("name") or f"case {index + 1}"),
+            "input": str(case.get("input", "")),
+            "timeout": timeout,
+        }
+        if case.get("call") is not None:
+            if "expected" not in case:
+                raise ValueError(f"Test case {index} calls a function but has no 'expected' value")
+            normalized.update(call=str(case["call"]), args=list(case.get("args", [])),
+                              kwargs=dict(case.get("kwargs", {})), expected=case["expected"])
+        elif "expected_output" in case:
+            normalized["expected_output"] = str(case["expected_output"])
+        else:
+            raise ValueError(f"Test case {index} needs 'expected_output' or 'call' and 'expected'")
+        cases.append(normalized)
+    return cases
+
+
+def normalize_output(text: str) -> str:
+    """Drop trailing whitespace per line and trailing blank lines"""
+    lines = text.replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).rstrip("\n")
+
+
+def _case_report(case: Dict[str, Any], result: Optional[Dict[str, Any]], error: str) -> Dict[str, Any]:
+    expected = case["expected"] if "call" in case else case["expected_output"]
+    if result is None:
+        return {
+            "name": case["name"],
+            "passed": False,
+            "status": "error",
+            "expected": expected,
+            "actual": None,
+            "output": "",
+            "errors": error,
+            "wall_time": None,
+            "cpu_time": None,
+            "limit_exceeded": None,
+        }
+
+    if result["return_code"] != 0:
+        status = result["limit_exceeded"] or "error"
+        passed = False
+        actual = None
+    elif "call" in case:
+        actual = result["return_value"]
+        # True == 1 in Python, but a bool is not an acceptable number here (nor the reverse)
+        passed = actual == expected and isinstance(actual, bool) == isinstance(expected, bool)
+        status = "passed" if passed else "failed"
+    else:
+        actual = normalize_output(result["stdout"])
+        passed = actual == normalize_output(expected)
+        status = "passed" if passed else "failed"
+
+    return {
+        "name": case["name"],
+        "passed": passed,
+        "status": status,
+        "expected": expected,
+        "actual": actual,
+        "output": result["stdout"],
+        "errors": result["stderr"],
+        "wall_time": result["run_time"],
+        "cpu_time": result["cpu_time"],
+        "limit_exceeded": result["limit_exceeded"],
+    }
+
+
+def build_report(cases: List[Dict[str, Any]], raw: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compare a grading run's results with the expected ones
+
+    Args:
+        cases: Cases as returned by normalize_cases
+        raw: What the sandbox reported: "cases" with one result per case it
+            ran, or "error" if it could not run them all
+
+    Returns:
+        Dict with passed, total, score (0-100), error and one report per case
+    """
+    results = raw.get("cases") or []
+    error = raw.get("error") or ""
+    reports = [
+        _case_report(case, results[index] if index < len(results) else None,
+                     error or "The grading run stopped before this case")
+        for index, case in enumerate(cases)
+    ]
+    passed = sum(report["passed"] for report in reports)
+    return {
+        "passed": passed,
+        "total": len(cases),
+        "score": round(100 * passed / len(cases)) if cases else 0,
+        "error": error or None,
+        "cases": reports,
+    }
@@ -0,0 +1,185 @@
+"""
+Sandbox Resource Limits for LearnFlow
+Per-run memory, CPU and process limits, and optional cgroup v2 scopes for accounting
+
+ResourceLimits describes what one sandboxed interpreter may use. The limits
+are applied by the sandbox interpreter to itself (see sandbox_worker.py)
+before any student code runs, so nothing has to happen between fork and exec
+in the backend process:
+
+- RLIMIT_AS caps the address space at memory_mb; allocations past it raise
+  MemoryError in the program.
+- RLIMIT_CPU delivers SIGXCPU after cpu_seconds of CPU time, which the sandbox
+  turns into a "CPU time limit exceeded" error; the hard limit one second
+  later kills the process if the program ignores it.
+- RLIMIT_NPROC counts every task owned by the sandbox's user, so 0 blocks
+  fork() and new threads. The kernel does not enforce it for root.
+- max_output_bytes caps stdout and stderr separately. Output past it is
+  dropped and the program is stopped, so a print loop cannot fill memory.
+
+When CODE_EXECUTOR_CGROUP_ROOT points at a delegated cgroup v2 directory, each
+run (or warm worker) also gets its own child cgroup with memory.max and
+pids.max set. The kernel then enforces resident memory rather than address
+space, and cpu.stat / memory.peak give exact accounting.
+"""
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceLimits:
+    def __init__(self, memory_mb: Optional[int] = 100, cpu_seconds: Optional[float] = None,
+                 max_processes: Optional[int] = 0, max_output_bytes: Optional[int] = 1024 * 1024):
+        """
+        Args:
+            memory_mb: Address space cap for the sandbox interpreter, None for no cap
+            cpu_seconds: CPU time a program may use, None for no cap
+            max_processes: RLIMIT_NPROC for the sandbox, None to leave it unset
+            max_output_bytes: Bytes kept per output stream, None for no cap
+        """
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.max_processes = max_processes
+        self.max_output_bytes = max_output_bytes
+
+    @property
+    def memory_bytes(self) -> Optional[int]:
+        return self.memory_mb * 1024 * 1024 if self.memory_mb else None
+
+    def to_worker(self, cgroup: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Limits in the form sandbox_worker.py expects on its command line
+
+        Args:
+            cgroup: Cgroup directory the sandbox should move itself into
+        """
+        return {
+            "memory_bytes": self.memory_bytes,
+            "cpu_seconds": self.cpu_seconds,
+            "max_processes": self.max_processes,
+            "max_output_bytes": self.max_output_bytes,
+            "cgroup": cgroup,
+        }
+
+
+class CgroupScope:
+    """A cgroup v2 directory holding one sandbox interpreter"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read(self, name: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, name)) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def usage(self) -> Dict[str, Any]:
+        """CPU time and peak memory of everything that ran in the scope"""
+        usage: Dict[str, Any] = {}
+        cpu_stat = self._read("cpu.stat")
+        if cpu_stat:
+            for line in cpu_stat.splitlines():
+                name, _, value = line.partition(" ")
+                if name == "usage_usec":
+                    usage["cpu_time"] = int(value) / 1_000_000
+        # memory.peak needs Linux 5.19
+        peak = self._read("memory.peak")
+        if peak and peak.strip().isdigit():
+            usage["peak_rss_kb"] = int(peak) // 1024
+        events = dict(line.split(" ", 1) for line in (self._read("memory.events") or "").splitlines())
+        if int(events.get("oom_kill", 0)) > 0:
+            usage["limit_exceeded"] = "memory"
+        return usage
+
+    def remove(self):
+        """Kill anything left in the scope and delete it"""
+        try:
+            with open(os.path.join(self.path, "cgroup.kill"), "w") as f:
+                f.write("1")
+        except OSError:
+            pass
+        # rmdir fails with EBUSY until the killed tasks are gone
+        for _ in range(50):
+            try:
+                os.rmdir(self.path)
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                time.sleep(0.01)
+        logger.error(f"Could not remove sandbox cgroup {self.path}")
+
+
+class CgroupManager:
+    def __init__(self, root: str):
+        """
+        Args:
+            root: Delegated cgroup v2 directory, writable by the backend, that
+                holds no processes of its own
+        """
+        self.root = root
+        self._available: Optional[bool] = None
+
+    @property
+    def available(self) -> bool:
+        """Whether scopes can be created; checked (and controllers enabled) once"""
+        if self._available is None:
+            self._available = self._prepare()
+        return self._available
+
+    def _prepare(self) -> bool:
+        try:
+            with open(os.path.join(self.root, "cgroup.controllers")) as f:
+                controllers = set(f.read().split())
+            missing = {"memory", "pids"} - controllers
+            if missing:
+                logger.warning(f"Cgroup {self.root} lacks controllers {sorted(missing)}; using rlimits only")
+                return False
+            with open(os.path.join(self.root, "cgroup.subtree_control"), "w") as f:
+                f.write("+memory +pids +cpu" if "cpu" in controllers else "+memory +pids")
+            return True
+        except OSError as e:
+            logger.warning(f"Cgroup v2 root {self.root} is not usable ({str(e)}); using rlimits only")
+            return False
+
+    def create_scope(self, limits: ResourceLimits, prefix: str = "run") -> Optional[CgroupScope]:
+        """
+        Create a scope for one sandbox interpreter
+
+        Args:
+            limits: Limits to enforce in the scope
+            prefix: Directory name prefix, e.g. "run" or "worker"
+
+        Returns:
+            The scope, or None when cgroups are unavailable
+        """
+        if not self.available:
+            return None
+        scope = CgroupScope(os.path.join(self.root, f"{prefix}-{uuid.uuid4().hex[:12]}"))
+        try:
+            os.mkdir(scope.path)
+            settings = {"memory.swap.max": "0"}
+            if limits.memory_bytes:
+                settings["memory.max"] = str(limits.memory_bytes)
+            if limits.max_processes is not None:
+                # pids.max counts the interpreter itself and each of its threads
+                settings["pids.max"] = str(limits.max_processes + 1)
+            for name, value in settings.items():
+                try:
+                    with open(os.path.join(scope.path, name), "w") as f:
+                        f.write(value)
+                except FileNotFoundError:
+                    # memory.swap.max is missing when swap accounting is off
+                    if name != "memory.swap.max":
+                        raise
+        except OSError as e:
+            logger.error(f"Failed to create sandbox cgroup: {str(e)}")
+            scope.remove()
+            return None
+        return scope
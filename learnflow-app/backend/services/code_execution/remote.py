@@ -0,0 +1,357 @@
+"""
+Remote Code Execution for LearnFlow
+Runs submissions on separate executor workers behind a job queue, so execution scales apart from the API
+
+With CODE_EXECUTOR_MODE=remote the API's CodeExecutor still validates code
+and serves cached results, but hands runs and gradings to RemoteExecutor,
+which publishes them as jobs on the code-execution-jobs topic (Kafka, or the
+in-process memory bus). ExecutionWorker processes consume the topic as one
+consumer group, run each job on their own local CodeExecutor and publish the
+result on the reply topic named in the job, tagged with the job's
+correlation id. Every API instance reads the reply topic in its own consumer
+group and resolves the waiting request whose correlation id matches.
+
+A job carries a deadline; a worker drops jobs whose caller has already
+given up. When the caller times out or is cancelled, RemoteExecutor
+publishes a cancel message on the control topic, which every worker reads:
+the worker running the job kills the program, and a worker that has not
+started it yet skips it. Errors raised on the worker (blocked code, an
+overloaded scheduler) are sent back and raised again on the API side.
+
+Run a worker from learnflow-app/backend with:
+    python -m services.code_execution.remote
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from ..kafka.kafka_service import process_stream, send_request
+from ..metrics import metrics
+from .scheduler import PRIORITY_SCRATCH, SchedulerOverloaded
+
+logger = logging.getLogger(__name__)
+
+JOB_TOPIC = "code-execution-jobs"
+RESULT_TOPIC = "code-execution-results"
+CONTROL_TOPIC = "code-execution-control"
+WORKER_GROUP = "code-executors"
+
+JOB_KINDS = ("execute", "grade")
+
+# Cancelled correlation ids a worker remembers for jobs it has not started yet
+MAX_REMEMBERED_CANCELS = 10000
+
+
+class RemoteExecutionError(Exception):
+    """Raised when a worker reports an error; error_type names the exception it raised"""
+
+    def __init__(self, message: str, error_type: str = "RemoteExecutionError"):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+def _new_instance_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class RemoteExecutor:
+    def __init__(self, max_pending: int = 1000, instance_id: Optional[str] = None,
+                 job_topic: str = JOB_TOPIC, result_topic: str = RESULT_TOPIC,
+                 control_topic: str = CONTROL_TOPIC):
+        """
+        Args:
+            max_pending: Jobs this instance may wait on at once before requests are shed
+            instance_id: Names this instance's reply consumer group (unique by default)
+            job_topic: Topic jobs are published on
+            result_topic: Topic workers reply on
+            control_topic: Topic cancel messages are published on
+        """
+        self.max_pending = max_pending
+        self.instance_id = instance_id or _new_instance_id()
+        self.job_topic = job_topic
+        self.result_topic = result_topic
+        self.control_topic = control_topic
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._replies: Optional[asyncio.Task] = None
+        self._cancels: set = set()
+
+        self._outcomes = metrics.counter("code_execution_remote")
+        self._latency = metrics.latency("code_execution_remote_seconds")
+
+    async def start(self):
+        """Start reading replies"""
+        if self._replies is None:
+            self._replies = asyncio.get_running_loop().create_task(process_stream(
+                [self.result_topic],
+                self._on_reply,
+                group_id=f"code-results-{self.instance_id}",
+                lanes=1,
+                retry=False,
+                # Replies published before this instance started are for someone else
+                offset_reset="latest"
+            ))
+
+    async def _on_reply(self, event: Dict[str, Any]):
+        future = self._pending.get(event.get("correlation_id"))
+        if future is not None and not future.done():
+            future.set_result(event)
+
+    async def submit(self, kind: str, job: Dict[str, Any], user_id: str, timeout: float) -> Dict[str, Any]:
+        """
+        Run a job on an executor worker and wait for its result
+
+        Args:
+            kind: "execute" or "grade"
+            job: Arguments for the worker's CodeExecutor method
+            user_id: User the job is for; also the partitioning key
+            timeout: Seconds to wait for the result, queueing included
+
+        Returns:
+            The worker's result document
+
+        Raises:
+            asyncio.TimeoutError: If no result arrived in time (the job is cancelled)
+            SchedulerOverloaded: If too many jobs are pending here or the worker shed the job
+            RemoteExecutionError: If the worker failed to run the job
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if len(self._pending) >= self.max_pending:
+            self._outcomes.inc(outcome="shed")
+            raise SchedulerOverloaded("Code execution is busy (remote_pending_full); retry in 5s", 5)
+        if self._replies is None:
+            await self.start()
+
+        correlation_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[correlation_id] = future
+        started = time.perf_counter()
+        outcome = "cancelled"
+        try:
+            try:
+                await send_request(self.job_topic, {
+                    "event_type": "code_execution_job",
+                    "correlation_id": correlation_id,
+                    "kind": kind,
+                    "user_id": user_id,
+                    "reply_to": self.result_topic,
+                    "deadline": time.time() + timeout,
+                    **job,
+                }, key=user_id)
+            except Exception as e:
+                outcome = "error"
+                raise RemoteExecutionError(f"Could not submit the job: {str(e)}")
+            reply = await asyncio.wait_for(future, timeout=timeout)
+            outcome = reply.get("status", "error")
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise
+        finally:
+            self._pending.pop(correlation_id, None)
+            self._outcomes.inc(outcome=outcome)
+            self._latency.observe(time.perf_counter() - started, kind=kind)
+            if outcome in ("timeout", "cancelled"):
+                self._cancel(correlation_id)
+
+        if reply.get("status") == "ok":
+            return reply["result"]
+        if reply.get("error_type") == "SchedulerOverloaded":
+            raise SchedulerOverloaded(reply.get("error", "Code execution is busy"), int(reply.get("retry_after", 1)))
+        raise RemoteExecutionError(reply.get("error", "Remote execution failed"), reply.get("error_type"))
+
+    def _cancel(self, correlation_id: str):
+        """Tell the workers to stop a job nobody waits for any more"""
+        async def publish():
+            try:
+                await send_request(self.control_topic, {
+                    "event_type": "code_execution_cancel", "correlation_id": correlation_id
+                }, key=correlation_id)
+            except Exception as e:
+                logger.error(f"Failed to cancel remote execution {correlation_id}: {str(e)}")
+
+        # Publishing must not be interrupted by the cancellation that triggered it
+        task = asyncio.get_running_loop().create_task(publish())
+        self._cancels.add(task)
+        task.add_done_callback(self._cancels.discard)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pending jobs and outcome counts"""
+        return {
+            "instance_id": self.instance_id,
+            "pending": len(self._pending),
+            "outcomes": {
+                outcome: self._outcomes.value(outcome=outcome)
+                for outcome in ("ok", "error", "timeout", "cancelled", "shed")
+            },
+            "latency": {kind: self._latency.summary(kind=kind) for kind in JOB_KINDS},
+        }
+
+    async def close(self):
+        """Stop reading replies and fail the jobs still waiting"""
+        if self._replies is not None:
+            self._replies.cancel()
+            try:
+                await self._replies
+            except asyncio.CancelledError:
+                pass
+            self._replies = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(RemoteExecutionError("Remote executor closed"))
+        if self._cancels:
+            await asyncio.gather(*list(self._cancels), return_exceptions=True)
+
+
+class ExecutionWorker:
+    def __init__(self, executor, lanes: Optional[int] = None, worker_id: Optional[str] = None,
+                 job_topic: str = JOB_TOPIC, control_topic: str = CONTROL_TOPIC, group_id: str = WORKER_GROUP):
+        """
+        Args:
+            executor: Local CodeExecutor the jobs run on
+            lanes: Jobs handled at once (defaults to the executor's concurrency
+                plus its per-user queue, so its scheduler sees the backlog)
+            worker_id: Names this worker's control consumer group (unique by default)
+            job_topic: Topic jobs are consumed from
+            control_topic: Topic cancel messages are consumed from
+            group_id: Consumer group shared by all workers
+        """
+        if executor.remote is not None:
+            raise ValueError("An execution worker must run code locally")
+        self.executor = executor
+        self.lanes = lanes or executor.scheduler.max_concurrency + executor.scheduler.max_queued_per_user
+        self.worker_id = worker_id or _new_instance_id()
+        self.job_topic = job_topic
+        self.control_topic = control_topic
+        self.group_id = group_id
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled: "OrderedDict[str, None]" = OrderedDict()
+
+        self._jobs = metrics.counter("code_execution_worker_jobs")
+
+    async def run(self):
+        """Consume jobs and cancel messages until cancelled"""
+        logger.info(f"Execution worker {self.worker_id} consuming {self.job_topic} with {self.lanes} lanes")
+        await asyncio.gather(
+            process_stream(
+                [self.job_topic], self._handle_job, group_id=self.group_id,
+                max_in_flight=self.lanes * 2, lanes=self.lanes, retry=False
+            ),
+            process_stream(
+                [self.control_topic], self._handle_control, group_id=f"code-executor-control-{self.worker_id}",
+                lanes=1, retry=False, offset_reset="latest"
+            ),
+        )
+
+    async def _handle_control(self, event: Dict[str, Any]):
+        correlation_id = event.get("correlation_id")
+        if event.get("event_type") != "code_execution_cancel" or not correlation_id:
+            return
+        self._cancelled[correlation_id] = None
+        if len(self._cancelled) > MAX_REMEMBERED_CANCELS:
+            self._cancelled.popitem(last=False)
+        task = self._running.get(correlation_id)
+        if task is not None:
+            task.cancel()
+
+    async def _run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        priority = job.get("priority", PRIORITY_SCRATCH)
+        if job["kind"] == "grade":
+            return await self.executor.grade_python_code(
+                job["code"], job["test_cases"], user_id=job["user_id"], priority=priority
+            )
+        return await self.executor.execute_python_code(
+            job["code"], job.get("input_data", ""), user_id=job["user_id"], priority=priority
+        )
+
+    async def _handle_job(self, job: Dict[str, Any]):
+        correlation_id = job.get("correlation_id")
+        if job.get("event_type") != "code_execution_job" or not correlation_id:
+            return
+        if correlation_id in self._cancelled:
+            self._jobs.inc(outcome="cancelled")
+            return
+        if job.get("deadline", 0) < time.time():
+            # The caller has already given up
+            self._jobs.inc(outcome="expired")
+            return
+
+        task = asyncio.ensure_future(self._run(job))
+        self._running[correlation_id] = task
+        try:
+            reply = {"status": "ok", "result": await task}
+        except asyncio.CancelledError:
+            if correlation_id not in self._cancelled:
+                raise
+            self._jobs.inc(outcome="cancelled")
+            return
+        except SchedulerOverloaded as e:
+            reply = {"status": "error", "error_type": "SchedulerOverloaded", "error": str(e),
+                     "retry_after": e.retry_after}
+        except Exception as e:
+            if type(e).__name__ != "CodeExecutionError":
+                logger.error(f"Error running remote execution {correlation_id}: {str(e)}")
+            reply = {"status": "error", "error_type": type(e).__name__, "error": str(e)}
+        finally:
+            self._running.pop(correlation_id, None)
+
+        self._jobs.inc(outcome=reply["status"])
+        await send_request(job.get("reply_to") or RESULT_TOPIC, {
+            "event_type": "code_execution_result",
+            "correlation_id": correlation_id,
+            "worker_id": self.worker_id,
+            **reply,
+        }, key=correlation_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get running jobs and outcome counts"""
+        return {
+            "worker_id": self.worker_id,
+            "lanes": self.lanes,
+            "running": len(self._running),
+            "executor": self.executor.get_stats(),
+            "jobs": {
+                outcome: self._jobs.value(outcome=outcome)
+                for outcome in ("ok", "error", "cancelled", "expired")
+            },
+        }
+
+
+async def run_execution_worker(executor=None, lanes: Optional[int] = None):
+    """
+    Run an execution worker until cancelled
+
+    Args:
+        executor: Local CodeExecutor to run jobs on (defaults to one configured
+            from the environment, always in local mode)
+        lanes: Jobs handled at once
+    """
+    from .code_executor import executor_from_env
+
+    executor = executor or executor_from_env(mode="local")
+    worker = ExecutionWorker(executor, lanes=lanes)
+    metrics.register_source("execution_worker", worker.get_stats)
+    await executor.start()
+    try:
+        await worker.run()
+    finally:
+        await executor.close()
+
+
+async def _main():
+    from ..kafka.kafka_service import close_kafka_service, init_kafka_service
+
+    await init_kafka_service(os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"))
+    try:
+        await run_execution_worker(lanes=int(os.getenv("CODE_EXECUTOR_WORKER_LANES", "0")) or None)
+    finally:
+        await close_kafka_service()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
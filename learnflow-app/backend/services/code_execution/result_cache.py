@@ -0,0 +1,246 @@
+"""
+Execution Result Cache for LearnFlow
+Serves repeated runs of identical programs (starter code, copied examples) without a sandbox
+
+Entries are keyed by a SHA-256 of the source (line endings normalized), stdin and the
+executor's limits, so a change to any of them is a different entry. Only
+successful runs of deterministic programs are stored: no truncated output, no
+limit hit, and no use of modules or builtins whose results vary between runs
+(random, time, id(), ...). The check parses the program, so it only runs when
+a result is about to be stored; lookups just hash.
+
+The in-memory tier is an LRU bounded by entry count and total output bytes,
+with a TTL per entry. An optional Redis tier shares results between backend
+instances; it is skipped for a while after an error so an unhealthy Redis
+does not slow down executions.
+"""
+import ast
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bump when the cached result format changes
+CACHE_VERSION = "1"
+
+# Modules whose results differ from run to run
+NONDETERMINISTIC_MODULES = {
+    "random", "secrets", "uuid", "time", "datetime", "calendar", "os", "sys", "platform",
+    "threading", "multiprocessing", "concurrent", "asyncio", "socket", "subprocess", "signal",
+    "resource", "gc", "tracemalloc", "inspect", "ctypes", "tempfile", "pathlib", "glob",
+}
+
+# Builtins whose results differ from run to run
+NONDETERMINISTIC_BUILTINS = {"id", "hash", "open", "__import__", "globals", "locals", "vars"}
+
+# Fields of a result that are stored; timings describe the original run
+_STORED_FIELDS = (
+    "output", "errors", "status", "return_code", "wall_time", "cpu_time", "peak_rss_kb",
+    "limit_exceeded", "truncated",
+)
+
+# Seconds the Redis tier is skipped after an error
+REDIS_BACKOFF_SECONDS = 30.0
+
+
+def normalize_source(code: str) -> str:
+    """
+    Normalize line endings, which the parser treats the same
+
+    Other whitespace is kept: inside a string literal it is part of the output.
+    """
+    return code.replace("\r\n", "\n").replace("\r", "\n")
+
+
+@lru_cache(maxsize=1024)
+def is_deterministic(code: str) -> bool:
+    """
+    Whether a program's output depends only on its source and stdin
+
+    Conservative: anything that cannot be parsed, or that imports or calls
+    something from the deny lists, is treated as nondeterministic.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            if any(alias.name.split(".")[0] in NONDETERMINISTIC_MODULES for alias in node.names):
+                return False
+        elif isinstance(node, ast.ImportFrom):
+            if node.level or (node.module or "").split(".")[0] in NONDETERMINISTIC_MODULES:
+                return False
+        elif isinstance(node, ast.Name) and node.id in NONDETERMINISTIC_BUILTINS:
+            return False
+    return True
+
+
+def is_cacheable(code: str, result: Dict[str, Any]) -> bool:
+    """Whether a finished run may be served to later identical runs"""
+    return (
+        result.get("status") == "success"
+        and not result.get("truncated")
+        and not result.get("limit_exceeded")
+        and is_deterministic(code)
+    )
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024, ttl: float = 3600.0,
+                 redis_url: Optional[str] = None, key_prefix: str = "learnflow:exec:"):
+        """
+        Args:
+            max_entries: Results kept in memory
+            max_bytes: Output and error bytes kept in memory, over all entries
+            ttl: Seconds a result is served after it was stored
+            redis_url: Redis URL for the shared tier, None for memory only
+            key_prefix: Prefix for Redis keys
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._bytes = 0
+        self._redis = None
+        self._redis_down_until = 0.0
+        if redis_url:
+            try:
+                import redis.asyncio as redis_asyncio
+                self._redis = redis_asyncio.from_url(redis_url, socket_timeout=0.2, socket_connect_timeout=0.2)
+            except Exception as e:
+                logger.error(f"Result cache Redis tier disabled: {str(e)}")
+
+        self._lookups = metrics.counter("code_execution_cache")
+
+    @staticmethod
+    def make_key(code: str, input_data: str, limits: Dict[str, Any]) -> str:
+        """
+        Cache key for a run
+
+        Args:
+            code: Program source
+            input_data: Program stdin
+            limits: Everything about the executor that can change a result
+        """
+        digest = hashlib.sha256()
+        digest.update(CACHE_VERSION.encode())
+        digest.update(json.dumps(limits, sort_keys=True).encode())
+        digest.update(b"\0")
+        digest.update(normalize_source(code).encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+        digest.update(input_data.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, _, result = entry
+        if expires_at < time.monotonic():
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _put_local(self, key: str, result: Dict[str, Any], ttl: float):
+        size = len(result.get("output") or "") + len(result.get("errors") or "")
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._evict(key)
+        self._entries[key] = (time.monotonic() + ttl, size, result)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _redis_available(self) -> bool:
+        return self._redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, e: Exception):
+        logger.error(f"Result cache Redis error, skipping Redis for {REDIS_BACKOFF_SECONDS:.0f}s: {str(e)}")
+        self._redis_down_until = time.monotonic() + REDIS_BACKOFF_SECONDS
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a stored result
+
+        Returns:
+            A copy of the stored result, or None on a miss
+        """
+        result = self._get_local(key)
+        if result is not None:
+            self._lookups.inc(result="hit", tier="memory")
+            return dict(result)
+
+        if self._redis_available():
+            try:
+                raw = await self._redis.get(self.key_prefix + key)
+            except Exception as e:
+                self._redis_failed(e)
+                raw = None
+            if raw is not None:
+                result = json.loads(raw)
+                # Later lookups on this instance stay in memory
+                self._put_local(key, result, self.ttl)
+                self._lookups.inc(result="hit", tier="redis")
+                return dict(result)
+
+        self._lookups.inc(result="miss")
+        return None
+
+    async def put(self, key: str, code: str, result: Dict[str, Any]) -> bool:
+        """
+        Store a result if it is cacheable
+
+        Args:
+            key: Key from make_key
+            code: Program source, for the determinism check
+            result: Result returned by the executor
+
+        Returns:
+            Whether the result was stored
+        """
+        if not is_cacheable(code, result):
+            return False
+        stored = {field: result.get(field) for field in _STORED_FIELDS}
+        self._put_local(key, stored, self.ttl)
+        if self._redis_available():
+            try:
+                await self._redis.set(self.key_prefix + key, json.dumps(stored), ex=max(1, int(self.ttl)))
+            except Exception as e:
+                self._redis_failed(e)
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get occupancy and hit/miss counts"""
+        hits = self._lookups.value(result="hit", tier="memory") + self._lookups.value(result="hit", tier="redis")
+        misses = self._lookups.value(result="miss")
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "redis": self._redis is not None,
+        }
+
+    async def close(self):
+        """Close the Redis connection"""
+        if self._redis is not None:
+            try:
+                await self._redis.aclose()
+            except Exception as e:
+                logger.error(f"Error closing result cache Redis connection: {str(e)}")
@@ -0,0 +1,328 @@
+"""
+Code Safety Analyzer for LearnFlow
+Screens submitted programs with one AST pass before they reach the sandbox
+
+The rule table is built once at import: an import allowlist, builtin names
+that must not be referenced (called or aliased), dunder attributes used to
+escape from restricted code, and banned attribute chains. The chains are found
+by introspecting the allowed modules for attributes that are modules outside
+the allowlist (e.g. `dataclasses.builtins`, `random._os`), so an allowed
+module cannot be used as a way around the import rules. The attribute names of
+those chains are refused on any receiver, since a module is easily passed
+around under another name; private attributes are refused on imported modules
+and the names they are assigned to. analyze() walks the tree once and
+dispatches each node to the check for its type, so only syntax is inspected,
+never string contents or identifiers that merely contain a banned word.
+
+Sources that contain none of the words a rule looks for (no `import`, no
+banned name or attribute) are allowed without being parsed. Verdicts are
+memoized by a hash of the source, so resubmissions and the analyses done by
+other components cost a dict lookup. Programs that do not parse are allowed:
+the sandbox reports the SyntaxError to the student.
+
+A first parse is far slower than the substring scan this replaced (tens of
+milliseconds for a thousand lines with imports), so sources longer than
+max_source_chars are refused without being parsed, and analyze_async() parses
+anything but small sources in a worker process for callers on the event loop
+(ast.parse holds the GIL, so a thread would still stall the loop).
+
+This is the first line of defence only; sandbox_worker.py refuses processes,
+sockets and file access at runtime with an audit hook.
+"""
+import ast
+import asyncio
+import hashlib
+import importlib
+import logging
+import string
+import types
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+# Modules a program may import (top-level package names)
+ALLOWED_MODULES = frozenset({
+    "abc", "array", "bisect", "calendar", "cmath", "collections", "copy", "dataclasses", "datetime",
+    "decimal", "enum", "fractions", "functools", "heapq", "itertools", "json", "math", "numbers",
+    "operator", "pprint", "random", "re", "statistics", "string", "textwrap", "time", "typing",
+    "unicodedata",
+})
+
+# Builtins that must not be referenced at all, called or not
+BANNED_NAMES = frozenset({
+    "__import__", "__builtins__", "__loader__", "__spec__", "breakpoint", "compile", "delattr",
+    "eval", "exec", "getattr", "globals", "locals", "open", "setattr", "vars",
+})
+
+# Attributes used to reach interpreter internals from ordinary objects
+BANNED_ATTRIBUTES = frozenset({
+    "__base__", "__bases__", "__builtins__", "__closure__", "__code__", "__dict__", "__getattribute__",
+    "__globals__", "__import__", "__loader__", "__mro__", "__reduce__", "__reduce_ex__", "__spec__",
+    "__subclasses__", "co_code", "f_back", "f_builtins", "f_globals", "f_locals", "gi_frame",
+    "tb_frame",
+})
+
+
+def _module_chains(allowed: FrozenSet[str]) -> FrozenSet[str]:
+    """'module.attr' for every attribute of an allowed module that is a module outside the allowlist"""
+    chains = set()
+    for name in allowed:
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        for attr, value in vars(module).items():
+            if isinstance(value, types.ModuleType) and value.__name__.split(".")[0] not in allowed:
+                chains.add(f"{name}.{attr}")
+    return frozenset(chains)
+
+
+# Module attributes that lead outside the allowlist, e.g. 'dataclasses.builtins'
+BANNED_CHAINS = _module_chains(ALLOWED_MODULES)
+
+# Their attribute names, e.g. '_os' or 'builtins', refused whatever the receiver is
+BANNED_CHAIN_ATTRIBUTES = frozenset(chain.split(".", 1)[1] for chain in BANNED_CHAINS)
+
+# Every violation needs one of these words in the source. The prefilter splits
+# the source into words at everything but letters and underscores (a split in
+# the middle of an identifier only causes a parse). Identifiers are
+# NFKC-normalized by the parser, so only ASCII sources are prefiltered
+_TRIGGER_WORDS = frozenset({"import"} | BANNED_NAMES | BANNED_ATTRIBUTES | BANNED_CHAIN_ATTRIBUTES)
+_WORD_SEPARATORS = str.maketrans(dict.fromkeys(string.punctuation.replace("_", "") + string.digits, " "))
+
+DEFAULT_CACHE_SIZE = 4096
+
+# Longest source analyzed: about 3,000 short lines, whose first analysis takes about 50 ms
+DEFAULT_MAX_SOURCE_CHARS = 50_000
+
+# analyze_async() parses shorter sources on the event loop: a process hop costs more
+INLINE_SOURCE_CHARS = 2_000
+
+
+class SafetyVerdict:
+    """Outcome of analyzing one program"""
+
+    __slots__ = ("allowed", "violations")
+
+    def __init__(self, violations: List[str]):
+        self.violations = violations
+        self.allowed = not violations
+
+    def __repr__(self):
+        return f"SafetyVerdict(allowed={self.allowed}, violations={self.violations})"
+
+
+def _is_private(name: str) -> bool:
+    return name.startswith("_") and not (name.startswith("__") and name.endswith("__"))
+
+
+def _check_import(node: ast.Import, modules: Dict[str, str]) -> List[str]:
+    violations = []
+    for alias in node.names:
+        top = alias.name.split(".")[0]
+        if top not in ALLOWED_MODULES:
+            violations.append(f"import of '{alias.name}' is not allowed (line {node.lineno})")
+        elif alias.asname:
+            modules[alias.asname] = alias.name
+        else:
+            modules[top] = top
+    return violations
+
+
+def _check_import_from(node: ast.ImportFrom, modules: Dict[str, str]) -> List[str]:
+    module = node.module or ""
+    if node.level or module.split(".")[0] not in ALLOWED_MODULES:
+        return [f"import from '{'.' * node.level}{module}' is not allowed (line {node.lineno})"]
+    # `from x import *` or a private name can pull in what the allowlist keeps out
+    return [
+        f"import of '{module}.{alias.name}' is not allowed (line {node.lineno})"
+        for alias in node.names
+        if alias.name == "*" or _is_private(alias.name) or f"{module}.{alias.name}" in BANNED_CHAINS
+    ]
+
+
+def _check_name(node: ast.Name, modules: Dict[str, str]) -> List[str]:
+    if node.id in BANNED_NAMES and isinstance(node.ctx, ast.Load):
+        return [f"use of '{node.id}' is not allowed (line {node.lineno})"]
+    return []
+
+
+def _check_attribute(node: ast.Attribute, modules: Dict[str, str]) -> List[str]:
+    if node.attr in BANNED_ATTRIBUTES or node.attr in BANNED_CHAIN_ATTRIBUTES:
+        return [f"access to '{node.attr}' is not allowed (line {node.lineno})"]
+    return []
+
+
+def _check_module_attribute(node: ast.Attribute, modules: Dict[str, str]) -> List[str]:
+    """Private attributes of a module, once every import and alias is known"""
+    if (isinstance(node.value, ast.Name) and node.value.id in modules and _is_private(node.attr)
+            and node.attr not in BANNED_CHAIN_ATTRIBUTES):
+        return [f"access to '{modules[node.value.id]}.{node.attr}' is not allowed (line {node.lineno})"]
+    return []
+
+
+def _alias_modules(modules: Dict[str, str], assignments: List[ast.AST]):
+    """Add the names that `m = module` (or `m := module`) binds to a module, chains of aliases included"""
+    pairs = []
+    for node in assignments:
+        if isinstance(node.value, ast.Name):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            pairs.extend((target.id, node.value.id) for target in targets if isinstance(target, ast.Name))
+    changed = bool(modules)
+    while changed:
+        changed = False
+        for target, value in pairs:
+            if value in modules and target not in modules:
+                modules[target] = modules[value]
+                changed = True
+
+
+# Node type -> check; every other node type is only traversed
+_RULES: Dict[Type[ast.AST], Callable[[ast.AST, Dict[str, str]], List[str]]] = {
+    ast.Import: _check_import,
+    ast.ImportFrom: _check_import_from,
+    ast.Name: _check_name,
+    ast.Attribute: _check_attribute,
+}
+
+# Node types kept for the checks that need every import first: ast.walk is
+# breadth-first, so an import nested in a block is visited after top-level
+# statements that follow it
+_DEFERRED = (ast.Attribute, ast.Assign, ast.NamedExpr)
+
+
+class SafetyAnalyzer:
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE,
+                 max_source_chars: Optional[int] = DEFAULT_MAX_SOURCE_CHARS, workers: int = 1):
+        """
+        Args:
+            cache_size: Verdicts kept, keyed by source hash
+            max_source_chars: Longer sources are refused without being
+                parsed (None for no limit)
+            workers: Processes analyze_async() parses large sources in,
+                started on first use
+        """
+        self.cache_size = cache_size
+        self.max_source_chars = max_source_chars
+        self.workers = workers
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._verdicts: "OrderedDict[bytes, SafetyVerdict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _prefilter(code: str) -> bool:
+        """True when the source cannot break any rule and need not be parsed"""
+        return code.isascii() and _TRIGGER_WORDS.isdisjoint(code.translate(_WORD_SEPARATORS).split())
+
+    @staticmethod
+    def _analyze(code: str) -> SafetyVerdict:
+        if SafetyAnalyzer._prefilter(code):
+            return SafetyVerdict([])
+        try:
+            tree = ast.parse(code)
+        except (SyntaxError, ValueError):
+            return SafetyVerdict([])
+        rules = _RULES
+        modules: Dict[str, str] = {}
+        violations: List[str] = []
+        deferred: List[ast.AST] = []
+        for node in ast.walk(tree):
+            node_type = type(node)
+            check = rules.get(node_type)
+            if check is not None:
+                found = check(node, modules)
+                if found:
+                    violations.extend(found)
+            if node_type in _DEFERRED:
+                deferred.append(node)
+
+        if modules and deferred:
+            _alias_modules(modules, [node for node in deferred if type(node) is not ast.Attribute])
+            for node in deferred:
+                if type(node) is ast.Attribute:
+                    violations.extend(_check_module_attribute(node, modules))
+        return SafetyVerdict(violations)
+
+    def _lookup(self, code: str) -> Tuple[Optional[bytes], Optional[SafetyVerdict]]:
+        """(key, verdict) for a source; verdict is None when it still has to be analyzed"""
+        if self.max_source_chars is not None and len(code) > self.max_source_chars:
+            return None, SafetyVerdict([f"program is longer than {self.max_source_chars} characters"])
+        key = hashlib.blake2b(code.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        verdict = self._verdicts.get(key)
+        if verdict is not None:
+            self._verdicts.move_to_end(key)
+            self.hits += 1
+        return key, verdict
+
+    def _store(self, key: bytes, verdict: SafetyVerdict):
+        self.misses += 1
+        self._verdicts[key] = verdict
+        if len(self._verdicts) > self.cache_size:
+            self._verdicts.popitem(last=False)
+
+    def analyze(self, code: str) -> SafetyVerdict:
+        """
+        Analyze a program, or return the memoized verdict for the same source
+
+        Args:
+            code: Program source
+
+        Returns:
+            SafetyVerdict; allowed is False when any rule matched
+        """
+        key, verdict = self._lookup(code)
+        if verdict is None:
+            verdict = self._analyze(code)
+            self._store(key, verdict)
+        return verdict
+
+    async def analyze_async(self, code: str) -> SafetyVerdict:
+        """
+        Like analyze(), but a large source not seen before is parsed in a
+        worker process so the parse does not block the event loop
+
+        Args:
+            code: Program source
+
+        Returns:
+            SafetyVerdict; allowed is False when any rule matched
+        """
+        key, verdict = self._lookup(code)
+        if verdict is None:
+            if len(code) <= INLINE_SOURCE_CHARS or self._prefilter(code):
+                verdict = self._analyze(code)
+            else:
+                if self._processes is None:
+                    self._processes = ProcessPoolExecutor(max_workers=self.workers)
+                verdict = await asyncio.get_running_loop().run_in_executor(self._processes, self._analyze, code)
+            self._store(key, verdict)
+        return verdict
+
+    def shutdown(self):
+        """Stop the worker processes; they are started again when needed"""
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"cached_verdicts": len(self._verdicts), "hits": self.hits, "misses": self.misses}
+
+
+# Global analyzer instance
+analyzer = SafetyAnalyzer()
+
+
+def analyze_code(code: str) -> SafetyVerdict:
+    """
+    Convenience function to analyze code with the global analyzer
+
+    Args:
+        code: Program source
+
+    Returns:
+        SafetyVerdict for the program
+    """
+    return analyzer.analyze(code)
@@ -0,0 +1,645 @@
+"""
+Sandbox Worker for LearnFlow
+The sandbox interpreter that runs student programs, either warm in the WorkerPool or once per run
+
+Run as a standalone script; it must not import anything from the backend.
+
+`python -I sandbox_worker.py serve [LIMITS]` is a pre-started worker. Jobs and
+results are JSON documents framed with a 4-byte big-endian length, read from
+stdin and written to stdout. The real file descriptors 0-2 are pointed at
+/dev/null once the protocol pipes are saved, so nothing a program prints can
+corrupt the protocol. Each job runs in a fresh __main__ namespace with its own
+stdin/stdout/stderr. Afterwards the worker checks whether the program left
+anything behind (patched builtins or preloaded modules, live threads, a
+changed working directory) and reports it, so the pool can retire the worker
+instead of reusing it.
+
+`python -I sandbox_worker.py run LIMITS PROGRAM_FD STATS_FD` runs one program
+read from PROGRAM_FD with the real stdin/stdout/stderr, then writes its
+resource usage as JSON to STATS_FD. `stream` instead of `run` does the same
+with line-buffered stdout, so a reader sees each line as soon as it is printed.
+
+`python -I sandbox_worker.py grade LIMITS PROGRAM_FD STATS_FD` grades a
+program: it reads a JSON list of test cases from stdin, compiles the program
+once and writes the per-case results as JSON to stdout (a warm worker does the
+same for jobs that carry "cases"). A case either runs the whole program with
+its own stdin, or calls a function from the program, which is then loaded
+only once for all such cases. Every case has its own timeout, CPU limit and
+output capture. Comparing results with the expected ones is left to the
+backend.
+
+LIMITS is the JSON produced by ResourceLimits.to_worker(). They are applied
+before any program code runs; the CPU limit is armed per job, so a warm worker
+measures and limits each program separately. A warm worker also caps what it
+captures per output stream; for one-shot runs the backend enforces that cap
+while reading the pipes.
+
+Along with the limits an audit hook is installed, as a runtime backstop for
+what the backend's safety analyzer misses: it refuses starting processes,
+sockets, ctypes and loading the modules that provide them, changes to the file
+system, raising resource limits, and reading files outside the Python
+installation. Audit hooks cannot be removed, so this holds for the rest of the
+interpreter's life.
+"""
+import builtins
+import io
+import json
+import linecache
+import math
+import os
+import resource
+import signal
+import struct
+import sys
+import threading
+import time
+import traceback
+
+_LENGTH = struct.Struct(">I")
+
+# Name shown in tracebacks for the student's program
+PROGRAM_FILENAME = "main.py"
+
+
+class CPUTimeLimitExceeded(BaseException):
+    """Raised in the program on SIGXCPU; not an Exception, so `except Exception` cannot swallow it"""
+    pass
+
+
+class OutputLimitExceeded(BaseException):
+    """Raised in the program when it writes past the output budget"""
+    pass
+
+
+class CaseTimeLimitExceeded(BaseException):
+    """Raised in the program on SIGALRM, when a test case runs past its timeout"""
+    pass
+
+
+# Seconds a test case may run when it does not say
+DEFAULT_CASE_TIMEOUT = 2.0
+
+
+def _on_sigxcpu(signum, frame):
+    raise CPUTimeLimitExceeded()
+
+
+def _on_sigalrm(signum, frame):
+    raise CaseTimeLimitExceeded()
+
+
+class _BoundedOutput(io.TextIOBase):
+    """
+    Captures program output up to a budget of UTF-8 bytes
+
+    The write that crosses the budget keeps what fits and raises
+    OutputLimitExceeded once; later writes are dropped, so the error report
+    itself cannot overflow again.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.truncated = False
+        self._parts = []
+        self._size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if self.truncated:
+            return len(text)
+        size = len(text) if text.isascii() else len(text.encode("utf-8"))
+        if self.budget is not None and self._size + size > self.budget:
+            room = self.budget - self._size
+            self._parts.append(text.encode("utf-8")[:room].decode("utf-8", "ignore"))
+            self._size = self.budget
+            self.truncated = True
+            raise OutputLimitExceeded()
+        self._parts.append(text)
+        self._size += size
+        return len(text)
+
+    def getvalue(self) -> str:
+        return "".join(self._parts)
+
+
+# Audit events a program may never cause (a trailing "." matches a family)
+BLOCKED_EVENTS = (
+    "os.system", "os.exec", "os.posix_spawn", "os.spawn", "os.fork", "os.kill", "subprocess.Popen", "pty.spawn",
+    "socket.", "ctypes.", "os.remove", "os.rmdir", "os.rename", "os.link", "os.symlink", "os.mkdir", "os.chmod",
+    "os.chown", "os.chflags", "os.truncate", "os.utime", "os.chdir", "sys.addaudithook",
+)
+
+# Modules that may not be loaded, even by the standard library
+BLOCKED_MODULES = frozenset({
+    "_ctypes", "_multiprocessing", "_posixsubprocess", "_socket", "_testcapi", "_xxsubinterpreters", "ctypes",
+    "gc", "mmap", "multiprocessing", "pty", "socket", "subprocess",
+})
+
+_WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_CREAT | os.O_TRUNC
+
+# Files the worker itself opens between jobs
+_WORKER_READS = frozenset({"/proc/self/status"})
+_WORKER_WRITES = frozenset({"/proc/self/clear_refs"})
+
+
+def _readable_roots() -> tuple:
+    """The Python installation: where the interpreter reads the standard library from"""
+    roots = {sys.prefix, sys.base_prefix, sys.exec_prefix, sys.base_exec_prefix}
+    roots.update(entry for entry in sys.path if entry)
+    return tuple(os.path.join(os.path.realpath(root), "") for root in roots)
+
+
+def _install_audit_hook():
+    roots = _readable_roots()
+
+    def refuse(event: str):
+        raise PermissionError(f"'{event}' is not allowed in the sandbox")
+
+    def hook(event: str, args: tuple):
+        if event.startswith(BLOCKED_EVENTS):
+            refuse(event)
+        elif event == "import":
+            if args[0].partition(".")[0] in BLOCKED_MODULES:
+                refuse(f"import {args[0]}")
+        elif event == "open" or event == "os.listdir" or event == "os.scandir":
+            path = args[0]
+            if isinstance(path, int):
+                # Inherited descriptors include the warm worker's protocol pipes
+                refuse(event)
+            path = os.fsdecode(path) if path is not None else os.getcwd()
+            writing = event == "open" and bool(args[2] & _WRITE_FLAGS)
+            # The worker's own files are matched as written: /proc/self resolves to /proc/<pid>
+            if path in (_WORKER_WRITES if writing else _WORKER_READS):
+                return
+            path = os.path.realpath(path)
+            if writing:
+                refuse(f"writing {path}")
+            elif not os.path.join(path, "").startswith(roots):
+                refuse(f"reading {path}")
+        elif event == "resource.setrlimit":
+            # Limits may be lowered (the CPU limit is re-armed per job) but never raised
+            limit, (_, hard) = args
+            current = resource.getrlimit(limit)[1]
+            if current != resource.RLIM_INFINITY and (hard == resource.RLIM_INFINITY or hard > current):
+                refuse(event)
+
+    sys.addaudithook(hook)
+
+
+def apply_limits(limits: dict):
+    """Join the run's cgroup, apply the rlimits and install the audit hook; must run before any program code"""
+    if limits.get("cgroup"):
+        # Writing 0 moves the writing process
+        with open(os.path.join(limits["cgroup"], "cgroup.procs"), "w") as procs:
+            procs.write("0")
+    if limits.get("memory_bytes"):
+        resource.setrlimit(resource.RLIMIT_AS, (limits["memory_bytes"], limits["memory_bytes"]))
+    if limits.get("max_processes") is not None:
+        resource.setrlimit(resource.RLIMIT_NPROC, (limits["max_processes"], limits["max_processes"]))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    signal.signal(signal.SIGXCPU, _on_sigxcpu)
+    signal.signal(signal.SIGALRM, _on_sigalrm)
+    _install_audit_hook()
+
+
+def _cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _arm_cpu_limit(seconds: float, kill_after: bool = False):
+    """
+    Deliver SIGXCPU once this process has used `seconds` more CPU time
+
+    Args:
+        seconds: CPU time budget from now
+        kill_after: Also set the hard limit one second later, so the kernel
+            kills a program that survives SIGXCPU (one-shot runs only: a hard
+            limit cannot be raised again)
+    """
+    soft = math.ceil(_cpu_time() + seconds)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, soft + 1 if kill_after else hard))
+
+
+def _disarm_cpu_limit():
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+def _reset_peak_rss() -> bool:
+    """Reset VmHWM so it measures the next job only (Linux)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _read_exactly(stream, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+def _receive(stream) -> dict:
+    (size,) = _LENGTH.unpack(_read_exactly(stream, _LENGTH.size))
+    return json.loads(_read_exactly(stream, size))
+
+
+def _send(stream, message: dict):
+    payload = json.dumps(message).encode("utf-8")
+    stream.write(_LENGTH.pack(len(payload)) + payload)
+    stream.flush()
+
+
+def _builtins_fingerprint() -> int:
+    return hash(tuple((name, id(value)) for name, value in vars(builtins).items()))
+
+
+def _modules_fingerprint(names) -> int:
+    modules = sys.modules
+    return hash(tuple(
+        (name, id(modules.get(name)), tuple(id(value) for value in vars(modules[name]).values()))
+        for name in names if name in modules
+    ))
+
+
+class _Baseline:
+    """Interpreter state captured before the first job"""
+
+    def __init__(self):
+        self.modules = frozenset(sys.modules)
+        self.builtins = _builtins_fingerprint()
+        self.preloaded = _modules_fingerprint(sorted(self.modules))
+        self.cwd = os.getcwd()
+        self.path = list(sys.path)
+        self.recursion_limit = sys.getrecursionlimit()
+
+    def check(self) -> str:
+        """Undo what can be undone; return the reason the worker is unsafe, or ''"""
+        # Modules first imported by the program are dropped so the next job re-imports them
+        for name in set(sys.modules) - self.modules:
+            del sys.modules[name]
+
+        if threading.active_count() > 1:
+            return "program left threads running"
+        if _builtins_fingerprint() != self.builtins:
+            return "builtins were modified"
+        if _modules_fingerprint(sorted(self.modules)) != self.preloaded:
+            return "a preloaded module was modified"
+        if os.getcwd() != self.cwd or sys.path != self.path:
+            return "working directory or sys.path changed"
+        if sys.getrecursionlimit() != self.recursion_limit:
+            return "recursion limit changed"
+        return ""
+
+
+def _program_traceback(tb):
+    """
+    Drop the sandbox's own frames from a traceback
+
+    Those at the top ran the program; further down they are the sandbox's
+    input() or audit hook raising for the program, and would show the
+    student the sandbox's path on the host.
+    """
+    while tb is not None and tb.tb_frame.f_code.co_filename != PROGRAM_FILENAME:
+        tb = tb.tb_next
+    kept = tb
+    while kept is not None:
+        following = kept.tb_next
+        while following is not None and following.tb_frame.f_code.co_filename == __file__:
+            following = following.tb_next
+        kept.tb_next = following
+        kept = following
+    return tb
+
+
+def _guarded(body):
+    """
+    Call body() and report whatever the program raised on sys.stderr
+
+    Returns:
+        (return code, "cpu", "memory", "output" or "timeout" if the program
+        hit that limit else None, body's return value)
+    """
+    report = ""
+    value = None
+    try:
+        value = body()
+        return_code, limit_exceeded = 0, None
+    except SystemExit as e:
+        return_code, limit_exceeded = 0 if e.code is None else e.code, None
+        if not isinstance(return_code, int):
+            report, return_code = f"{e.code}\n", 1
+    except CPUTimeLimitExceeded:
+        report, return_code, limit_exceeded = "CPU time limit exceeded\n", 1, "cpu"
+    except CaseTimeLimitExceeded:
+        report, return_code, limit_exceeded = "Time limit exceeded\n", 1, "timeout"
+    except OutputLimitExceeded:
+        return_code, limit_exceeded = 1, "output"
+    except BaseException as e:
+        # The traceback starts in the program
+        tb = _program_traceback(e.__traceback__)
+        report = "".join(traceback.format_exception(type(e), e, tb))
+        return_code, limit_exceeded = 1, "memory" if isinstance(e, MemoryError) else None
+
+    try:
+        sys.stderr.write(report)
+    except OutputLimitExceeded:
+        # The report itself went over the output budget
+        limit_exceeded = limit_exceeded or "output"
+    return return_code, limit_exceeded, value
+
+
+def _main_namespace() -> dict:
+    return {"__name__": "__main__", "__builtins__": builtins, "__file__": PROGRAM_FILENAME}
+
+
+def _execute(code: str):
+    """
+    Run code as __main__ with the current sys.stdin/stdout/stderr
+
+    Returns:
+        (return code, "cpu", "memory" or "output" if the program hit that limit, else None)
+    """
+    linecache.cache[PROGRAM_FILENAME] = (len(code), None, code.splitlines(True), PROGRAM_FILENAME)
+    namespace = _main_namespace()
+    try:
+        return_code, limit_exceeded, _ = _guarded(lambda: exec(compile(code, PROGRAM_FILENAME, "exec"), namespace))
+    finally:
+        linecache.cache.pop(PROGRAM_FILENAME, None)
+        namespace.clear()
+    return return_code, limit_exceeded
+
+
+def _run_job(job: dict, limits: dict) -> dict:
+    stdout = _BoundedOutput(limits.get("max_output_bytes"))
+    stderr = _BoundedOutput(limits.get("max_output_bytes"))
+    saved = sys.stdin, sys.stdout, sys.stderr
+    sys.stdin = io.StringIO(job.get("input_data", ""))
+    sys.stdout, sys.stderr = stdout, stderr
+
+    measured_rss = _reset_peak_rss()
+    cpu_before = _cpu_time()
+    started = time.perf_counter()
+    try:
+        if limits.get("cpu_seconds"):
+            _arm_cpu_limit(limits["cpu_seconds"])
+        return_code, limit_exceeded = _execute(job["code"])
+    finally:
+        if limits.get("cpu_seconds"):
+            _disarm_cpu_limit()
+        elapsed = time.perf_counter() - started
+        sys.stdin, sys.stdout, sys.stderr = saved
+
+    return {
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+        "return_code": return_code,
+        "truncated": stdout.truncated or stderr.truncated,
+        "run_time": elapsed,
+        "cpu_time": _cpu_time() - cpu_before,
+        "peak_rss_kb": _peak_rss_kb() if measured_rss else None,
+        "limit_exceeded": limit_exceeded,
+    }
+
+
+def _silent_input(prompt=""):
+    """input() that does not echo the prompt, so prompts are not part of graded output"""
+    line = sys.stdin.readline()
+    if not line:
+        raise EOFError("EOF when reading a line")
+    return line[:-1] if line.endswith("\n") else line
+
+
+def _grading_namespace() -> dict:
+    namespace = _main_namespace()
+    namespace["input"] = _silent_input
+    return namespace
+
+
+def _arm_deadline(seconds: float, limits: dict):
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    cpu_seconds = limits.get("cpu_seconds")
+    _arm_cpu_limit(min(cpu_seconds, seconds) if cpu_seconds else seconds)
+
+
+def _disarm_deadline():
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    _disarm_cpu_limit()
+
+
+def _run_case(body, input_data: str, timeout: float, limits: dict, budget) -> dict:
+    """Run one test case with its own stdin, output capture, timeout and CPU limit"""
+    stdout = _BoundedOutput(budget)
+    stderr = _BoundedOutput(budget)
+    saved = sys.stdin, sys.stdout, sys.stderr
+    sys.stdin = io.StringIO(input_data)
+    sys.stdout, sys.stderr = stdout, stderr
+
+    cpu_before = _cpu_time()
+    started = time.perf_counter()
+    try:
+        try:
+            _arm_deadline(timeout, limits)
+            return_code, limit_exceeded, value = _guarded(body)
+        except CaseTimeLimitExceeded:
+            # The alarm went off after the case finished but before it was disarmed
+            return_code, limit_exceeded, value = 1, "timeout", None
+        finally:
+            _disarm_deadline()
+    finally:
+        elapsed = time.perf_counter() - started
+        sys.stdin, sys.stdout, sys.stderr = saved
+
+    return {
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+        "return_code": return_code,
+        "return_value": value,
+        "truncated": stdout.truncated or stderr.truncated,
+        "run_time": elapsed,
+        "cpu_time": _cpu_time() - cpu_before,
+        "limit_exceeded": limit_exceeded,
+    }
+
+
+def _call(namespace: dict, case: dict):
+    function = namespace.get(case["call"])
+    if not callable(function):
+        raise NameError(f"function '{case['call']}' is not defined")
+    value = function(*case.get("args", []), **case.get("kwargs", {}))
+    # Round trip through JSON, so the backend compares plain values and not
+    # objects whose __eq__ the program defines
+    return json.loads(json.dumps(value))
+
+
+def _grade_job(job: dict, limits: dict) -> dict:
+    """
+    Compile a program once and run each test case against it
+
+    Returns:
+        Dict with one result per case (or an error if the program does not
+        compile), the totals for run_time and cpu_time, peak_rss_kb, and the
+        first cpu or memory limit any case hit
+    """
+    code, cases = job["code"], job["cases"]
+    budget = limits.get("max_output_bytes")
+    if budget is not None:
+        # Keep the whole report within what the backend reads
+        budget = max(1024, budget // (2 * len(cases) + 2))
+
+    measured_rss = _reset_peak_rss()
+    cpu_before = _cpu_time()
+    started = time.perf_counter()
+    linecache.cache[PROGRAM_FILENAME] = (len(code), None, code.splitlines(True), PROGRAM_FILENAME)
+    loaded = load_failed = None
+    try:
+        try:
+            compiled = compile(code, PROGRAM_FILENAME, "exec")
+        except (SyntaxError, ValueError) as e:
+            return {"error": "".join(traceback.format_exception_only(type(e), e)), "cases": []}
+
+        results = []
+        for case in cases:
+            timeout = case.get("timeout") or DEFAULT_CASE_TIMEOUT
+            if case.get("call") is None:
+                namespace = _grading_namespace()
+                try:
+                    results.append(_run_case(lambda: exec(compiled, namespace), case.get("input", ""),
+                                             timeout, limits, budget))
+                finally:
+                    namespace.clear()
+                continue
+
+            if loaded is None:
+                # Load the program once for every case that calls into it
+                loaded = _grading_namespace()
+                load = _run_case(lambda: exec(compiled, loaded), "", job.get("load_timeout") or DEFAULT_CASE_TIMEOUT,
+                                 limits, budget)
+                load_failed = load if load["return_code"] != 0 else None
+            if load_failed is not None:
+                results.append({**load_failed, "stdout": "", "return_value": None})
+                continue
+            results.append(_run_case(lambda: _call(loaded, case), case.get("input", ""), timeout, limits, budget))
+    finally:
+        linecache.cache.pop(PROGRAM_FILENAME, None)
+        if loaded is not None:
+            loaded.clear()
+
+    hard_limits = [result["limit_exceeded"] for result in results if result["limit_exceeded"] in ("cpu", "memory")]
+    return {
+        "cases": results,
+        "run_time": time.perf_counter() - started,
+        "cpu_time": _cpu_time() - cpu_before,
+        "peak_rss_kb": _peak_rss_kb() if measured_rss else None,
+        "limit_exceeded": hard_limits[0] if hard_limits else None,
+    }
+
+
+def serve(limits: dict):
+    # Keep private handles on the protocol pipes, then detach fds 0-2 from them
+    protocol_in = os.fdopen(os.dup(0), "rb", buffering=0)
+    protocol_out = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+
+    apply_limits(limits)
+    baseline = _Baseline()
+    _send(protocol_out, {"ready": True, "pid": os.getpid()})
+
+    while True:
+        try:
+            job = _receive(protocol_in)
+        except EOFError:
+            return
+        result = _grade_job(job, limits) if "cases" in job else _run_job(job, limits)
+        result["job_id"] = job.get("job_id")
+        result["leak"] = baseline.check()
+        _send(protocol_out, result)
+
+
+def run_once(limits: dict, program_fd: int, stats_fd: int, line_buffered: bool = False) -> int:
+    with os.fdopen(program_fd, "rb") as program:
+        code = program.read().decode("utf-8")
+    # Opened now: the audit hook refuses opening descriptors
+    stats_file = os.fdopen(stats_fd, "wb")
+    sys.argv = [PROGRAM_FILENAME]
+    if line_buffered:
+        sys.stdout.reconfigure(line_buffering=True)
+    apply_limits(limits)
+    if limits.get("cpu_seconds"):
+        _arm_cpu_limit(limits["cpu_seconds"], kill_after=True)
+
+    started = time.perf_counter()
+    return_code, limit_exceeded = _execute(code)
+    elapsed = time.perf_counter() - started
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except OSError:
+        pass
+
+    stats = {
+        "run_time": elapsed,
+        "cpu_time": _cpu_time(),
+        "peak_rss_kb": _peak_rss_kb(),
+        "limit_exceeded": limit_exceeded,
+    }
+    with stats_file:
+        stats_file.write(json.dumps(stats).encode("utf-8"))
+    return return_code
+
+
+def grade_once(limits: dict, program_fd: int, stats_fd: int) -> int:
+    with os.fdopen(program_fd, "rb") as program:
+        code = program.read().decode("utf-8")
+    cases = json.loads(sys.stdin.read())
+    stats_file = os.fdopen(stats_fd, "wb")
+    sys.argv = [PROGRAM_FILENAME]
+    apply_limits(limits)
+
+    report = _grade_job({"code": code, "cases": cases}, limits)
+    # Lone surrogates in program output become JSON escapes
+    sys.stdout.buffer.write(json.dumps(report, ensure_ascii=False).encode("utf-8", "backslashreplace"))
+    sys.stdout.flush()
+
+    stats = {key: report.get(key) for key in ("run_time", "cpu_time", "peak_rss_kb", "limit_exceeded")}
+    with stats_file:
+        stats_file.write(json.dumps(stats).encode("utf-8"))
+    return 0
+
+
+def main():
+    mode = sys.argv[1] if len(sys.argv) > 1 else "serve"
+    if mode == "grade":
+        sys.exit(grade_once(json.loads(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])))
+    if mode in ("run", "stream"):
+        sys.exit(run_once(json.loads(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]), line_buffered=mode == "stream"))
+    serve(json.loads(sys.argv[2]) if len(sys.argv) > 2 else {})
+
+
+if __name__ == "__main__":
+    main()
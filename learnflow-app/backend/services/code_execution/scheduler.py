@@ -0,0 +1,226 @@
+"""
+Execution Scheduler for LearnFlow
+Caps concurrent code executions and shares the slots fairly between users and priority classes
+
+Every execution takes a slot from a global pool sized to the CPU count. When
+none is free the request waits in a queue:
+
+- Waiters are grouped by priority class. Exercise grading is served ahead of
+  scratch runs, but with weights (3 grading grants for every scratch grant
+  while both are waiting), so a grading burst cannot starve scratch runs.
+- Within a class, users are served round robin, one run per user per turn, so
+  a burst from one classroom (or one user resubmitting) only delays itself.
+- The queue is bounded overall and per user, and a waiter gives up after
+  max_wait. Requests that cannot be queued raise SchedulerOverloaded with a
+  Retry-After estimate based on the recent run time, which the API returns as
+  a 503.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+from ..metrics import metrics
+
+PRIORITY_GRADING = "grading"
+PRIORITY_SCRATCH = "scratch"
+
+# Grants per turn for each class, highest priority first
+DEFAULT_WEIGHTS = {PRIORITY_GRADING: 3, PRIORITY_SCRATCH: 1}
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when an execution cannot be queued; retry_after is in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _PriorityClass:
+    """Per-user FIFO queues of waiters, served round robin"""
+
+    def __init__(self, name: str, weight: int):
+        self.name = name
+        self.weight = weight
+        self.credits = weight
+        self.users: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.waiting = 0
+
+    def push(self, user_id: str, waiter: asyncio.Future):
+        self.users.setdefault(user_id, deque()).append(waiter)
+        self.waiting += 1
+
+    def pop(self) -> asyncio.Future:
+        user_id, waiters = next(iter(self.users.items()))
+        waiter = waiters.popleft()
+        self.waiting -= 1
+        # The user goes to the back of the line, or leaves it
+        del self.users[user_id]
+        if waiters:
+            self.users[user_id] = waiters
+        return waiter
+
+    def remove(self, user_id: str, waiter: asyncio.Future) -> bool:
+        waiters = self.users.get(user_id)
+        if waiters is None or waiter not in waiters:
+            return False
+        waiters.remove(waiter)
+        self.waiting -= 1
+        if not waiters:
+            del self.users[user_id]
+        return True
+
+
+class ExecutionScheduler:
+    def __init__(self, max_concurrency: Optional[int] = None, max_queue: int = 100,
+                 max_queued_per_user: int = 5, max_wait: float = 30.0,
+                 weights: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            max_concurrency: Executions running at once (defaults to the CPU count)
+            max_queue: Executions waiting at once, over all users
+            max_queued_per_user: Executions one user may have waiting
+            max_wait: Seconds an execution may wait for a slot
+            weights: Grants per turn for each priority class, highest priority first
+        """
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        self.max_wait = max_wait
+        self._classes = [_PriorityClass(name, weight) for name, weight in (weights or DEFAULT_WEIGHTS).items()]
+        self._by_name = {priority.name: priority for priority in self._classes}
+        self._running = 0
+        self._queued_by_user: Dict[str, int] = {}
+        # Smoothed run time, for Retry-After
+        self._avg_run_seconds = 1.0
+
+        self._queue_time = metrics.latency("code_execution_queue_seconds")
+        self._shed = metrics.counter("code_execution_shed")
+
+    @property
+    def queued(self) -> int:
+        return sum(priority.waiting for priority in self._classes)
+
+    def _retry_after(self) -> int:
+        """Seconds until the current backlog has probably drained"""
+        backlog = self.queued / self.max_concurrency + 1
+        return max(1, min(60, math.ceil(backlog * self._avg_run_seconds)))
+
+    def _next_class(self) -> Optional[_PriorityClass]:
+        """Weighted round robin over classes that have waiters"""
+        waiting = [priority for priority in self._classes if priority.waiting]
+        if not waiting:
+            return None
+        for priority in waiting:
+            if priority.credits > 0:
+                priority.credits -= 1
+                return priority
+        # Every waiting class spent its credits: start a new turn
+        for priority in self._classes:
+            priority.credits = priority.weight
+        waiting[0].credits -= 1
+        return waiting[0]
+
+    def _dispatch(self):
+        """Hand free slots to waiters"""
+        while self._running < self.max_concurrency:
+            priority = self._next_class()
+            if priority is None:
+                return
+            waiter = priority.pop()
+            if waiter.done():
+                continue
+            self._running += 1
+            waiter.set_result(None)
+
+    def _shed_request(self, reason: str, priority: str):
+        self._shed.inc(reason=reason, priority=priority)
+        retry_after = self._retry_after()
+        raise SchedulerOverloaded(
+            f"Code execution is busy ({reason}); retry in {retry_after}s", retry_after
+        )
+
+    async def acquire(self, user_id: str, priority: str = PRIORITY_SCRATCH):
+        """
+        Wait for an execution slot
+
+        Args:
+            user_id: User the execution is for
+            priority: PRIORITY_GRADING or PRIORITY_SCRATCH
+
+        Raises:
+            SchedulerOverloaded: If the queue is full or the wait ran past max_wait
+        """
+        target = self._by_name.get(priority)
+        if target is None:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        started = time.perf_counter()
+        if self._running < self.max_concurrency and not self.queued:
+            self._running += 1
+            self._queue_time.observe(0.0, priority=priority)
+            return
+
+        if self.queued >= self.max_queue:
+            self._shed_request("queue_full", priority)
+        if self._queued_by_user.get(user_id, 0) >= self.max_queued_per_user:
+            self._shed_request("user_queue_full", priority)
+
+        waiter = asyncio.get_running_loop().create_future()
+        target.push(user_id, waiter)
+        self._queued_by_user[user_id] = self._queued_by_user.get(user_id, 0) + 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_wait)
+        except BaseException as e:
+            if not target.remove(user_id, waiter) and waiter.done() and not waiter.cancelled():
+                # Granted just as we gave up: pass the slot on
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                self._shed_request("wait_timeout", priority)
+            raise
+        finally:
+            remaining = self._queued_by_user.get(user_id, 1) - 1
+            if remaining:
+                self._queued_by_user[user_id] = remaining
+            else:
+                self._queued_by_user.pop(user_id, None)
+            self._queue_time.observe(time.perf_counter() - started, priority=priority)
+
+    def release(self, run_seconds: Optional[float] = None):
+        """
+        Return a slot and wake the next waiter
+
+        Args:
+            run_seconds: How long the execution held the slot, for Retry-After
+        """
+        self._running -= 1
+        if run_seconds is not None:
+            self._avg_run_seconds = 0.9 * self._avg_run_seconds + 0.1 * run_seconds
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, priority: str = PRIORITY_SCRATCH):
+        """Hold an execution slot for the duration of the block"""
+        await self.acquire(user_id, priority)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get slot usage, queue depth per class and queue-time percentiles"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self._running,
+            "queued": {priority.name: priority.waiting for priority in self._classes},
+            "users_waiting": len(self._queued_by_user),
+            "avg_run_seconds": round(self._avg_run_seconds, 3),
+            "queue_time": {
+                priority.name: self._queue_time.summary(priority=priority.name) for priority in self._classes
+            },
+        }
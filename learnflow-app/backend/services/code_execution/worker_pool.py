@@ -0,0 +1,280 @@
+"""
+Warm Worker Pool for LearnFlow
+Keeps pre-started sandbox interpreters ready so a submission skips interpreter startup
+
+Each worker is a `python -I sandbox_worker.py serve` process started in its
+own empty working directory (or / on a read-only filesystem) with a minimal
+environment and the pool's ResourceLimits (and cgroup scope, when configured).
+A worker handles one job at a time and is retired after max_jobs_per_worker
+jobs, when it reports leftover state from a program, when a program hits the
+memory or CPU limit, when a job times out or when it dies. Retired workers are
+replaced in the background, so the pool refills by itself.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from ..metrics import metrics
+from .limits import CgroupManager, CgroupScope, ResourceLimits
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct(">I")
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+# Largest protocol frame accepted from a worker
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+class WorkerError(Exception):
+    """Raised when a worker dies or breaks the protocol"""
+    pass
+
+
+class SandboxWorker:
+    """Handle on one sandbox interpreter process"""
+
+    def __init__(self, process: asyncio.subprocess.Process, workdir: Optional[str],
+                 scope: Optional[CgroupScope] = None):
+        self.process = process
+        self.workdir = workdir
+        self.scope = scope
+        self.jobs = 0
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def send(self, message: Dict[str, Any]):
+        payload = json.dumps(message).encode('utf-8')
+        self.process.stdin.write(_LENGTH.pack(len(payload)) + payload)
+        await self.process.stdin.drain()
+
+    async def receive(self) -> Dict[str, Any]:
+        try:
+            (size,) = _LENGTH.unpack(await self.process.stdout.readexactly(_LENGTH.size))
+            if size > MAX_FRAME_BYTES:
+                raise WorkerError(f"Worker {self.pid} sent an oversized frame ({size} bytes)")
+            return json.loads(await self.process.stdout.readexactly(size))
+        except asyncio.IncompleteReadError:
+            raise WorkerError(f"Worker {self.pid} exited unexpectedly")
+
+    async def kill(self):
+        if self.alive:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+        await self.process.wait()
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+        if self.scope is not None:
+            self.scope.remove()
+
+
+class WorkerPool:
+    def __init__(self, size: int = 4, max_jobs_per_worker: int = 100, python: Optional[str] = None,
+                 spawn_timeout: float = 10.0, limits: Optional[ResourceLimits] = None,
+                 cgroups: Optional[CgroupManager] = None):
+        """
+        Args:
+            size: Number of warm workers to keep
+            max_jobs_per_worker: Jobs a worker runs before it is replaced
+            python: Interpreter used for workers (defaults to the current one)
+            spawn_timeout: Seconds a new worker may take to report ready
+            limits: Limits applied to every worker; the CPU limit is per job
+            cgroups: Gives each worker its own cgroup v2 scope when available
+        """
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.python = python or sys.executable
+        self.spawn_timeout = spawn_timeout
+        self.limits = limits or ResourceLimits(memory_mb=None, max_processes=None)
+        self.cgroups = cgroups
+
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: List[SandboxWorker] = []
+        self._refill_tasks: set = set()
+        self._closed = False
+
+        self._latency = metrics.latency("code_execution_seconds")
+        self._recycled = metrics.counter("sandbox_workers_recycled")
+
+    async def start(self):
+        """Start the pool and wait until every worker is warm"""
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        results = await asyncio.gather(*(self._add_worker() for _ in range(self.size)), return_exceptions=True)
+        failures = [result for result in results if isinstance(result, Exception)]
+        if len(failures) == self.size:
+            raise WorkerError(f"Could not start any sandbox worker: {failures[0]}")
+        for failure in failures:
+            logger.error(f"Failed to start sandbox worker: {str(failure)}")
+            self._schedule_refill()
+        logger.info(f"Sandbox worker pool started with {self.size - len(failures)}/{self.size} workers")
+
+    async def _spawn(self) -> SandboxWorker:
+        try:
+            workdir = tempfile.mkdtemp(prefix="learnflow-sandbox-")
+        except OSError:
+            # No writable temp dir (read-only root): run from / instead
+            workdir = None
+        scope = self.cgroups.create_scope(self.limits, prefix="worker") if self.cgroups is not None else None
+        limits = json.dumps(self.limits.to_worker(cgroup=scope.path if scope is not None else None))
+        env = {"PATH": os.environ.get("PATH", "/usr/bin:/bin"), "PYTHONHASHSEED": "0", "PYTHONIOENCODING": "utf-8"}
+        starting = asyncio.ensure_future(asyncio.create_subprocess_exec(
+            self.python, "-I", WORKER_SCRIPT, "serve", limits,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            cwd=workdir or "/",
+            env=env,
+            limit=MAX_FRAME_BYTES,
+        ))
+        try:
+            process = await asyncio.shield(starting)
+        except asyncio.CancelledError:
+            # A cancelled create_subprocess_exec can leave a child nobody reaps,
+            # so let it finish and kill the process properly
+            worker = SandboxWorker(await starting, workdir, scope)
+            await worker.kill()
+            raise
+        except BaseException:
+            if scope is not None:
+                scope.remove()
+            raise
+        worker = SandboxWorker(process, workdir, scope)
+        try:
+            ready = await asyncio.wait_for(worker.receive(), timeout=self.spawn_timeout)
+            if not ready.get("ready"):
+                raise WorkerError(f"Worker {worker.pid} sent an unexpected greeting")
+        except BaseException:
+            await worker.kill()
+            raise
+        return worker
+
+    async def _add_worker(self):
+        worker = await self._spawn()
+        if self._closed:
+            await worker.kill()
+            return
+        self._workers.append(worker)
+        self._idle.put_nowait(worker)
+
+    def _schedule_refill(self):
+        if self._closed:
+            return
+        task = asyncio.get_running_loop().create_task(self._refill())
+        self._refill_tasks.add(task)
+        task.add_done_callback(self._refill_tasks.discard)
+
+    async def _refill(self):
+        delay = 0.1
+        while not self._closed:
+            try:
+                await self._add_worker()
+                return
+            except Exception as e:
+                logger.error(f"Failed to start replacement sandbox worker: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+    async def _retire(self, worker: SandboxWorker, reason: str):
+        if worker in self._workers:
+            self._workers.remove(worker)
+        self._recycled.inc(reason=reason)
+        logger.debug(f"Retiring sandbox worker {worker.pid}: {reason}")
+        await worker.kill()
+        self._schedule_refill()
+
+    async def run(self, code: str, input_data: str = "", timeout: float = 10.0,
+                  cases: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Run a program on a warm worker
+
+        Args:
+            code: Python source to run as __main__
+            input_data: Text served to the program's stdin
+            timeout: Seconds the program may run
+            cases: Test cases to grade the program against instead of running it once
+
+        Returns:
+            Dict with stdout, stderr, return_code, truncated, run_time,
+            cpu_time, peak_rss_kb and limit_exceeded ("cpu", "memory",
+            "output" or None); when grading, cases (one result per case) or
+            error instead of the output fields
+
+        Raises:
+            asyncio.TimeoutError: If the program ran past the timeout
+            WorkerError: If the worker died while running the program
+        """
+        if self._idle is None:
+            await self.start()
+
+        worker = await self._idle.get()
+        started = time.perf_counter()
+        reason = ""
+        try:
+            job = {"job_id": uuid.uuid4().hex, "code": code, "input_data": input_data}
+            if cases is not None:
+                job["cases"] = cases
+            await worker.send(job)
+            result = await asyncio.wait_for(worker.receive(), timeout=timeout)
+            worker.jobs += 1
+            if result.get("leak"):
+                reason = "leak"
+                logger.info(f"Sandbox worker {worker.pid} retired: {result['leak']}")
+            elif result.get("limit_exceeded") in ("cpu", "memory"):
+                # The heap may be fragmented or the CPU limit armed mid-cleanup
+                reason = "limit"
+            elif worker.jobs >= self.max_jobs_per_worker:
+                reason = "max_jobs"
+            return result
+        except asyncio.TimeoutError:
+            reason = "timeout"
+            raise
+        except (WorkerError, ConnectionError) as e:
+            reason = "crashed"
+            raise WorkerError(str(e))
+        except BaseException:
+            # Cancelled mid-job: the worker may still be running the program
+            reason = "cancelled"
+            raise
+        finally:
+            self._latency.observe(time.perf_counter() - started, path="pool")
+            if reason or not worker.alive:
+                await self._retire(worker, reason or "died")
+            else:
+                self._idle.put_nowait(worker)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool occupancy"""
+        return {
+            "size": self.size,
+            "workers": len(self._workers),
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "refilling": len(self._refill_tasks),
+        }
+
+    async def close(self):
+        """Stop every worker"""
+        self._closed = True
+        # Replacements being started notice _closed and stop themselves;
+        # cancelling them mid-spawn could orphan the child process
+        await asyncio.gather(*list(self._refill_tasks), return_exceptions=True)
+        workers, self._workers = self._workers, []
+        await asyncio.gather(*(worker.kill() for worker in workers), return_exceptions=True)
+        self._idle = None
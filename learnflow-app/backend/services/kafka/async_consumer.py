@@ -0,0 +1,299 @@
+"""
+Async Consumer for LearnFlow
+Bridges librdkafka consumption into the asyncio event loop
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from confluent_kafka import KafkaError, KafkaException, TopicPartition
+
+from .consumer_engine import FailureHandler
+from .dispatcher import EventHandler, KeyedDispatcher, PartitionOffsetTracker
+from .event_collector import EVENT_BATCH_TYPE, unpack_records
+from .serialization import decode_event
+
+logger = logging.getLogger(__name__)
+
+
+class EventBatch:
+    """
+    A batch of consumed messages together with their decoded events
+
+    A coalesced request record contributes one entry per contained event, all
+    sharing the same message.
+    """
+
+    def __init__(self, messages: list, events: List[Optional[Dict[str, Any]]],
+                 topics: Optional[List[Optional[str]]] = None):
+        self.messages = messages
+        # None for messages that could not be decoded
+        self.events = events
+        # Topic each event was published for when it came inside a coalesced
+        # record, otherwise None
+        self.topics = topics if topics is not None else [None] * len(messages)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(zip(self.messages, self.events))
+
+    def next_offsets(self) -> List[TopicPartition]:
+        """Offsets to commit once the whole batch has been handled"""
+        offsets: Dict[Tuple[str, int], int] = {}
+        for msg in self.messages:
+            offsets[(msg.topic(), msg.partition())] = msg.offset() + 1
+        return [TopicPartition(topic, partition, offset) for (topic, partition), offset in offsets.items()]
+
+
+class AsyncConsumer:
+    def __init__(self, consumer, batch_size: int = 500, poll_timeout: float = 0.1,
+                 max_in_flight: int = 1000, decoder: Callable[[bytes], Dict[str, Any]] = decode_event,
+                 unpack_topics: Optional[List[str]] = None):
+        """
+        Args:
+            consumer: confluent_kafka.Consumer with auto-commit disabled
+            batch_size: Maximum number of messages fetched per consume() call
+            poll_timeout: Seconds a consume() call may block the bridge thread
+            max_in_flight: Events allowed to be queued or running in run()
+                before the assigned partitions are paused
+            decoder: Function turning a message value into an event dict
+            unpack_topics: Topics whose events are yielded when they arrive
+                inside a coalesced request record (None for all)
+        """
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.max_in_flight = max_in_flight
+        self.resume_threshold = max_in_flight // 2
+        self.decoder = decoder
+        self.unpack_topics = unpack_topics
+
+        # librdkafka calls block, so they run on one dedicated thread
+        self._bridge = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kafka-bridge")
+        self._running = False
+        self._paused: List[TopicPartition] = []
+        self.dispatcher: Optional[KeyedDispatcher] = None
+        # Set while run() is dispatching, for the rebalance callbacks
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tracker: Optional[PartitionOffsetTracker] = None
+
+        self.handler_errors = 0
+        self.revoked_events = 0
+
+    def subscribe(self, topics: List[str]):
+        """
+        Subscribe the consumer, settling partitions taken away by a rebalance
+
+        When partitions are revoked, what run() has finished for them is
+        committed, their queued events are dropped (the new owner consumes them
+        from the committed position) and events from them still running are
+        no longer tracked, so they cannot move the new owner's offsets back.
+        """
+        self.consumer.subscribe(topics, on_revoke=self._on_revoke, on_lost=self._on_lost)
+
+    def _release(self, partitions: List[TopicPartition], commit: bool):
+        # Runs on the bridge thread, inside consume() or close()
+        released = {(tp.topic, tp.partition) for tp in partitions}
+        if self._paused:
+            self._paused = [tp for tp in self._paused if (tp.topic, tp.partition) not in released]
+        loop = self._loop
+        if loop is None or self._tracker is None:
+            return
+
+        async def forget() -> Dict[Tuple[str, int], int]:
+            positions = self._tracker.committable()
+            self._tracker.forget(list(released))
+            self.revoked_events += self.dispatcher.discard(lambda token: token[0] in released)
+            return positions
+
+        # The event loop is free: it is waiting for this consume() call
+        positions = asyncio.run_coroutine_threadsafe(forget(), loop).result()
+        if commit and positions:
+            try:
+                self.consumer.commit(
+                    offsets=[TopicPartition(topic, partition, offset)
+                             for (topic, partition), offset in positions.items()],
+                    asynchronous=False
+                )
+            except KafkaException as e:
+                logger.warning(f"Could not commit offsets of revoked partitions: {str(e)}")
+        logger.info(f"Released {len(released)} partitions")
+
+    def _on_revoke(self, consumer, partitions: List[TopicPartition]):
+        self._release(partitions, commit=True)
+
+    def _on_lost(self, consumer, partitions: List[TopicPartition]):
+        # The group moved on without us: committing would fail
+        self._release(partitions, commit=False)
+
+    async def _fetch(self) -> list:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._bridge, self.consumer.consume, self.batch_size, self.poll_timeout)
+
+    def _decode(self, messages: list) -> EventBatch:
+        valid = []
+        events = []
+        topics = []
+        for msg in messages:
+            error = msg.error()
+            if error is not None:
+                if error.code() != KafkaError._PARTITION_EOF:
+                    logger.error(error)
+                continue
+            try:
+                event = self.decoder(msg.value())
+            except (ValueError, UnicodeDecodeError):
+                logger.error(f"Failed to decode message from {msg.topic()} [{msg.partition()}] at offset {msg.offset()}")
+                event = None
+
+            if event is not None and event.get("event_type") == EVENT_BATCH_TYPE:
+                unpacked = unpack_records(event, self.unpack_topics)
+                if not unpacked:
+                    # Nothing for us inside, but the offset still has to be committed
+                    unpacked = [(None, None)]
+                for topic, inner in unpacked:
+                    valid.append(msg)
+                    events.append(inner)
+                    topics.append(topic)
+                continue
+            valid.append(msg)
+            events.append(event)
+            topics.append(None)
+        return EventBatch(valid, events, topics)
+
+    def _commit(self, batch: EventBatch):
+        if batch.messages:
+            self.consumer.commit(offsets=batch.next_offsets(), asynchronous=True)
+
+    async def stream(self) -> AsyncIterator[EventBatch]:
+        """
+        Yield batches of consumed events
+
+        A batch's offsets are committed when the caller asks for the next one,
+        so everything handled inside the loop body is delivered at least once.
+        """
+        self._running = True
+        while self._running:
+            messages = await self._fetch()
+            if not messages:
+                continue
+            batch = self._decode(messages)
+            if not batch.messages:
+                continue
+            yield batch
+            self._commit(batch)
+
+    def _pause(self):
+        if not self._paused:
+            self._paused = self.consumer.assignment()
+            if self._paused:
+                self.consumer.pause(self._paused)
+                logger.debug(f"Paused {len(self._paused)} partitions with {self.dispatcher.in_flight} events in flight")
+
+    def _resume(self):
+        if self._paused:
+            self.consumer.resume(self._paused)
+            logger.debug(f"Resumed {len(self._paused)} partitions")
+            self._paused = []
+
+    def _commit_tracked(self, tracker: PartitionOffsetTracker):
+        positions = tracker.committable()
+        if positions:
+            self.consumer.commit(
+                offsets=[TopicPartition(topic, partition, offset) for (topic, partition), offset in positions.items()],
+                asynchronous=True
+            )
+
+    async def run(self, handler: EventHandler, lanes: Optional[int] = None, use_processes: bool = False,
+                  on_failure: Optional[FailureHandler] = None):
+        """
+        Run a handler over every consumed event
+
+        Events are spread over worker lanes by key, so different users are
+        handled in parallel while each user's events stay in order. Once
+        max_in_flight events are queued or running, consumption is paused.
+        For each partition only the lowest fully-processed offset is committed.
+
+        Args:
+            handler: Coroutine function (or plain function, run on lane threads)
+                called with each decoded event
+            lanes: Number of worker lanes (defaults to the CPU count)
+            use_processes: Run a plain-function handler in one process per lane
+            on_failure: Called on the bridge thread with (message, event,
+                error, topic) when the handler raises, before the message's offset may be
+                committed
+        """
+        loop = asyncio.get_running_loop()
+        tracker = PartitionOffsetTracker()
+        rerouting: Set[asyncio.Future] = set()
+
+        def finish(partition, offset, generation):
+            tracker.complete(partition, offset, generation)
+            if self._paused and self.dispatcher.in_flight <= self.resume_threshold:
+                self._resume()
+
+        def reroute(msg, event, error, topic):
+            try:
+                on_failure(msg, event, error, topic)
+            except Exception as e:
+                logger.error(f"Failed to reroute event from {msg.topic()}: {str(e)}")
+
+        def on_complete(token, error):
+            partition, offset, msg, event, topic, generation = token
+            if error is not None:
+                self.handler_errors += 1
+                if on_failure is not None:
+                    # Producing blocks while the producer's queue is full, so it
+                    # runs on the bridge thread; the offset counts as processed
+                    # once the event has been handed over
+                    future = loop.run_in_executor(self._bridge, reroute, msg, event, error, topic)
+                    rerouting.add(future)
+                    future.add_done_callback(lambda f: (rerouting.discard(f), finish(partition, offset, generation)))
+                    return
+            finish(partition, offset, generation)
+
+        self.dispatcher = KeyedDispatcher(handler, lanes=lanes, on_complete=on_complete, use_processes=use_processes)
+        self.dispatcher.start()
+        self._loop, self._tracker = loop, tracker
+        self._running = True
+        try:
+            while self._running:
+                messages = await self._fetch()
+                batch = self._decode(messages) if messages else None
+
+                if batch is not None:
+                    for msg, event, topic in zip(batch.messages, batch.events, batch.topics):
+                        partition = (msg.topic(), msg.partition())
+                        tracker.track(partition, msg.offset())
+                        if event is None:
+                            tracker.complete(partition, msg.offset())
+                            continue
+                        self.dispatcher.dispatch(msg.key(), event,
+                                                 (partition, msg.offset(), msg, event, topic, tracker.generation(partition)))
+
+                    if self.dispatcher.in_flight >= self.max_in_flight:
+                        self._pause()
+
+                self._commit_tracked(tracker)
+        finally:
+            self._running = False
+            await self.dispatcher.drain()
+            if rerouting:
+                await asyncio.gather(*rerouting)
+            await self.dispatcher.stop()
+            self._commit_tracked(tracker)
+            self._loop = self._tracker = None
+
+    def stop(self):
+        """Stop consuming after the current batch"""
+        self._running = False
+
+    async def close(self):
+        """Close the underlying consumer"""
+        self.stop()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._bridge, self.consumer.close)
+        self._bridge.shutdown(wait=False)
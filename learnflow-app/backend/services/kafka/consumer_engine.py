@@ -0,0 +1,205 @@
+"""
+Batched Consumer Engine for LearnFlow
+Consumes Kafka messages in batches with manual offset commits
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from confluent_kafka import KafkaError, TopicPartition
+
+from .event_collector import unpack_records
+from .serialization import decode_event
+
+logger = logging.getLogger(__name__)
+
+# (message, event, error, topic) -> None; topic is the event's own topic when
+# it came inside a coalesced request record, otherwise None
+FailureHandler = Callable[[Any, Dict[str, Any], BaseException, Optional[str]], None]
+
+
+class BatchConsumer:
+    def __init__(self, consumer, message_handler: Callable[[Dict[str, Any]], None],
+                 batch_size: int = 500, poll_timeout: float = 0.5, max_workers: int = 4,
+                 decoder: Callable[[bytes], Dict[str, Any]] = decode_event,
+                 report_interval: float = 30.0, unpack_topics: Optional[List[str]] = None,
+                 on_failure: Optional[FailureHandler] = None):
+        """
+        Args:
+            consumer: Subscribed confluent_kafka.Consumer with auto-commit disabled
+            message_handler: Function to handle each decoded message
+            batch_size: Maximum number of messages fetched per consume() call
+            poll_timeout: Seconds to wait for a batch to fill
+            max_workers: Size of the worker pool; 1 processes batches inline
+            decoder: Function turning a message value into an event dict
+            report_interval: Seconds between throughput/lag log lines
+            unpack_topics: Topics whose events are handled when they arrive
+                inside a coalesced request record (None for all)
+            on_failure: Called with (message, event, error, topic) when the
+                handler raises, e.g. RetryRouter.route; otherwise the event is dropped
+        """
+        self.consumer = consumer
+        self.message_handler = message_handler
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.max_workers = max_workers
+        self.decoder = decoder
+        self.report_interval = report_interval
+        self.unpack_topics = unpack_topics
+        self.on_failure = on_failure
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kafka-worker") \
+            if max_workers > 1 else None
+
+        # Metrics
+        self.messages_processed = 0
+        self.batches_processed = 0
+        self.handler_errors = 0
+        self.decode_errors = 0
+        self.throughput = 0.0
+        self.partition_lag: Dict[Tuple[str, int], int] = {}
+        self._window_start = time.monotonic()
+        self._window_messages = 0
+
+    def _group_by_key(self, messages: list) -> List[list]:
+        """
+        Split a batch into groups that must be processed in order
+
+        Messages sharing a key (the user_id) stay in one group in offset order.
+        Unkeyed messages are grouped by partition to keep partition order.
+        """
+        groups: Dict[Any, list] = {}
+        for msg in messages:
+            key = msg.key()
+            group_key = key if key is not None else (msg.topic(), msg.partition())
+            groups.setdefault(group_key, []).append(msg)
+        return list(groups.values())
+
+    def _process_groups(self, groups: List[list]) -> Tuple[int, int, int]:
+        """Handle groups one after another; returns (processed, decode errors, handler errors)"""
+        processed = decode_errors = handler_errors = 0
+        for msg in (msg for group in groups for msg in group):
+            try:
+                event_data = self.decoder(msg.value())
+            except (ValueError, UnicodeDecodeError):
+                decode_errors += 1
+                logger.error(f"Failed to decode message from {msg.topic()} [{msg.partition()}] at offset {msg.offset()}")
+                continue
+
+            failed = False
+            for topic, event in unpack_records(event_data, self.unpack_topics):
+                try:
+                    self.message_handler(event)
+                except Exception as e:
+                    failed = True
+                    handler_errors += 1
+                    logger.error(f"Error processing message from topic {msg.topic()}: {str(e)}")
+                    if self.on_failure is not None:
+                        try:
+                            self.on_failure(msg, event, e, topic)
+                        except Exception as reroute_error:
+                            logger.error(f"Failed to reroute event from {msg.topic()}: {str(reroute_error)}")
+            if not failed:
+                processed += 1
+        return processed, decode_errors, handler_errors
+
+    def process_batch(self, messages: list) -> int:
+        """
+        Process one batch and commit its offsets
+
+        Args:
+            messages: Messages returned by consumer.consume()
+
+        Returns:
+            Number of messages handled successfully
+        """
+        valid = []
+        for msg in messages:
+            error = msg.error()
+            if error is None:
+                valid.append(msg)
+            elif error.code() != KafkaError._PARTITION_EOF:
+                logger.error(error)
+
+        if not valid:
+            return 0
+
+        groups = self._group_by_key(valid)
+        if self._executor is None or len(groups) == 1:
+            results = [self._process_groups(groups)]
+        else:
+            # One task per worker rather than per key keeps scheduling overhead flat
+            buckets = [groups[i::self.max_workers] for i in range(min(self.max_workers, len(groups)))]
+            results = list(self._executor.map(self._process_groups, buckets))
+
+        self._commit(valid)
+
+        processed = sum(result[0] for result in results)
+        self.decode_errors += sum(result[1] for result in results)
+        self.handler_errors += sum(result[2] for result in results)
+        self.messages_processed += processed
+        self.batches_processed += 1
+        self._window_messages += len(valid)
+        return processed
+
+    def _commit(self, messages: list):
+        """Commit the next offset for every partition touched by the batch"""
+        # consume() returns each partition's messages in offset order
+        next_offsets: Dict[Tuple[str, int], int] = {}
+        for msg in messages:
+            next_offsets[(msg.topic(), msg.partition())] = msg.offset() + 1
+
+        self.consumer.commit(
+            offsets=[TopicPartition(topic, partition, offset) for (topic, partition), offset in next_offsets.items()],
+            asynchronous=True
+        )
+
+        for (topic, partition), offset in next_offsets.items():
+            try:
+                _, high = self.consumer.get_watermark_offsets(TopicPartition(topic, partition), cached=True)
+            except Exception:
+                continue
+            if high >= 0:
+                self.partition_lag[(topic, partition)] = max(high - offset, 0)
+
+    def _report(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.report_interval:
+            return
+        self.throughput = self._window_messages / elapsed
+        self._window_start = now
+        self._window_messages = 0
+        logger.info(
+            f"Consumer throughput {self.throughput:.0f} msg/s, total lag {sum(self.partition_lag.values())}, "
+            f"handler errors {self.handler_errors}"
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get consumer throughput and lag metrics"""
+        return {
+            "messages_processed": self.messages_processed,
+            "batches_processed": self.batches_processed,
+            "handler_errors": self.handler_errors,
+            "decode_errors": self.decode_errors,
+            "throughput": self.throughput,
+            "partition_lag": {f"{topic}[{partition}]": lag for (topic, partition), lag in self.partition_lag.items()},
+        }
+
+    def run(self, should_continue: Callable[[], bool]):
+        """
+        Consume and process batches until should_continue() returns False
+
+        Args:
+            should_continue: Checked before every consume() call
+        """
+        try:
+            while should_continue():
+                messages = self.consumer.consume(num_messages=self.batch_size, timeout=self.poll_timeout)
+                if messages:
+                    self.process_batch(messages)
+                self._report()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
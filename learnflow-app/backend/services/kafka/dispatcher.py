@@ -0,0 +1,225 @@
+"""
+Keyed Dispatcher for LearnFlow
+Processes events for different users in parallel while keeping each user's order
+"""
+import asyncio
+import inspect
+import logging
+import os
+import zlib
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+TopicPartitionKey = Tuple[str, int]
+EventHandler = Callable[[Dict[str, Any]], Union[None, Awaitable[None]]]
+
+
+class PartitionOffsetTracker:
+    """
+    Tracks in-flight offsets per partition
+
+    Events complete out of order across lanes, so the committable position of a
+    partition is the lowest offset that is not fully processed yet. An offset
+    may carry several events (a coalesced request record); it only counts as
+    processed once all of them are done.
+
+    When a partition is revoked its state is forgotten and its generation
+    moves on, so events from it that are still running when they complete
+    (passing the generation they were tracked under) are ignored, even if the
+    partition has been assigned back in the meantime.
+    """
+
+    def __init__(self):
+        self._offsets: Dict[TopicPartitionKey, Deque[int]] = {}
+        self._remaining: Dict[TopicPartitionKey, Dict[int, int]] = {}
+        self._commit_positions: Dict[TopicPartitionKey, int] = {}
+        self._generations: Dict[TopicPartitionKey, int] = {}
+        self._dirty = set()
+
+    def generation(self, partition: TopicPartitionKey) -> int:
+        """Number of times the partition was forgotten"""
+        return self._generations.get(partition, 0)
+
+    def track(self, partition: TopicPartitionKey, offset: int):
+        """Register an event dispatched from `offset`"""
+        offsets = self._offsets.setdefault(partition, deque())
+        remaining = self._remaining.setdefault(partition, {})
+        if offset in remaining:
+            remaining[offset] += 1
+        else:
+            offsets.append(offset)
+            remaining[offset] = 1
+
+    def complete(self, partition: TopicPartitionKey, offset: int, generation: Optional[int] = None):
+        """Mark one event from `offset` as processed, unless it was tracked before the partition was forgotten"""
+        if generation is not None and generation != self._generations.get(partition, 0):
+            return
+        remaining = self._remaining[partition]
+        remaining[offset] -= 1
+
+        offsets = self._offsets[partition]
+        while offsets and remaining[offsets[0]] == 0:
+            done = offsets.popleft()
+            del remaining[done]
+            self._commit_positions[partition] = done + 1
+            self._dirty.add(partition)
+
+    def pending(self) -> int:
+        """Number of offsets not fully processed"""
+        return sum(len(offsets) for offsets in self._offsets.values())
+
+    def committable(self) -> Dict[TopicPartitionKey, int]:
+        """Next offsets to commit for partitions that advanced since the last call"""
+        positions = {partition: self._commit_positions[partition] for partition in self._dirty}
+        self._dirty.clear()
+        return positions
+
+    def forget(self, partitions: List[TopicPartitionKey]):
+        """Drop state for partitions that were revoked"""
+        for partition in partitions:
+            self._offsets.pop(partition, None)
+            self._remaining.pop(partition, None)
+            self._commit_positions.pop(partition, None)
+            self._dirty.discard(partition)
+            self._generations[partition] = self._generations.get(partition, 0) + 1
+
+
+class KeyedDispatcher:
+    def __init__(self, handler: EventHandler, lanes: Optional[int] = None,
+                 on_complete: Optional[Callable[[Any, Optional[BaseException]], None]] = None,
+                 use_processes: bool = False):
+        """
+        Args:
+            handler: Event handler; coroutine functions run on the event loop,
+                plain functions run on a dedicated thread per lane
+            lanes: Number of worker lanes (defaults to the CPU count)
+            on_complete: Called with (token, error) after each event is handled;
+                error is None on success
+            use_processes: Run a plain-function handler in one worker process
+                per lane instead of a thread, so CPU-bound handlers scale past
+                the GIL (the handler must be picklable, i.e. module-level)
+        """
+        self.handler = handler
+        self.lanes = lanes or os.cpu_count() or 1
+        self.on_complete = on_complete
+        self._is_async = inspect.iscoroutinefunction(handler)
+        if use_processes and self._is_async:
+            raise ValueError("use_processes requires a plain (non-async) handler")
+        self.use_processes = use_processes
+
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._executors: List[Executor] = []
+        self.in_flight = 0
+
+        # Metrics
+        self.processed = 0
+        self.failed = 0
+
+    def lane_for(self, key: Optional[bytes]) -> int:
+        """Stable lane assignment so a key always lands on the same lane"""
+        if key is None:
+            return 0
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        return zlib.crc32(key) % self.lanes
+
+    def start(self):
+        """Start the lane workers"""
+        loop = asyncio.get_running_loop()
+        for lane in range(self.lanes):
+            queue = asyncio.Queue()
+            executor = None
+            if self.use_processes:
+                executor = ProcessPoolExecutor(max_workers=1)
+                self._executors.append(executor)
+            elif not self._is_async:
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"dispatch-lane-{lane}")
+                self._executors.append(executor)
+            self._queues.append(queue)
+            self._tasks.append(loop.create_task(self._run_lane(queue, executor)))
+
+    def dispatch(self, key: Optional[bytes], event: Dict[str, Any], token: Any = None):
+        """
+        Queue an event on its key's lane
+
+        Args:
+            key: Partitioning key (the user_id)
+            event: Decoded event
+            token: Opaque value handed back to on_complete
+        """
+        self.in_flight += 1
+        self._queues[self.lane_for(key)].put_nowait((event, token))
+
+    async def _run_lane(self, queue: asyncio.Queue, executor: Optional[Executor]):
+        loop = asyncio.get_running_loop()
+        while True:
+            event, token = await queue.get()
+            error = None
+            try:
+                if executor is None:
+                    await self.handler(event)
+                else:
+                    await loop.run_in_executor(executor, self.handler, event)
+                self.processed += 1
+            except Exception as e:
+                error = e
+                self.failed += 1
+                logger.error(f"Error processing event for {event.get('user_id', 'unknown')}: {str(e)}")
+            finally:
+                self.in_flight -= 1
+                queue.task_done()
+            if self.on_complete is not None:
+                self.on_complete(token, error)
+
+    def discard(self, predicate: Callable[[Any], bool]) -> int:
+        """
+        Drop queued events whose token matches, e.g. those of revoked partitions
+
+        Events already running are left alone; on_complete is not called for
+        dropped events.
+
+        Returns:
+            Number of events dropped
+        """
+        dropped = 0
+        for queue in self._queues:
+            taken = []
+            while not queue.empty():
+                taken.append(queue.get_nowait())
+            for item in taken:
+                if predicate(item[1]):
+                    dropped += 1
+                else:
+                    queue.put_nowait(item)
+            # After the kept events are queued again, so drain() never sees an empty lane in between
+            for _ in taken:
+                queue.task_done()
+        self.in_flight -= dropped
+        return dropped
+
+    def lane_depths(self) -> List[int]:
+        """Queued events per lane"""
+        return [queue.qsize() for queue in self._queues]
+
+    async def drain(self):
+        """Wait until every dispatched event has been handled"""
+        await asyncio.gather(*(queue.join() for queue in self._queues))
+
+    async def stop(self):
+        """Stop the lane workers; queued events are discarded"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        for executor in self._executors:
+            executor.shutdown(wait=False)
+        self._tasks = []
+        self._queues = []
+        self._executors = []
@@ -0,0 +1,117 @@
+"""
+Event Collector for LearnFlow
+Coalesces the events produced while handling one request into a single record
+
+While a collector is active (see KafkaService.collect_events), published events
+are buffered instead of sent. When the request finishes, events sharing a key
+are wrapped in one "event_batch" record on the request-events topic, so a
+request that emits an AI interaction and a user interaction costs one produce
+call instead of two. Consumers subscribe to request-events as well and fan the
+batch back out with unpack_events(), so handlers still see individual events.
+"""
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+COALESCED_TOPIC = "request-events"
+EVENT_BATCH_TYPE = "event_batch"
+
+# (topic, event, key)
+CollectedEvent = Tuple[str, Dict[str, Any], Optional[str]]
+
+_current_collector: ContextVar[Optional["EventCollector"]] = ContextVar("event_collector", default=None)
+
+
+class EventCollector:
+    """Buffers the events published during one request"""
+
+    def __init__(self):
+        self.events: List[CollectedEvent] = []
+
+    def add(self, topic: str, event_data: Dict[str, Any], key: Optional[str] = None):
+        self.events.append((topic, event_data, key))
+
+    def build_records(self) -> List[CollectedEvent]:
+        """
+        Turn the collected events into the records to publish
+
+        Events are grouped by key; a group with several events becomes one
+        event_batch record, a lone event is published unchanged.
+        """
+        groups: Dict[Optional[str], List[Tuple[str, Dict[str, Any]]]] = {}
+        for topic, event_data, key in self.events:
+            groups.setdefault(key, []).append((topic, event_data))
+
+        records = []
+        for key, events in groups.items():
+            if len(events) == 1:
+                topic, event_data = events[0]
+                records.append((topic, event_data, key))
+                continue
+            records.append((COALESCED_TOPIC, {
+                "event_type": EVENT_BATCH_TYPE,
+                "user_id": key,
+                "timestamp": time.time(),
+                "events": [{"topic": topic, "event": event_data} for topic, event_data in events],
+            }, key))
+        return records
+
+
+def current_collector() -> Optional[EventCollector]:
+    """Get the collector active in the current request, if any"""
+    return _current_collector.get()
+
+
+def start_collecting() -> Tuple[EventCollector, Any]:
+    """Activate a new collector; returns it with the token needed to deactivate it"""
+    collector = EventCollector()
+    return collector, _current_collector.set(collector)
+
+
+def stop_collecting(token: Any):
+    """Deactivate the collector set by start_collecting()"""
+    _current_collector.reset(token)
+
+
+def subscription_topics(topics: Iterable[str]) -> List[str]:
+    """Topics a consumer must subscribe to in order to see all events for `topics`"""
+    topics = list(topics)
+    if COALESCED_TOPIC not in topics:
+        topics.append(COALESCED_TOPIC)
+    return topics
+
+
+def unpack_records(event: Dict[str, Any],
+                   topics: Optional[Iterable[str]] = None) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+    """
+    Fan a coalesced record back out into (topic, event) pairs
+
+    Args:
+        event: A decoded event, coalesced or not
+        topics: Only return events originally destined for these topics
+
+    Returns:
+        Each event with the topic it was published for (None for a plain
+        event, which is returned as a one-item list)
+    """
+    if event.get("event_type") != EVENT_BATCH_TYPE:
+        return [(None, event)]
+    wanted = set(topics) if topics is not None else None
+    return [
+        (item.get("topic"), item["event"]) for item in event.get("events", [])
+        if wanted is None or item.get("topic") in wanted
+    ]
+
+
+def unpack_events(event: Dict[str, Any], topics: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Fan a coalesced record back out into its individual events
+
+    Args:
+        event: A decoded event, coalesced or not
+        topics: Only return events originally destined for these topics
+
+    Returns:
+        The individual events (a plain event is returned as a one-item list)
+    """
+    return [inner for _, inner in unpack_records(event, topics)]
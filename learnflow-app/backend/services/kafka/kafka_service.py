@@ -3,27 +3,107 @@ Kafka Service for LearnFlow
 Handles event-driven communication between services
 """
 from confluent_kafka import Producer, Consumer, KafkaException
-import json
 import logging
 import asyncio
-from typing import Dict, Any, Callable, Optional
+import os
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, List, Optional
 from threading import Thread
 import time
+from contextlib import asynccontextmanager
+
+from .async_consumer import AsyncConsumer, EventBatch
+from .consumer_engine import BatchConsumer
+from .memory_bus import MemoryBus, MemoryConsumer, MemoryProducer, get_memory_bus
+from .event_collector import current_collector, start_collecting, stop_collecting, subscription_topics
+from .outbox import EventOutbox, OutboxRecord
+from .retry import RetryPolicy, RetryRouter, RetryWorker
+from .serialization import EventSerializer, get_serializer
+from .stats import summarize_client_stats
+from ..metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# Producer tuning profiles. "low_latency" ships every message as soon as it is
+# produced, "balanced" lets librdkafka coalesce a few milliseconds of traffic
+# into compressed batches and "throughput" trades latency for large batches.
+PRODUCER_PROFILES = {
+    "low_latency": {
+        'linger.ms': 0,
+        'batch.size': 16384,
+        'compression.type': 'none',
+    },
+    "balanced": {
+        'linger.ms': 5,
+        'batch.size': 131072,
+        'compression.type': 'lz4',
+    },
+    "throughput": {
+        'linger.ms': 50,
+        'batch.size': 1048576,
+        'compression.type': 'zstd',
+        'queue.buffering.max.messages': 500000,
+    },
+}
+
+DEFAULT_PRODUCER_PROFILE = "balanced"
+
+# "kafka" talks to a real cluster, "memory" keeps every topic in this process
+TRANSPORTS = ("kafka", "memory")
+
+# librdkafka statistics are pushed through stats_cb at this interval
+DEFAULT_STATS_INTERVAL_MS = 15000
+
+# Successful deliveries are counted; one in this many per topic is logged
+DELIVERY_LOG_SAMPLE = 10000
+
+
 class KafkaService:
-    def __init__(self, bootstrap_servers: str = "localhost:9092"):
+    def __init__(self, bootstrap_servers: str = "localhost:9092",
+                 producer_profile: str = DEFAULT_PRODUCER_PROFILE,
+                 flush_on_send: bool = False,
+                 poll_interval: float = 0.05,
+                 serializer: Optional[EventSerializer] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 stats_interval_ms: int = DEFAULT_STATS_INTERVAL_MS,
+                 transport: str = "kafka",
+                 memory_bus: Optional[MemoryBus] = None):
+        if producer_profile not in PRODUCER_PROFILES:
+            raise ValueError(f"Unknown producer profile: {producer_profile}")
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown event bus transport: {transport}")
+
         self.bootstrap_servers = bootstrap_servers
+        self.transport = transport
+        self.memory_bus = (memory_bus or get_memory_bus()) if transport == "memory" else None
         self.producer = None
         self.consumer = None
         self.running = False
 
+        # When flush_on_send is True every send_event blocks until the broker
+        # acknowledges the message (the original behaviour). Otherwise messages
+        # are only enqueued and delivery reports are served by a background task.
+        self.producer_profile = producer_profile
+        self.flush_on_send = flush_on_send
+        self.poll_interval = poll_interval
+        self._poll_task: Optional[asyncio.Task] = None
+        self.serializer = serializer or get_serializer()
+        self.outbox: Optional[EventOutbox] = None
+        self.consumer_engine: Optional[BatchConsumer] = None
+        # Failed events go through these delay tiers before the DLQ
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_worker: Optional[RetryWorker] = None
+        self.stats_interval_ms = stats_interval_ms
+        self._delivered = metrics.counter("kafka_messages_delivered")
+        self._delivery_failures = metrics.counter("kafka_delivery_failures")
+
         # Configuration for producer
         self.producer_config = {
             'bootstrap.servers': bootstrap_servers,
             'acks': 'all',
             'enable.idempotence': True,
+            'statistics.interval.ms': stats_interval_ms,
+            'stats_cb': lambda raw: self._record_client_stats("kafka.producer", raw),
+            **PRODUCER_PROFILES[producer_profile],
         }
 
         # Configuration for consumer
@@ -31,13 +111,22 @@ class KafkaService:
             'bootstrap.servers': bootstrap_servers,
             'group.id': 'learnflow-group',
             'auto.offset.reset': 'earliest',
-            'enable.auto.commit': True,
+            # Offsets are committed by BatchConsumer once a batch is processed
+            'enable.auto.commit': False,
+            'statistics.interval.ms': stats_interval_ms,
         }
+        self.consumer_config['stats_cb'] = lambda raw: self._record_client_stats(
+            f"kafka.consumer.{self.consumer_config['group.id']}", raw)
+
+        metrics.register_source("kafka", self.get_stats)
 
     def connect_producer(self):
         """Connect to Kafka producer"""
         try:
-            self.producer = Producer(self.producer_config)
+            if self.memory_bus is not None:
+                self.producer = MemoryProducer(self.memory_bus, self.producer_config)
+            else:
+                self.producer = Producer(self.producer_config)
             logger.info("Connected to Kafka producer")
         except Exception as e:
             logger.error(f"Failed to connect to Kafka producer: {str(e)}")
@@ -46,20 +135,176 @@ class KafkaService:
     def connect_consumer(self):
         """Connect to Kafka consumer"""
         try:
-            self.consumer = Consumer(self.consumer_config)
+            self.consumer = self._new_consumer(self.consumer_config)
             logger.info("Connected to Kafka consumer")
         except Exception as e:
             logger.error(f"Failed to connect to Kafka consumer: {str(e)}")
             raise
 
+    def create_consumer(self, group_id: Optional[str] = None, offset_reset: Optional[str] = None) -> Consumer:
+        """
+        Create a standalone consumer, e.g. for an async stream
+
+        Args:
+            group_id: Consumer group (defaults to the service's group)
+            offset_reset: Where a group without committed offsets starts,
+                "earliest" (the default) or "latest"
+
+        Returns:
+            A confluent_kafka.Consumer, or a MemoryConsumer on the memory transport
+        """
+        config = dict(self.consumer_config)
+        if group_id:
+            config['group.id'] = group_id
+            config['stats_cb'] = lambda raw: self._record_client_stats(f"kafka.consumer.{group_id}", raw)
+        if offset_reset:
+            config['auto.offset.reset'] = offset_reset
+        return self._new_consumer(config)
+
+    def _new_consumer(self, config: Dict[str, Any]):
+        if self.memory_bus is not None:
+            return MemoryConsumer(self.memory_bus, config)
+        return Consumer(config)
+
     def delivery_callback(self, err, msg):
         """Callback for producer delivery reports"""
         if err is not None:
+            self._delivery_failures.inc(topic=msg.topic())
             logger.error(f'Message delivery failed: {err}')
         else:
-            logger.info(f'Message delivered to {msg.topic()} [{msg.partition()}]')
+            # Counting instead of logging every message keeps this off the hot path
+            delivered = self._delivered.inc(topic=msg.topic())
+            if delivered % DELIVERY_LOG_SAMPLE == 1:
+                logger.info(f'{delivered} messages delivered to {msg.topic()}')
+
+    @staticmethod
+    def _record_client_stats(name: str, raw: str):
+        """stats_cb for producers and consumers; runs inside poll()/consume()"""
+        try:
+            metrics.record_stats(name, summarize_client_stats(raw))
+        except Exception as e:
+            logger.error(f"Failed to parse Kafka statistics for {name}: {str(e)}")
 
-    async def send_event(self, topic: str, event_data: Dict[str, Any], key: Optional[str] = None):
+    async def health_check(self, timeout: float = 2.0) -> Dict[str, Any]:
+        """
+        Check that the producer can reach the cluster
+
+        Recent librdkafka statistics are used when available; otherwise the
+        cluster metadata is fetched as a probe.
+
+        Args:
+            timeout: Seconds to wait for the metadata probe
+
+        Returns:
+            Dict with "healthy", "brokers_up" and the source of the verdict
+        """
+        recorded_at, stats = metrics.get_stats("kafka.producer")
+        if stats is not None and time.time() - recorded_at < 3 * self.stats_interval_ms / 1000:
+            return {
+                "healthy": stats["brokers_up"] > 0,
+                "brokers_up": stats["brokers_up"],
+                "queue_messages": stats["queue_messages"],
+                "source": "statistics",
+            }
+
+        try:
+            if self.producer is None:
+                self.connect_producer()
+            metadata = await asyncio.get_running_loop().run_in_executor(None, self.producer.list_topics, None, timeout)
+            brokers_up = len(metadata.brokers)
+            return {"healthy": brokers_up > 0, "brokers_up": brokers_up, "source": "metadata"}
+        except Exception as e:
+            logger.error(f"Kafka health check failed: {str(e)}")
+            return {"healthy": False, "brokers_up": 0, "source": "metadata", "error": str(e)}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get producer, outbox, consumer and retry metrics"""
+        stats: Dict[str, Any] = {
+            "transport": self.transport,
+            "producer_profile": self.producer_profile,
+            "event_format": self.serializer.name,
+            "producer_queue": len(self.producer) if self.producer is not None else 0,
+        }
+        if self.outbox is not None:
+            stats["outbox"] = self.outbox.get_stats()
+        if self.consumer_engine is not None:
+            stats["consumer"] = self.consumer_engine.get_stats()
+        if self.retry_worker is not None:
+            stats["retry"] = self.retry_worker.get_stats()
+        return stats
+
+    def _on_delivery(self, delivery_future: asyncio.Future, err, msg):
+        """Delivery report for a single message; may run on any thread"""
+        self.delivery_callback(err, msg)
+        loop = delivery_future.get_loop()
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._resolve_delivery, delivery_future, err, msg)
+
+    @staticmethod
+    def _resolve_delivery(delivery_future: asyncio.Future, err, msg):
+        if delivery_future.done():
+            return
+        if err is not None:
+            delivery_future.set_exception(KafkaException(err))
+        else:
+            delivery_future.set_result(msg)
+
+    @staticmethod
+    def _mark_retrieved(delivery_future: asyncio.Future):
+        # Failures are already logged by delivery_callback; touching the
+        # exception keeps asyncio from warning about futures nobody awaited.
+        if not delivery_future.cancelled():
+            delivery_future.exception()
+
+    def start_polling(self):
+        """Start the background task that serves producer delivery reports"""
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_task = asyncio.get_running_loop().create_task(self._poll_loop())
+
+    async def _poll_loop(self):
+        """Drive producer.poll() without ever blocking the event loop"""
+        while True:
+            served = self.producer.poll(0) if self.producer is not None else 0
+            # Keep draining while reports are arriving, otherwise back off
+            await asyncio.sleep(0 if served else self.poll_interval)
+
+    def _serialize(self, event_data: Dict[str, Any]) -> bytes:
+        return self.serializer.encode(event_data)
+
+    async def _produce(self, topic: str, value: bytes, key: Optional[str] = None) -> asyncio.Future:
+        """
+        Enqueue a serialized message with the producer
+
+        Returns:
+            Future resolved by the message's delivery report
+        """
+        if self.producer is None:
+            self.connect_producer()
+
+        loop = asyncio.get_running_loop()
+        delivery_future = loop.create_future()
+        delivery_future.add_done_callback(self._mark_retrieved)
+
+        while True:
+            try:
+                self.producer.produce(
+                    topic=topic,
+                    key=key,
+                    value=value,
+                    callback=lambda err, msg: self._on_delivery(delivery_future, err, msg)
+                )
+                break
+            except BufferError:
+                # Local queue is full: serve delivery reports and retry
+                self.producer.poll(0)
+                await asyncio.sleep(self.poll_interval)
+
+        if not self.flush_on_send:
+            self.start_polling()
+        return delivery_future
+
+    async def send_event(self, topic: str, event_data: Dict[str, Any], key: Optional[str] = None,
+                         wait_for_delivery: bool = False) -> asyncio.Future:
         """
         Send an event to a Kafka topic
 
@@ -67,96 +312,293 @@ class KafkaService:
             topic: Kafka topic to send the event to
             event_data: Event data to send
             key: Optional key for partitioning
-        """
-        if not self.producer:
-            self.connect_producer()
+            wait_for_delivery: Wait until the broker acknowledges the message
 
+        Returns:
+            Future resolved with the delivered message (or the delivery error)
+        """
         try:
-            # Serialize the event data
-            serialized_data = json.dumps(event_data).encode('utf-8')
+            delivery_future = await self._produce(topic, self._serialize(event_data), key)
 
-            # Produce the message
-            self.producer.produce(
-                topic=topic,
-                key=key,
-                value=serialized_data,
-                callback=self.delivery_callback
-            )
+            if self.flush_on_send:
+                # Wait for any outstanding messages to be delivered and delivery reports to be received
+                self.producer.flush()
 
-            # Wait for any outstanding messages to be delivered and delivery reports to be received
-            self.producer.flush()
-
-            logger.info(f"Event sent to topic {topic}")
+            logger.debug(f"Event queued for topic {topic}")
         except Exception as e:
             logger.error(f"Failed to send event to topic {topic}: {str(e)}")
             raise
 
-    def consume_events(self, topics: list, message_handler: Callable[[Dict[str, Any]], None]):
+        if wait_for_delivery:
+            await delivery_future
+        return delivery_future
+
+    async def _send_batch(self, records: List[OutboxRecord]):
+        """Ship a batch of outbox records and wait until all of them are delivered"""
+        delivery_futures = [await self._produce(topic, value, key) for topic, key, value in records]
+        if self.flush_on_send:
+            await asyncio.get_running_loop().run_in_executor(None, self.producer.flush)
+        await asyncio.gather(*delivery_futures)
+
+    async def enable_outbox(self, directory: str, **outbox_options):
         """
-        Consume events from Kafka topics
+        Route published events through a disk-backed outbox
 
         Args:
-            topics: List of topics to consume from
-            message_handler: Function to handle received messages
+            directory: Directory holding the outbox segment files
+            **outbox_options: Extra EventOutbox settings (segment size, fsync interval, ...)
         """
-        if not self.consumer:
-            self.connect_consumer()
+        self.outbox = EventOutbox(directory, **outbox_options)
+        self.outbox.open()
+        await self.outbox.start(self._send_batch)
+        logger.info(f"Kafka outbox enabled at {directory}")
+
+    async def publish(self, topic: str, event_data: Dict[str, Any], key: Optional[str] = None):
+        """
+        Publish an event without waiting on the broker
+
+        Inside collect_events() the event is buffered until the request ends.
+        Otherwise it goes through the outbox when one is enabled, or straight
+        to the producer.
+
+        Args:
+            topic: Kafka topic to send the event to
+            event_data: Event data to send
+            key: Optional key for partitioning
+        """
+        collector = current_collector()
+        if collector is not None:
+            collector.add(topic, event_data, key)
+        elif self.outbox is not None:
+            self.outbox.append(topic, self._serialize(event_data), key)
+        else:
+            await self.send_event(topic, event_data, key=key)
+
+    @asynccontextmanager
+    async def collect_events(self):
+        """
+        Coalesce every event published inside the block into as few records as possible
+
+        Usage:
+            async with kafka_service.collect_events():
+                await send_ai_interaction(...)
+                await send_user_interaction(...)
+        """
+        if current_collector() is not None:
+            # Already inside a request scope; the outer block publishes
+            yield current_collector()
+            return
 
+        collector, token = start_collecting()
         try:
-            self.consumer.subscribe(topics)
-            logger.info(f"Subscribed to topics: {topics}")
+            yield collector
+        finally:
+            stop_collecting(token)
+            for topic, event_data, key in collector.build_records():
+                await self.publish(topic, event_data, key=key)
 
-            while self.running:
-                # Poll for messages
-                msg = self.consumer.poll(timeout=1.0)
+    async def close(self, timeout: float = 10.0):
+        """
+        Stop the delivery poller and flush queued messages
 
-                if msg is None:
-                    continue
+        Args:
+            timeout: Maximum time in seconds to wait for outstanding deliveries
+        """
+        if self.outbox is not None:
+            # The drainer needs the delivery poller, so ship the backlog first
+            if not await self.outbox.wait_drained(timeout):
+                logger.warning(f"{self.outbox.backlog} events left in the outbox at shutdown")
+            await self.outbox.close()
+
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+
+        if self.producer is not None:
+            remaining = await asyncio.get_running_loop().run_in_executor(None, self.producer.flush, timeout)
+            if remaining:
+                logger.warning(f"{remaining} Kafka messages were not delivered before shutdown")
+
+    def create_retry_router(self, group_id: Optional[str] = None) -> RetryRouter:
+        """
+        Create a router that republishes failed events to retry tiers and the DLQ
 
-                if msg.error():
-                    if msg.error().code() == KafkaException._PARTITION_EOF:
-                        # End of partition event
-                        continue
-                    else:
-                        logger.error(msg.error())
-                        continue
+        Args:
+            group_id: Consumer group whose failures are routed (defaults to the
+                service's group); its tiers are not seen by other groups
+        """
+        if self.producer is None:
+            self.connect_producer()
+        return RetryRouter(self.producer, self.serializer, self.retry_policy,
+                           group_id or self.consumer_config['group.id'],
+                           delivery_callback=self.delivery_callback)
 
-                # Process the message
-                try:
-                    # Deserialize the message value
-                    event_data = json.loads(msg.value().decode('utf-8'))
+    def create_retry_worker(self, topics: list, handler: Callable[[Dict[str, Any]], None],
+                            router: RetryRouter) -> RetryWorker:
+        """
+        Create a worker that re-runs a handler on events from the retry tiers of `topics`
 
-                    # Call the message handler
-                    message_handler(event_data)
+        Args:
+            topics: Source topics whose retry tiers should be consumed
+            handler: Function to handle each retried event
+            router: Router of the main consumer; the worker consumes its
+                group's tiers as "<group>-retry" and routes repeat failures
+        """
+        consumer = self.create_consumer(f"{router.group}-retry")
+        # Coalesced events are rerouted under their own topic, so request-events has no tiers
+        consumer.subscribe(self.retry_policy.retry_topics(topics, router.group))
+        return RetryWorker(consumer, handler, router)
+
+    def consume_events(self, topics: list, message_handler: Callable[[Dict[str, Any]], None],
+                       batch_size: int = 500, max_workers: int = 4, retry: bool = True) -> BatchConsumer:
+        """
+        Consume events from Kafka topics
+
+        Args:
+            topics: List of topics to consume from
+            message_handler: Function to handle received messages
+            batch_size: Maximum number of messages processed per batch
+            max_workers: Size of the worker pool handling a batch
+            retry: Send events the handler fails on through the retry tiers
+                and the DLQ instead of dropping them
 
-                    logger.info(f"Processed message from topic {msg.topic()}")
-                except json.JSONDecodeError:
-                    logger.error(f"Failed to decode JSON from message: {msg.value()}")
-                except Exception as e:
-                    logger.error(f"Error processing message: {str(e)}")
+        Returns:
+            The BatchConsumer that ran, for its metrics
+        """
+        if self.consumer is None:
+            self.connect_consumer()
+
+        router = None
+        retry_thread = None
+        if retry:
+            router = self.create_retry_router()
+            self.retry_worker = self.create_retry_worker(topics, message_handler, router)
+            retry_thread = Thread(target=self.retry_worker.run, args=(lambda: self.running,), daemon=True)
+            retry_thread.start()
+
+        engine = BatchConsumer(self.consumer, message_handler, batch_size=batch_size, max_workers=max_workers,
+                               unpack_topics=topics, on_failure=router.route if router else None)
+        self.consumer_engine = engine
 
+        try:
+            # Coalesced request records may carry events for these topics too
+            self.consumer.subscribe(subscription_topics(topics))
+            logger.info(f"Subscribed to topics: {topics}")
+
+            engine.run(lambda: self.running)
         except KeyboardInterrupt:
             logger.info("Consumer interrupted")
         finally:
             self.consumer.close()
+            self.consumer = None
+            if retry_thread is not None:
+                self.retry_worker.stop()
+                retry_thread.join()
+
+        return engine
 
-    def start_consumer_thread(self, topics: list, message_handler: Callable[[Dict[str, Any]], None]):
+    def start_consumer_thread(self, topics: list, message_handler: Callable[[Dict[str, Any]], None],
+                              batch_size: int = 500, max_workers: int = 4):
         """
         Start consumer in a separate thread
 
         Args:
             topics: List of topics to consume from
             message_handler: Function to handle received messages
+            batch_size: Maximum number of messages processed per batch
+            max_workers: Size of the worker pool handling a batch
         """
         self.running = True
         consumer_thread = Thread(
             target=self.consume_events,
-            args=(topics, message_handler),
+            args=(topics, message_handler, batch_size, max_workers),
             daemon=True
         )
         consumer_thread.start()
         return consumer_thread
 
+    async def stream(self, topics: list, group_id: Optional[str] = None,
+                     batch_size: int = 500) -> AsyncIterator[EventBatch]:
+        """
+        Consume events from Kafka topics inside the event loop
+
+        Usage:
+            async for batch in kafka_service.stream(["user-interactions"]):
+                for msg, event in batch:
+                    ...
+
+        Args:
+            topics: List of topics to consume from
+            group_id: Consumer group (defaults to the service's group)
+            batch_size: Maximum number of messages per batch
+        """
+        consumer = self.create_consumer(group_id)
+        async_consumer = AsyncConsumer(consumer, batch_size=batch_size, unpack_topics=topics)
+        async_consumer.subscribe(subscription_topics(topics))
+        try:
+            async for batch in async_consumer.stream():
+                yield batch
+        finally:
+            await async_consumer.close()
+
+    async def process_stream(self, topics: list, handler: Callable[[Dict[str, Any]], Awaitable[None]],
+                             group_id: Optional[str] = None, max_in_flight: int = 1000,
+                             lanes: Optional[int] = None, use_processes: bool = False,
+                             retry: bool = True, offset_reset: Optional[str] = None):
+        """
+        Run a handler over every event on the given topics
+
+        Events are hashed by key (user_id) onto worker lanes: different users
+        run in parallel, each user's events stay in order. Partitions are
+        paused while max_in_flight events are queued or running. Events the
+        handler fails on move through the retry tiers, handled by a retry
+        worker on its own thread, so they never hold up the main stream.
+
+        Args:
+            topics: List of topics to consume from
+            handler: Coroutine function (or plain function) called with each event
+            group_id: Consumer group (defaults to the service's group)
+            max_in_flight: Queued/running events before backpressure kicks in
+            lanes: Number of worker lanes (defaults to the CPU count)
+            use_processes: Run a plain-function handler in one process per lane
+            retry: Send events the handler fails on through the retry tiers
+                and the DLQ instead of dropping them
+            offset_reset: "latest" to skip what was published before a new
+                group first subscribed (defaults to "earliest")
+        """
+        loop = asyncio.get_running_loop()
+        consumer = self.create_consumer(group_id, offset_reset=offset_reset)
+        async_consumer = AsyncConsumer(consumer, max_in_flight=max_in_flight, unpack_topics=topics)
+        async_consumer.subscribe(subscription_topics(topics))
+
+        router = None
+        retry_worker = None
+        retry_future = None
+        if retry:
+            router = self.create_retry_router(group_id)
+            self.start_polling()
+            if asyncio.iscoroutinefunction(handler):
+                def retry_handler(event):
+                    asyncio.run_coroutine_threadsafe(handler(event), loop).result()
+            else:
+                retry_handler = handler
+            retry_worker = self.create_retry_worker(topics, retry_handler, router)
+            retry_future = loop.run_in_executor(None, retry_worker.run)
+
+        logger.info(f"Streaming topics {topics} with up to {max_in_flight} events in flight")
+        try:
+            await async_consumer.run(handler, lanes=lanes, use_processes=use_processes,
+                                     on_failure=router.route if router else None)
+        finally:
+            if retry_worker is not None:
+                retry_worker.stop()
+                await retry_future
+            await async_consumer.close()
+
     def stop_consumer(self):
         """Stop the consumer"""
         self.running = False
@@ -178,7 +620,7 @@ class KafkaService:
             "data": data
         }
 
-        await self.send_event("user-interactions", event, key=user_id)
+        await self.publish("user-interactions", event, key=user_id)
 
     async def send_progress_update_event(self, user_id: str, progress_data: Dict[str, Any]):
         """
@@ -195,7 +637,7 @@ class KafkaService:
             "progress_data": progress_data
         }
 
-        await self.send_event("progress-updates", event, key=user_id)
+        await self.publish("progress-updates", event, key=user_id)
 
     async def send_ai_interaction_event(self, user_id: str, query: str, response: str, agent_type: str):
         """
@@ -216,26 +658,114 @@ class KafkaService:
             "timestamp": time.time()
         }
 
-        await self.send_event("ai-interactions", event, key=user_id)
+        await self.publish("ai-interactions", event, key=user_id)
 
 
 # Global Kafka service instance
 kafka_service = KafkaService()
 
-async def init_kafka_service(bootstrap_servers: str = "localhost:9092"):
+async def init_kafka_service(bootstrap_servers: str = "localhost:9092", producer_profile: Optional[str] = None,
+                             outbox_dir: Optional[str] = None, event_format: Optional[str] = None,
+                             transport: Optional[str] = None):
     """
     Initialize the Kafka service
 
     Args:
         bootstrap_servers: Kafka bootstrap servers
+        producer_profile: Producer tuning profile (defaults to KAFKA_PRODUCER_PROFILE)
+        outbox_dir: Directory for the durable event outbox (defaults to KAFKA_OUTBOX_DIR, disabled if unset)
+        event_format: Event encoding: json, msgpack or compact (defaults to KAFKA_EVENT_FORMAT)
+        transport: "kafka" or the in-process "memory" bus (defaults to EVENT_BUS)
     """
     global kafka_service
-    kafka_service = KafkaService(bootstrap_servers)
-
-    # Connect the producer
+    kafka_service = KafkaService(
+        bootstrap_servers,
+        producer_profile=producer_profile or os.getenv("KAFKA_PRODUCER_PROFILE", DEFAULT_PRODUCER_PROFILE),
+        serializer=get_serializer(event_format or os.getenv("KAFKA_EVENT_FORMAT", "json")),
+        stats_interval_ms=int(os.getenv("KAFKA_STATS_INTERVAL_MS", DEFAULT_STATS_INTERVAL_MS)),
+        transport=transport or os.getenv("EVENT_BUS", "kafka")
+    )
+
+    # Connect the producer and start serving delivery reports
     kafka_service.connect_producer()
+    kafka_service.start_polling()
+
+    outbox_dir = outbox_dir or os.getenv("KAFKA_OUTBOX_DIR")
+    if outbox_dir:
+        await kafka_service.enable_outbox(outbox_dir)
+
+    logger.info(
+        f"Kafka service initialized on the '{kafka_service.transport}' transport with "
+        f"'{kafka_service.producer_profile}' producer profile and '{kafka_service.serializer.name}' event format"
+    )
+
+
+async def close_kafka_service():
+    """
+    Flush outstanding events and stop the Kafka service
+    """
+    await kafka_service.close()
+    logger.info("Kafka service closed")
+
+
+async def send_event(topic: str, event_data: Dict[str, Any], key: Optional[str] = None):
+    """
+    Convenience function to publish an arbitrary event
+
+    Args:
+        topic: Kafka topic
+        event_data: Event data
+        key: Optional key for partitioning
+    """
+    await kafka_service.publish(topic, event_data, key=key)
+
 
-    logger.info("Kafka service initialized")
+async def process_stream(topics: list, handler: Callable[[Dict[str, Any]], Awaitable[None]],
+                         group_id: Optional[str] = None, max_in_flight: int = 1000,
+                         lanes: Optional[int] = None, use_processes: bool = False, retry: bool = True,
+                         offset_reset: Optional[str] = None):
+    """
+    Convenience function to run a handler over a stream of events
+
+    Args:
+        topics: List of topics to consume from
+        handler: Coroutine function (or plain function) called with each event
+        group_id: Consumer group
+        max_in_flight: Queued/running events before backpressure kicks in
+        lanes: Number of worker lanes (defaults to the CPU count)
+        use_processes: Run a plain-function handler in one process per lane
+        retry: Send failed events through the retry tiers and the DLQ
+        offset_reset: "latest" to skip what was published before a new group subscribed
+    """
+    await kafka_service.process_stream(topics, handler, group_id=group_id, max_in_flight=max_in_flight,
+                                       lanes=lanes, use_processes=use_processes, retry=retry,
+                                       offset_reset=offset_reset)
+
+
+async def send_request(topic: str, event_data: Dict[str, Any], key: Optional[str] = None):
+    """
+    Convenience function to publish an event right away, for request/reply
+    traffic that someone is waiting on
+
+    Unlike send_event, the event is neither held back by collect_events()
+    nor routed through the outbox.
+
+    Args:
+        topic: Kafka topic
+        event_data: Event data
+        key: Optional key for partitioning
+    """
+    await kafka_service.send_event(topic, event_data, key=key)
+
+
+def collect_events():
+    """
+    Convenience function to coalesce the events of one request
+
+    Returns:
+        Async context manager; see KafkaService.collect_events
+    """
+    return kafka_service.collect_events()
 
 
 async def send_user_interaction(user_id: str, interaction_type: str, data: Dict[str, Any]):
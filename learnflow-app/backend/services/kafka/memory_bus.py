@@ -0,0 +1,408 @@
+"""
+In-Memory Event Bus for LearnFlow
+An in-process stand-in for a Kafka cluster, for development, CI and single-pod deployments
+
+MemoryProducer and MemoryConsumer duck-type the parts of confluent_kafka's
+Producer and Consumer that KafkaService uses, so the rest of the event
+pipeline (outbox, batch and async consumers, retries) runs unchanged. Each
+topic partition is a fixed-size ring buffer: once it is full the oldest
+messages are dropped, like retention on a real broker. Consumer groups,
+committed offsets, pause/resume and partition assignment across group members
+behave like Kafka's, within a single process.
+
+The bus is thread-safe; consume() blocks on a condition variable, so it is
+meant to be called from a consumer thread or an executor, as with Kafka.
+"""
+import itertools
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from confluent_kafka import KafkaError, TopicPartition
+
+DEFAULT_PARTITIONS = 6
+DEFAULT_PARTITION_CAPACITY = 100000
+
+# librdkafka's logical offsets
+OFFSET_BEGINNING = -2
+OFFSET_END = -1
+
+
+class MemoryMessage:
+    """A stored message with the accessor methods of confluent_kafka.Message"""
+
+    __slots__ = ("_topic", "_partition", "_offset", "_key", "_value", "_headers", "_timestamp", "_error")
+
+    def __init__(self, topic: str, partition: int, offset: int, key: Optional[bytes], value: bytes,
+                 headers: Optional[list] = None, error: Optional[KafkaError] = None):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._headers = headers
+        self._timestamp = int(time.time() * 1000)
+        self._error = error
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def headers(self):
+        return self._headers
+
+    def timestamp(self):
+        return 1, self._timestamp  # TIMESTAMP_CREATE_TIME
+
+    def error(self):
+        return self._error
+
+    def __len__(self):
+        return len(self._value) if self._value is not None else 0
+
+
+class _Partition:
+    """Fixed-size ring buffer of messages addressed by offset"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._slots: List[Optional[MemoryMessage]] = [None] * capacity
+        self.low = 0   # oldest offset still stored
+        self.high = 0  # offset of the next message
+
+    def append(self, message: MemoryMessage):
+        self._slots[self.high % self.capacity] = message
+        self.high += 1
+        if self.high - self.low > self.capacity:
+            self.low = self.high - self.capacity
+
+    def read(self, offset: int, limit: int) -> List[MemoryMessage]:
+        end = min(self.high, offset + limit)
+        return [self._slots[position % self.capacity] for position in range(offset, end)]
+
+
+class _ClusterMetadata:
+    """Enough of confluent_kafka's ClusterMetadata for health checks"""
+
+    def __init__(self, topics: Dict[str, int]):
+        self.brokers = {0: "memory"}
+        self.topics = topics
+
+
+class MemoryBus:
+    def __init__(self, num_partitions: int = DEFAULT_PARTITIONS,
+                 partition_capacity: int = DEFAULT_PARTITION_CAPACITY):
+        """
+        Args:
+            num_partitions: Partitions created for each new topic
+            partition_capacity: Messages kept per partition before the oldest are dropped
+        """
+        self.num_partitions = num_partitions
+        self.partition_capacity = partition_capacity
+        self._topics: Dict[str, List[_Partition]] = {}
+        self._committed: Dict[Tuple[str, str, int], int] = {}
+        self._members: Dict[str, List["MemoryConsumer"]] = {}
+        # (group, topic, partition) -> member it was revoked from that has not reported the revoke yet
+        self._releasing: Dict[Tuple[str, str, int], "MemoryConsumer"] = {}
+        self._round_robin = itertools.count()
+        self._condition = threading.Condition()
+
+    def _partitions(self, topic: str) -> List[_Partition]:
+        partitions = self._topics.get(topic)
+        if partitions is None:
+            # Topics are auto-created, as with auto.create.topics.enable
+            partitions = [_Partition(self.partition_capacity) for _ in range(self.num_partitions)]
+            self._topics[topic] = partitions
+        return partitions
+
+    def append(self, topic: str, key: Optional[bytes], value: bytes, headers: Optional[list] = None,
+               partition: Optional[int] = None) -> MemoryMessage:
+        """Store a message and wake up waiting consumers"""
+        with self._condition:
+            partitions = self._partitions(topic)
+            if partition is None or partition < 0:
+                if key is None:
+                    partition = next(self._round_robin) % len(partitions)
+                else:
+                    partition = zlib.crc32(key) % len(partitions)
+            target = partitions[partition]
+            message = MemoryMessage(topic, partition, target.high, key, value, headers)
+            target.append(message)
+            self._condition.notify_all()
+        return message
+
+    def watermarks(self, topic: str, partition: int) -> Tuple[int, int]:
+        with self._condition:
+            target = self._partitions(topic)[partition]
+            return target.low, target.high
+
+    def list_topics(self) -> Dict[str, int]:
+        with self._condition:
+            return {topic: len(partitions) for topic, partitions in self._topics.items()}
+
+    # Consumer groups
+
+    def _join(self, consumer: "MemoryConsumer"):
+        with self._condition:
+            members = self._members.setdefault(consumer.group_id, [])
+            if consumer not in members:
+                members.append(consumer)
+            self._rebalance(consumer.group_id)
+
+    def _leave(self, consumer: "MemoryConsumer"):
+        with self._condition:
+            members = self._members.get(consumer.group_id, [])
+            if consumer in members:
+                members.remove(consumer)
+                self._rebalance(consumer.group_id)
+            self._release(consumer)
+            self._condition.notify_all()
+
+    def _release(self, consumer: "MemoryConsumer", partitions: Optional[List[Tuple[str, int]]] = None):
+        """Let the new owners fetch from partitions the consumer has finished revoking (all if None)"""
+        with self._condition:
+            for key, member in list(self._releasing.items()):
+                if member is consumer and (partitions is None or key[1:] in partitions):
+                    del self._releasing[key]
+            self._condition.notify_all()
+
+    def _rebalance(self, group_id: str):
+        """Spread the group's partitions over its members, round robin"""
+        members = self._members.get(group_id, [])
+        topics = sorted({topic for member in members for topic in member.topics})
+        for topic in topics:
+            self._partitions(topic)
+        assignments: Dict[int, List[Tuple[str, int]]] = {id(member): [] for member in members}
+        for topic in topics:
+            subscribers = [member for member in members if topic in member.topics]
+            for partition in range(len(self._topics[topic])):
+                owner = subscribers[partition % len(subscribers)]
+                assignments[id(owner)].append((topic, partition))
+        for member in members:
+            member._assign(assignments[id(member)])
+
+    def commit(self, group_id: str, topic: str, partition: int, offset: int):
+        with self._condition:
+            self._committed[(group_id, topic, partition)] = offset
+
+    def committed(self, group_id: str, topic: str, partition: int) -> Optional[int]:
+        with self._condition:
+            return self._committed.get((group_id, topic, partition))
+
+
+class MemoryProducer:
+    def __init__(self, bus: MemoryBus, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            bus: Bus to publish to
+            config: Producer config; only kept for interface compatibility
+        """
+        self.bus = bus
+        self.config = config or {}
+        # Delivery reports are queued and served by poll()/flush(), as with librdkafka
+        self._reports: List[Tuple[Callable, MemoryMessage]] = []
+        self._lock = threading.Lock()
+
+    def produce(self, topic: str, value: Optional[bytes] = None, key: Any = None, partition: int = -1,
+                headers: Optional[list] = None, callback: Optional[Callable] = None,
+                on_delivery: Optional[Callable] = None, **kwargs):
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        message = self.bus.append(topic, key, value, headers=headers, partition=partition)
+        report = callback or on_delivery
+        if report is not None:
+            with self._lock:
+                self._reports.append((report, message))
+
+    def poll(self, timeout: Optional[float] = None) -> int:
+        with self._lock:
+            reports, self._reports = self._reports, []
+        for report, message in reports:
+            report(None, message)
+        return len(reports)
+
+    def flush(self, timeout: Optional[float] = None) -> int:
+        self.poll(0)
+        return 0
+
+    def list_topics(self, topic: Optional[str] = None, timeout: float = -1) -> _ClusterMetadata:
+        return _ClusterMetadata(self.bus.list_topics())
+
+    def __len__(self):
+        return len(self._reports)
+
+
+class MemoryConsumer:
+    def __init__(self, bus: MemoryBus, config: Dict[str, Any]):
+        """
+        Args:
+            bus: Bus to consume from
+            config: Consumer config; 'group.id' and 'auto.offset.reset' are honoured
+        """
+        self.bus = bus
+        self.group_id = config.get('group.id', 'default')
+        self.reset_to_latest = config.get('auto.offset.reset', 'latest') in ('latest', 'end', 'largest')
+        self.topics: List[str] = []
+        self._assignment: List[Tuple[str, int]] = []
+        self._positions: Dict[Tuple[str, int], int] = {}
+        self._paused: set = set()
+        self._closed = False
+        self._on_assign: Optional[Callable] = None
+        self._on_revoke: Optional[Callable] = None
+        # (revoked, assigned) changes not yet reported to the callbacks
+        self._rebalances: List[Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]] = []
+
+    def subscribe(self, topics: List[str], on_assign: Optional[Callable] = None, on_revoke: Optional[Callable] = None,
+                  on_lost: Optional[Callable] = None):
+        self.topics = list(topics)
+        self._on_assign = on_assign
+        self._on_revoke = on_revoke
+        self.bus._join(self)
+
+    def unsubscribe(self):
+        self.topics = []
+        self.bus._leave(self)
+
+    def _assign(self, partitions: List[Tuple[str, int]]):
+        # Called by the bus with its lock held
+        if self._on_assign is not None or self._on_revoke is not None:
+            revoked = [tp for tp in self._assignment if tp not in partitions]
+            assigned = [tp for tp in partitions if tp not in self._assignment]
+            if revoked or assigned:
+                self._rebalances.append((revoked, assigned))
+            if self._on_revoke is not None:
+                # As in Kafka, nobody fetches from them until on_revoke has run
+                for topic, partition in revoked:
+                    self.bus._releasing[(self.group_id, topic, partition)] = self
+        self._assignment = partitions
+        self._positions = {tp: pos for tp, pos in self._positions.items() if tp in partitions}
+        self._paused &= set(partitions)
+
+    def assignment(self) -> List[TopicPartition]:
+        return [TopicPartition(topic, partition) for topic, partition in self._assignment]
+
+    def _position(self, topic: str, partition: int, target: _Partition) -> int:
+        position = self._positions.get((topic, partition))
+        if position is None:
+            committed = self.bus._committed.get((self.group_id, topic, partition))
+            if committed is not None:
+                position = committed
+            else:
+                position = target.high if self.reset_to_latest else target.low
+        # Messages older than the ring buffer are gone
+        return max(position, target.low)
+
+    def _fetch(self, num_messages: int) -> List[MemoryMessage]:
+        messages = []
+        releasing = self.bus._releasing
+        for topic, partition in self._assignment:
+            if (topic, partition) in self._paused or (self.group_id, topic, partition) in releasing:
+                continue
+            target = self.bus._topics[topic][partition]
+            position = self._position(topic, partition, target)
+            batch = target.read(position, num_messages - len(messages))
+            self._positions[(topic, partition)] = position + len(batch)
+            messages.extend(batch)
+            if len(messages) >= num_messages:
+                break
+        return messages
+
+    def _report_rebalances(self):
+        """Call the rebalance callbacks from consume(), as librdkafka does"""
+        with self.bus._condition:
+            rebalances, self._rebalances = self._rebalances, []
+        for revoked, assigned in rebalances:
+            if revoked and self._on_revoke is not None:
+                try:
+                    self._on_revoke(self, [TopicPartition(topic, partition) for topic, partition in revoked])
+                finally:
+                    self.bus._release(self, revoked)
+            if assigned and self._on_assign is not None:
+                self._on_assign(self, [TopicPartition(topic, partition) for topic, partition in assigned])
+
+    def consume(self, num_messages: int = 1, timeout: float = -1) -> List[MemoryMessage]:
+        if self._closed:
+            raise RuntimeError("Consumer closed")
+        if self._rebalances:
+            self._report_rebalances()
+        deadline = None if timeout is None or timeout < 0 else time.monotonic() + timeout
+        with self.bus._condition:
+            while True:
+                if self._rebalances:
+                    # Report them on the next call
+                    return []
+                messages = self._fetch(num_messages)
+                if messages:
+                    return messages
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return []
+                self.bus._condition.wait(remaining)
+                if self._closed:
+                    return []
+
+    def poll(self, timeout: float = -1) -> Optional[MemoryMessage]:
+        messages = self.consume(1, timeout)
+        return messages[0] if messages else None
+
+    def commit(self, message: Optional[MemoryMessage] = None, offsets: Optional[List[TopicPartition]] = None,
+               asynchronous: bool = True):
+        if message is not None:
+            offsets = [TopicPartition(message.topic(), message.partition(), message.offset() + 1)]
+        if offsets is None:
+            offsets = [TopicPartition(topic, partition, position)
+                       for (topic, partition), position in self._positions.items()]
+        for tp in offsets:
+            self.bus.commit(self.group_id, tp.topic, tp.partition, tp.offset)
+        return None if asynchronous else offsets
+
+    def committed(self, partitions: List[TopicPartition], timeout: float = -1) -> List[TopicPartition]:
+        return [
+            TopicPartition(tp.topic, tp.partition, self.bus.committed(self.group_id, tp.topic, tp.partition) or -1001)
+            for tp in partitions
+        ]
+
+    def pause(self, partitions: List[TopicPartition]):
+        self._paused.update((tp.topic, tp.partition) for tp in partitions)
+
+    def resume(self, partitions: List[TopicPartition]):
+        self._paused.difference_update((tp.topic, tp.partition) for tp in partitions)
+        with self.bus._condition:
+            self.bus._condition.notify_all()
+
+    def get_watermark_offsets(self, partition: TopicPartition, timeout: float = -1,
+                              cached: bool = False) -> Tuple[int, int]:
+        return self.bus.watermarks(partition.topic, partition.partition)
+
+    def list_topics(self, topic: Optional[str] = None, timeout: float = -1) -> _ClusterMetadata:
+        return _ClusterMetadata(self.bus.list_topics())
+
+    def close(self):
+        if not self._closed:
+            if self._on_revoke is not None and self._assignment:
+                self._on_revoke(self, self.assignment())
+            self._closed = True
+            self.bus._leave(self)
+
+
+# Process-wide bus shared by every producer and consumer using the memory transport
+memory_bus = MemoryBus()
+
+
+def get_memory_bus() -> MemoryBus:
+    """Get the process-wide in-memory bus"""
+    return memory_bus
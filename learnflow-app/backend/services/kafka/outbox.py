@@ -0,0 +1,408 @@
+"""
+Event Outbox for LearnFlow
+Durable local buffer that decouples event publishing from Kafka availability
+
+Events are appended to segment files in a local directory and shipped to Kafka
+in bulk by a background drainer. Appends only copy into a write buffer; a
+separate task flushes and fsyncs the active segment every `fsync_interval`
+seconds, so many events share one fsync. Only fsynced records are handed to
+the drainer, and the drain position is persisted in a cursor file, giving
+at-least-once delivery across crashes.
+"""
+import asyncio
+import logging
+import os
+import struct
+import zlib
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Frame layout: payload length and CRC32 of the payload, followed by the payload
+_FRAME_HEADER = struct.Struct(">II")
+# Payload layout: topic length and key length, followed by topic, key and value bytes
+_PAYLOAD_HEADER = struct.Struct(">HH")
+_NO_KEY = 0xFFFF
+
+SEGMENT_SUFFIX = ".log"
+CURSOR_FILE = "cursor"
+
+# (topic, key, value)
+OutboxRecord = Tuple[str, Optional[str], bytes]
+
+
+class OutboxCorruptionError(Exception):
+    """Raised when a segment contains a frame that fails validation"""
+    pass
+
+
+def _encode_payload(topic: str, key: Optional[str], value: bytes) -> bytes:
+    topic_bytes = topic.encode('utf-8')
+    if key is None:
+        return _PAYLOAD_HEADER.pack(len(topic_bytes), _NO_KEY) + topic_bytes + value
+    key_bytes = key.encode('utf-8')
+    return _PAYLOAD_HEADER.pack(len(topic_bytes), len(key_bytes)) + topic_bytes + key_bytes + value
+
+
+def _decode_payload(payload: bytes) -> OutboxRecord:
+    topic_len, key_len = _PAYLOAD_HEADER.unpack_from(payload)
+    position = _PAYLOAD_HEADER.size
+    topic = payload[position:position + topic_len].decode('utf-8')
+    position += topic_len
+    key = None
+    if key_len != _NO_KEY:
+        key = payload[position:position + key_len].decode('utf-8')
+        position += key_len
+    return topic, key, payload[position:]
+
+
+def _read_frame(reader) -> Optional[bytes]:
+    """
+    Read one frame from a segment reader
+
+    Returns:
+        The frame payload, or None at a clean end of file
+
+    Raises:
+        OutboxCorruptionError: If the frame is truncated or fails its checksum
+    """
+    header = reader.read(_FRAME_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _FRAME_HEADER.size:
+        raise OutboxCorruptionError("Truncated frame header")
+    length, checksum = _FRAME_HEADER.unpack(header)
+    payload = reader.read(length)
+    if len(payload) < length or zlib.crc32(payload) != checksum:
+        raise OutboxCorruptionError("Truncated or corrupt frame payload")
+    return payload
+
+
+class EventOutbox:
+    def __init__(self, directory: str, segment_max_bytes: int = 64 * 1024 * 1024,
+                 fsync_interval: float = 0.05, drain_batch_size: int = 1000,
+                 max_retry_backoff: float = 30.0):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_interval = fsync_interval
+        self.drain_batch_size = drain_batch_size
+        self.max_retry_backoff = max_retry_backoff
+
+        # Base sequence numbers of the segments on disk, oldest first
+        self._segments: List[int] = []
+        self._file = None
+        self._active_size = 0
+        # Rolled segments that still need an fsync before they are closed
+        self._pending_close = []
+        self._directory_dirty = False
+
+        self._next_seq = 0
+        self._synced_seq = 0
+        # Drain cursor: segment base, byte offset within it and sequence number
+        self._cursor: Tuple[int, int, int] = (0, 0, 0)
+        self._readers: Dict[int, object] = {}
+
+        self._send_batch: Optional[Callable[[List[OutboxRecord]], Awaitable[None]]] = None
+        self._sync_lock: Optional[asyncio.Lock] = None
+        self._drain_wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def backlog(self) -> int:
+        """Number of appended events not yet acknowledged by Kafka"""
+        return self._next_seq - self._cursor[2]
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get outbox depth and layout information"""
+        return {
+            "backlog": self.backlog,
+            "unsynced": self._next_seq - self._synced_seq,
+            "segments": len(self._segments),
+        }
+
+    def _segment_path(self, base_seq: int) -> str:
+        return os.path.join(self.directory, f"{base_seq:020d}{SEGMENT_SUFFIX}")
+
+    def open(self):
+        """
+        Open the outbox directory and recover state left by a previous process
+
+        Segments older than the persisted cursor are deleted and a torn frame at
+        the end of the newest segment (from a crash mid-write) is truncated.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+        cursor = self._load_cursor()
+        if cursor is None:
+            base = self._segments[0] if self._segments else 0
+            cursor = (base, 0, base)
+
+        # Everything before the cursor segment has already been shipped
+        while self._segments and self._segments[0] < cursor[0]:
+            os.remove(self._segment_path(self._segments.pop(0)))
+        if not self._segments:
+            self._segments.append(cursor[2])
+            cursor = (cursor[2], 0, cursor[2])
+        self._cursor = cursor
+
+        active_base = self._segments[-1]
+        active_path = self._segment_path(active_base)
+        records, valid_size = self._scan_segment(active_path)
+        if os.path.exists(active_path) and os.path.getsize(active_path) != valid_size:
+            logger.warning(f"Truncating torn tail of outbox segment {active_path} at byte {valid_size}")
+            with open(active_path, 'r+b') as segment:
+                segment.truncate(valid_size)
+
+        self._next_seq = active_base + records
+        self._synced_seq = self._next_seq
+        self._file = open(active_path, 'ab')
+        self._active_size = valid_size
+
+        logger.info(f"Event outbox opened at {self.directory} with {self.backlog} pending events")
+
+    def _scan_segment(self, path: str) -> Tuple[int, int]:
+        """Count valid records in a segment; returns (records, valid byte size)"""
+        records = 0
+        valid_size = 0
+        if not os.path.exists(path):
+            return records, valid_size
+        with open(path, 'rb') as reader:
+            while True:
+                try:
+                    payload = _read_frame(reader)
+                except OutboxCorruptionError:
+                    break
+                if payload is None:
+                    break
+                records += 1
+                valid_size += _FRAME_HEADER.size + len(payload)
+        return records, valid_size
+
+    def _load_cursor(self) -> Optional[Tuple[int, int, int]]:
+        path = os.path.join(self.directory, CURSOR_FILE)
+        try:
+            with open(path, 'r') as cursor_file:
+                segment, offset, seq = (int(part) for part in cursor_file.read().split())
+            return segment, offset, seq
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.error(f"Ignoring unreadable outbox cursor at {path}")
+            return None
+
+    def _store_cursor(self, cursor: Tuple[int, int, int]):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w') as cursor_file:
+            cursor_file.write("%d %d %d" % cursor)
+        os.replace(temp_path, path)
+
+    def append(self, topic: str, value: bytes, key: Optional[str] = None) -> int:
+        """
+        Append an event to the outbox
+
+        Only copies the event into the active segment's write buffer; it becomes
+        durable and eligible for draining at the next periodic sync.
+
+        Args:
+            topic: Kafka topic the event is destined for
+            value: Serialized event
+            key: Optional key for partitioning
+
+        Returns:
+            Sequence number assigned to the event
+        """
+        payload = _encode_payload(topic, key, value)
+        frame = _FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        if self._active_size and self._active_size + len(frame) > self.segment_max_bytes:
+            self._roll_segment()
+
+        self._file.write(frame)
+        self._active_size += len(frame)
+
+        seq = self._next_seq
+        self._next_seq += 1
+        return seq
+
+    def _roll_segment(self):
+        """Start a new active segment; the old one is fsynced and closed by the syncer"""
+        self._file.flush()
+        self._pending_close.append(self._file)
+
+        self._segments.append(self._next_seq)
+        self._file = open(self._segment_path(self._next_seq), 'ab')
+        self._active_size = 0
+        self._directory_dirty = True
+
+    def _fsync(self, pending_close: list, active_fd: int, sync_directory: bool):
+        for segment in pending_close:
+            os.fsync(segment.fileno())
+            segment.close()
+        os.fsync(active_fd)
+        if sync_directory:
+            directory_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+
+    async def sync(self):
+        """Flush and fsync everything appended so far, making it visible to the drainer"""
+        async with self._sync_lock:
+            target_seq = self._next_seq
+            if target_seq == self._synced_seq and not self._pending_close:
+                return
+
+            self._file.flush()
+            pending_close, self._pending_close = self._pending_close, []
+            sync_directory, self._directory_dirty = self._directory_dirty, False
+
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._fsync, pending_close, self._file.fileno(), sync_directory
+            )
+
+            self._synced_seq = max(self._synced_seq, target_seq)
+            self._drain_wakeup.set()
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Failed to sync event outbox: {str(e)}")
+
+    def _reader(self, base_seq: int):
+        reader = self._readers.get(base_seq)
+        if reader is None:
+            reader = open(self._segment_path(base_seq), 'rb')
+            self._readers[base_seq] = reader
+        return reader
+
+    def _read_batch(self) -> Tuple[List[OutboxRecord], Tuple[int, int, int]]:
+        """Read up to drain_batch_size synced records starting at the cursor"""
+        segment, offset, seq = self._cursor
+        records = []
+
+        while len(records) < self.drain_batch_size and seq < self._synced_seq:
+            reader = self._reader(segment)
+            reader.seek(offset)
+            try:
+                payload = _read_frame(reader)
+            except OutboxCorruptionError:
+                logger.error(f"Corrupt frame in outbox segment {segment} at byte {offset}; skipping rest of segment")
+                payload = None
+                later = [base for base in self._segments if base > segment]
+                if later:
+                    # Records lost to corruption still count as consumed
+                    seq = later[0]
+
+            if payload is None:
+                later = [base for base in self._segments if base > segment]
+                if not later:
+                    break
+                segment, offset = later[0], 0
+                continue
+
+            records.append(_decode_payload(payload))
+            offset += _FRAME_HEADER.size + len(payload)
+            seq += 1
+
+        return records, (segment, offset, seq)
+
+    def _commit(self, cursor: Tuple[int, int, int]):
+        """Persist the drain cursor and delete segments that are fully drained"""
+        self._store_cursor(cursor)
+        self._cursor = cursor
+        while len(self._segments) > 1 and self._segments[0] < cursor[0]:
+            base = self._segments.pop(0)
+            reader = self._readers.pop(base, None)
+            if reader is not None:
+                reader.close()
+            os.remove(self._segment_path(base))
+
+    async def _drain_loop(self):
+        backoff = self.fsync_interval
+        while True:
+            records, cursor = self._read_batch()
+            if not records:
+                if cursor != self._cursor:
+                    self._commit(cursor)
+                self._drain_wakeup.clear()
+                await self._drain_wakeup.wait()
+                continue
+
+            try:
+                await self._send_batch(records)
+            except Exception as e:
+                logger.warning(f"Outbox drain of {len(records)} events failed, retrying in {backoff:.2f}s: {str(e)}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_retry_backoff)
+                continue
+
+            backoff = self.fsync_interval
+            self._commit(cursor)
+
+    async def start(self, send_batch: Callable[[List[OutboxRecord]], Awaitable[None]]):
+        """
+        Start the periodic syncer and the drainer
+
+        Args:
+            send_batch: Coroutine that ships a list of records to Kafka and
+                raises if any of them was not delivered
+        """
+        if self._file is None:
+            self.open()
+
+        self._send_batch = send_batch
+        self._sync_lock = asyncio.Lock()
+        self._drain_wakeup = asyncio.Event()
+        self._drain_wakeup.set()
+
+        loop = asyncio.get_running_loop()
+        self._tasks = [
+            loop.create_task(self._sync_loop()),
+            loop.create_task(self._drain_loop()),
+        ]
+
+    async def wait_drained(self, timeout: float) -> bool:
+        """
+        Wait until every appended event has been shipped
+
+        Args:
+            timeout: Maximum time in seconds to wait
+
+        Returns:
+            True if the outbox is empty
+        """
+        deadline = asyncio.get_running_loop().time() + timeout
+        await self.sync()
+        while self.backlog and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(self.fsync_interval)
+        return self.backlog == 0
+
+    async def close(self):
+        """Stop background tasks and make all appended events durable"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+        if self._file is not None:
+            if self._sync_lock is not None:
+                await self.sync()
+            self._file.close()
+            self._file = None
+        for reader in self._readers.values():
+            reader.close()
+        self._readers.clear()
@@ -0,0 +1,344 @@
+"""
+Retry Scheduler for LearnFlow
+Moves events whose handler failed through delayed retry tiers and a dead-letter topic
+
+A failed event is never retried in place, since that would stall its partition
+for every other user. Instead it is republished to the next delay tier of the
+topic it was published for, under the consumer group that failed it
+(`user-interactions-learnflow-group-retry-5s`, then
+`user-interactions-learnflow-group-retry-1m`, ...), so groups that handled it
+fine do not run it again. A separate RetryWorker per group consumes the tier
+topics, holds each event in a timer wheel until its delay has passed and runs
+the handler again. Once an event has used up its attempts it is published to
+`<topic>-<group>-dlq` for inspection.
+
+Only the failed event is rerouted, never the whole coalesced request record it
+may have arrived in, and it goes to the topic it was published for rather than
+request-events.
+
+State travels in message headers:
+    x-attempt          attempt number of the next handler run (1 for fresh events)
+    x-original-topic   topic the event was first consumed from
+    x-not-before       epoch milliseconds before which it must not be retried
+    x-error            last handler error
+"""
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from confluent_kafka import KafkaError, TopicPartition
+
+from .dispatcher import PartitionOffsetTracker
+from .serialization import EventSerializer, decode_event
+
+logger = logging.getLogger(__name__)
+
+HEADER_ATTEMPT = "x-attempt"
+HEADER_ORIGINAL_TOPIC = "x-original-topic"
+HEADER_NOT_BEFORE = "x-not-before"
+HEADER_ERROR = "x-error"
+
+DLQ_SUFFIX = "dlq"
+MAX_ERROR_LENGTH = 512
+
+
+def _format_delay(seconds: float) -> str:
+    if seconds >= 3600 and seconds % 3600 == 0:
+        return f"{int(seconds // 3600)}h"
+    if seconds >= 60 and seconds % 60 == 0:
+        return f"{int(seconds // 60)}m"
+    return f"{seconds:g}s"
+
+
+class RetryTier:
+    """One delay step; events in a tier are retried `delay` seconds after failing"""
+
+    def __init__(self, delay: float, name: Optional[str] = None):
+        self.delay = delay
+        self.name = name or f"retry-{_format_delay(delay)}"
+
+
+class RetryPolicy:
+    def __init__(self, tiers: Optional[List[RetryTier]] = None, max_attempts: Optional[int] = None):
+        """
+        Args:
+            tiers: Delay tiers in the order they are used (defaults to 5s, 1m)
+            max_attempts: Handler runs before an event is dead-lettered
+                (defaults to one run per tier plus the original one)
+        """
+        self.tiers = tiers or [RetryTier(5), RetryTier(60)]
+        self.max_attempts = max_attempts or len(self.tiers) + 1
+
+    def tier_for(self, attempt: int) -> RetryTier:
+        """Tier used after the given attempt failed; the last tier repeats"""
+        return self.tiers[min(attempt, len(self.tiers)) - 1]
+
+    def retry_topic(self, topic: str, group: str, tier: RetryTier) -> str:
+        return f"{topic}-{group}-{tier.name}"
+
+    def dlq_topic(self, topic: str, group: str) -> str:
+        return f"{topic}-{group}-{DLQ_SUFFIX}"
+
+    def retry_topics(self, topics: Iterable[str], group: str) -> List[str]:
+        """Every tier topic of one consumer group for the given source topics"""
+        return [self.retry_topic(topic, group, tier) for topic in topics for tier in self.tiers]
+
+
+def read_headers(msg) -> Dict[str, str]:
+    """Message headers as a str -> str dict"""
+    headers = msg.headers() or []
+    return {
+        key: value.decode('utf-8', errors='replace') if isinstance(value, bytes) else (value or "")
+        for key, value in headers
+    }
+
+
+class RetryRouter:
+    def __init__(self, producer, serializer: EventSerializer, policy: RetryPolicy, group: str,
+                 delivery_callback: Optional[Callable] = None):
+        """
+        Args:
+            producer: confluent_kafka.Producer used to publish retries and dead letters
+            serializer: Serializer used to re-encode failed events
+            policy: Retry tiers and attempt limit
+            group: Consumer group whose handler failures are routed
+            delivery_callback: Delivery report callback for routed messages
+        """
+        self.producer = producer
+        self.serializer = serializer
+        self.policy = policy
+        self.group = group
+        self.delivery_callback = delivery_callback
+
+        # Metrics
+        self.retried = 0
+        self.dead_lettered = 0
+
+    def route(self, msg, event: Dict[str, Any], error: BaseException, topic: Optional[str] = None):
+        """
+        Send a failed event to its next retry tier, or to the DLQ when it is out of attempts
+
+        Args:
+            msg: The consumed message the event came from
+            event: The event the handler failed on (a single event, even when
+                msg is a coalesced request record)
+            error: The handler's exception
+            topic: Topic the event was published for when msg is a coalesced
+                request record
+        """
+        headers = read_headers(msg)
+        attempt = int(headers.get(HEADER_ATTEMPT, 1))
+        original_topic = headers.get(HEADER_ORIGINAL_TOPIC) or topic or msg.topic()
+        error_text = f"{type(error).__name__}: {error}"[:MAX_ERROR_LENGTH]
+
+        out_headers = [
+            (HEADER_ORIGINAL_TOPIC, original_topic.encode('utf-8')),
+            (HEADER_ERROR, error_text.encode('utf-8')),
+        ]
+        if attempt >= self.policy.max_attempts:
+            topic = self.policy.dlq_topic(original_topic, self.group)
+            out_headers.append((HEADER_ATTEMPT, str(attempt).encode('ascii')))
+            self.dead_lettered += 1
+            logger.error(f"Event for {event.get('user_id', 'unknown')} failed {attempt} times, sent to {topic}: {error_text}")
+        else:
+            tier = self.policy.tier_for(attempt)
+            topic = self.policy.retry_topic(original_topic, self.group, tier)
+            not_before = int((time.time() + tier.delay) * 1000)
+            out_headers.append((HEADER_ATTEMPT, str(attempt + 1).encode('ascii')))
+            out_headers.append((HEADER_NOT_BEFORE, str(not_before).encode('ascii')))
+            self.retried += 1
+            logger.warning(f"Event for {event.get('user_id', 'unknown')} failed (attempt {attempt}), retrying via {topic}")
+
+        self._produce(topic, self.serializer.encode(event), msg.key(), out_headers)
+
+    def _produce(self, topic: str, value: bytes, key, headers: List[Tuple[str, bytes]]):
+        while True:
+            try:
+                self.producer.produce(topic=topic, key=key, value=value, headers=headers,
+                                      callback=self.delivery_callback)
+                break
+            except BufferError:
+                # Local queue is full; wait for deliveries to make room
+                self.producer.poll(0.1)
+        self.producer.poll(0)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"retried": self.retried, "dead_lettered": self.dead_lettered}
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel
+
+    Scheduling and expiring are O(1) per item regardless of how many items are
+    waiting, which keeps a large retry backlog cheap to hold.
+    """
+
+    def __init__(self, tick: float = 0.1, slots: int = 1024, now: Optional[float] = None):
+        """
+        Args:
+            tick: Resolution in seconds
+            slots: Number of buckets; deadlines further out than tick * slots
+                share buckets and are skipped until their turn
+            now: Start time (defaults to time.time())
+        """
+        self.tick = tick
+        self._slots: List[list] = [[] for _ in range(slots)]
+        self._next_tick = self._tick_of(time.time() if now is None else now)
+        self._overdue: list = []
+        self._size = 0
+
+    def _tick_of(self, t: float) -> int:
+        return int(t // self.tick)
+
+    def __len__(self):
+        return self._size
+
+    def schedule(self, deadline: float, item: Any):
+        """Hold `item` until `deadline` (epoch seconds)"""
+        tick = self._tick_of(deadline)
+        if tick < self._next_tick:
+            self._overdue.append((tick, deadline, item))
+        else:
+            self._slots[tick % len(self._slots)].append((tick, deadline, item))
+        self._size += 1
+
+    def advance(self, now: Optional[float] = None) -> List[Any]:
+        """Remove and return every item whose deadline has passed, earliest first"""
+        target = self._tick_of(time.time() if now is None else now)
+        due = self._overdue
+        self._overdue = []
+
+        if target >= self._next_tick:
+            slot_count = len(self._slots)
+            if target - self._next_tick >= slot_count:
+                visit = range(slot_count)
+            else:
+                visit = (tick % slot_count for tick in range(self._next_tick, target + 1))
+            for index in visit:
+                slot = self._slots[index]
+                if not slot:
+                    continue
+                keep = []
+                for entry in slot:
+                    (due if entry[0] <= target else keep).append(entry)
+                self._slots[index] = keep
+            self._next_tick = target + 1
+
+        self._size -= len(due)
+        due.sort(key=lambda entry: entry[1])
+        return [item for _, _, item in due]
+
+
+class RetryWorker:
+    def __init__(self, consumer, handler: Callable[[Dict[str, Any]], None], router: RetryRouter,
+                 batch_size: int = 500, poll_timeout: float = 0.5, max_pending: int = 10000,
+                 decoder: Callable[[bytes], Dict[str, Any]] = decode_event):
+        """
+        Args:
+            consumer: confluent_kafka.Consumer subscribed to the router's
+                group's retry tier topics, with auto-commit disabled
+            handler: Function to handle each retried event
+            router: Router for events that fail again
+            batch_size: Maximum number of messages fetched per consume() call
+            poll_timeout: Longest a consume() call may block; also bounds how
+                late an event is retried when the wheel is busy
+            max_pending: Events held in the wheel before the tier partitions are paused
+            decoder: Function turning a message value into an event dict
+        """
+        self.consumer = consumer
+        self.handler = handler
+        self.router = router
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.max_pending = max_pending
+        self.decoder = decoder
+
+        self.wheel = TimerWheel()
+        self._tracker = PartitionOffsetTracker()
+        self._paused: List[TopicPartition] = []
+        self._running = False
+
+        # Metrics
+        self.recovered = 0
+        self.failed = 0
+
+    def _schedule(self, messages: list):
+        for msg in messages:
+            error = msg.error()
+            if error is not None:
+                if error.code() != KafkaError._PARTITION_EOF:
+                    logger.error(error)
+                continue
+            partition = (msg.topic(), msg.partition())
+            self._tracker.track(partition, msg.offset())
+            try:
+                event = self.decoder(msg.value())
+            except (ValueError, UnicodeDecodeError):
+                logger.error(f"Failed to decode retry message from {msg.topic()} [{msg.partition()}] at offset {msg.offset()}")
+                self._tracker.complete(partition, msg.offset())
+                continue
+            not_before = int(read_headers(msg).get(HEADER_NOT_BEFORE, 0)) / 1000
+            self.wheel.schedule(not_before, (msg, event))
+
+    def _run_due(self):
+        for msg, event in self.wheel.advance():
+            try:
+                self.handler(event)
+                self.recovered += 1
+            except Exception as e:
+                self.failed += 1
+                self.router.route(msg, event, e)
+            self._tracker.complete((msg.topic(), msg.partition()), msg.offset())
+
+    def _commit(self):
+        positions = self._tracker.committable()
+        if positions:
+            self.consumer.commit(
+                offsets=[TopicPartition(topic, partition, offset) for (topic, partition), offset in positions.items()],
+                asynchronous=True
+            )
+
+    def run(self, should_continue: Optional[Callable[[], bool]] = None):
+        """
+        Retry events as they come due until stop() is called or should_continue() returns False
+
+        Args:
+            should_continue: Optional extra stop condition, checked every loop
+        """
+        self._running = True
+        try:
+            while self._running and (should_continue is None or should_continue()):
+                timeout = min(self.poll_timeout, self.wheel.tick) if len(self.wheel) else self.poll_timeout
+                messages = self.consumer.consume(num_messages=self.batch_size, timeout=timeout)
+                if messages:
+                    self._schedule(messages)
+
+                if not self._paused and len(self.wheel) >= self.max_pending:
+                    self._paused = self.consumer.assignment()
+                    if self._paused:
+                        self.consumer.pause(self._paused)
+
+                self._run_due()
+
+                if self._paused and len(self.wheel) <= self.max_pending // 2:
+                    self.consumer.resume(self._paused)
+                    self._paused = []
+
+                self._commit()
+        finally:
+            self._running = False
+            self._commit()
+            self.consumer.close()
+
+    def stop(self):
+        """Stop after the current loop; events still waiting are redelivered on restart"""
+        self._running = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.wheel),
+            "recovered": self.recovered,
+            "failed": self.failed,
+            **self.router.get_stats(),
+        }
@@ -0,0 +1,341 @@
+"""
+Event Serialization for LearnFlow
+Pluggable event encodings behind a small versioned envelope
+
+Every encoded event starts with a 4-byte header: a magic byte, the body format,
+the schema id and the schema version. decode_event() reads the header and
+picks the matching decoder, so consumers can read any format and any schema
+version ever produced. Headerless JSON from older producers is still accepted.
+
+Formats:
+    json     JSON body (orjson when installed)
+    msgpack  MessagePack body (requires msgpack)
+    compact  Schema-based binary body: fields are written positionally, string
+             keys and the event type are implied by the schema and timestamps
+             are stored as integer microseconds
+"""
+import json
+import math
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is optional
+    msgpack = None
+
+# 0xC1 never appears in UTF-8 text, so enveloped values cannot be mistaken for JSON
+MAGIC = 0xC1
+_HEADER = struct.Struct(">BBBB")
+_TIMESTAMP = struct.Struct(">q")
+
+FORMAT_JSON = 1
+FORMAT_MSGPACK = 2
+FORMAT_COMPACT = 3
+
+# Schema id used for events without a registered schema
+GENERIC_SCHEMA_ID = 0
+
+
+class SerializationError(ValueError):
+    """Raised when an event cannot be encoded or decoded"""
+    pass
+
+
+class EventSchema:
+    """A versioned, ordered field layout for one event type"""
+
+    def __init__(self, schema_id: int, version: int, event_type: str, fields: List[Tuple[str, str]]):
+        self.schema_id = schema_id
+        self.version = version
+        self.event_type = event_type
+        # (name, type) pairs; type is "str", "timestamp" or "any"
+        self.fields = fields
+        self._bitmap_size = (len(fields) + 1 + 7) // 8
+
+
+# Schemas are append-only: to change an event, register a new version and keep
+# the old ones so that events already on the topics stay decodable.
+EVENT_SCHEMAS = [
+    EventSchema(1, 1, "user_interaction", [
+        ("user_id", "str"), ("interaction_type", "str"), ("timestamp", "timestamp"), ("data", "any"),
+    ]),
+    EventSchema(2, 1, "progress_update", [
+        ("user_id", "str"), ("timestamp", "timestamp"), ("progress_data", "any"),
+    ]),
+    EventSchema(3, 1, "ai_interaction", [
+        ("user_id", "str"), ("query", "str"), ("response", "str"), ("agent_type", "str"), ("timestamp", "timestamp"),
+    ]),
+]
+
+_SCHEMAS_BY_ID: Dict[Tuple[int, int], EventSchema] = {
+    (schema.schema_id, schema.version): schema for schema in EVENT_SCHEMAS
+}
+# Newest version of each event type is used for encoding
+_LATEST_SCHEMAS: Dict[str, EventSchema] = {}
+for _schema in EVENT_SCHEMAS:
+    _current = _LATEST_SCHEMAS.get(_schema.event_type)
+    if _current is None or _schema.version > _current.version:
+        _LATEST_SCHEMAS[_schema.event_type] = _schema
+
+
+def register_schema(schema: EventSchema):
+    """
+    Register an additional event schema (or a new version of an existing one)
+
+    Args:
+        schema: Schema to register
+    """
+    key = (schema.schema_id, schema.version)
+    if key in _SCHEMAS_BY_ID:
+        raise ValueError(f"Schema {schema.schema_id} v{schema.version} is already registered")
+    EVENT_SCHEMAS.append(schema)
+    _SCHEMAS_BY_ID[key] = schema
+    current = _LATEST_SCHEMAS.get(schema.event_type)
+    if current is None or schema.version > current.version:
+        _LATEST_SCHEMAS[schema.event_type] = schema
+
+
+def _dump_json(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def _load_json(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data).decode('utf-8'))
+
+
+def _dump_any(value: Any) -> bytes:
+    if msgpack is not None:
+        return msgpack.packb(value, use_bin_type=True)
+    return _dump_json(value)
+
+
+def _load_any(data) -> Any:
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False)
+    return _load_json(data)
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: memoryview, position: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def _matches_type(value: Any, field_type: str) -> bool:
+    if field_type == "str":
+        return isinstance(value, str)
+    if field_type == "timestamp":
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+    return True
+
+
+def _encode_compact(event: Dict[str, Any], schema: EventSchema) -> bytes:
+    bitmap = bytearray(schema._bitmap_size)
+    body = bytearray()
+    written = set()
+
+    for index, (name, field_type) in enumerate(schema.fields):
+        value = event.get(name)
+        if value is None or not _matches_type(value, field_type):
+            continue
+        written.add(name)
+        bitmap[index >> 3] |= 1 << (index & 7)
+        if field_type == "str":
+            encoded = value.encode('utf-8')
+            _write_varint(body, len(encoded))
+            body += encoded
+        elif field_type == "timestamp":
+            body += _TIMESTAMP.pack(round(value * 1_000_000))
+        else:
+            encoded = _dump_any(value)
+            _write_varint(body, len(encoded))
+            body += encoded
+
+    # Anything the schema does not cover (or that had an unexpected type)
+    extras = {
+        key: value for key, value in event.items()
+        if key not in written and key != "event_type"
+    }
+    if extras:
+        extras_index = len(schema.fields)
+        bitmap[extras_index >> 3] |= 1 << (extras_index & 7)
+        encoded = _dump_any(extras)
+        _write_varint(body, len(encoded))
+        body += encoded
+
+    return bytes(bitmap) + bytes(body)
+
+
+def _decode_compact(body: memoryview, schema: EventSchema) -> Dict[str, Any]:
+    bitmap = body[:schema._bitmap_size]
+    position = schema._bitmap_size
+    event: Dict[str, Any] = {"event_type": schema.event_type}
+
+    for index, (name, field_type) in enumerate(schema.fields):
+        if not (bitmap[index >> 3] >> (index & 7)) & 1:
+            continue
+        if field_type == "timestamp":
+            event[name] = _TIMESTAMP.unpack_from(body, position)[0] / 1_000_000
+            position += _TIMESTAMP.size
+            continue
+        length, position = _read_varint(body, position)
+        chunk = body[position:position + length]
+        position += length
+        if position > len(body):
+            raise SerializationError(f"Truncated compact {schema.event_type} event")
+        event[name] = str(chunk, 'utf-8') if field_type == "str" else _load_any(chunk)
+
+    extras_index = len(schema.fields)
+    if (bitmap[extras_index >> 3] >> (extras_index & 7)) & 1:
+        length, position = _read_varint(body, position)
+        if position + length > len(body):
+            raise SerializationError(f"Truncated compact {schema.event_type} event")
+        event.update(_load_any(body[position:position + length]))
+
+    return event
+
+
+class EventSerializer:
+    """Encodes events with the envelope header for a single body format"""
+
+    name = "json"
+    format_id = FORMAT_JSON
+
+    def _encode_body(self, event: Dict[str, Any], schema: Optional[EventSchema]) -> bytes:
+        return _dump_json(event)
+
+    def encode(self, event: Dict[str, Any]) -> bytes:
+        """
+        Encode an event into an enveloped message value
+
+        Args:
+            event: Event dict, normally carrying an "event_type" key
+
+        Returns:
+            Header followed by the encoded body
+        """
+        schema = _LATEST_SCHEMAS.get(event.get("event_type"))
+        schema_id, version = (schema.schema_id, schema.version) if schema else (GENERIC_SCHEMA_ID, 1)
+        try:
+            body = self._encode_body(event, schema)
+        except (TypeError, ValueError) as e:
+            raise SerializationError(f"Could not encode {event.get('event_type', 'event')} as {self.name}: {str(e)}")
+        return _HEADER.pack(MAGIC, self.format_id, schema_id, version) + body
+
+
+class MsgpackSerializer(EventSerializer):
+    name = "msgpack"
+    format_id = FORMAT_MSGPACK
+
+    def __init__(self):
+        if msgpack is None:
+            raise SerializationError("The msgpack format requires the msgpack package")
+
+    def _encode_body(self, event: Dict[str, Any], schema: Optional[EventSchema]) -> bytes:
+        return msgpack.packb(event, use_bin_type=True)
+
+
+class CompactSerializer(EventSerializer):
+    name = "compact"
+    format_id = FORMAT_COMPACT
+
+    def _encode_body(self, event: Dict[str, Any], schema: Optional[EventSchema]) -> bytes:
+        if schema is None:
+            return _dump_any(event)
+        return _encode_compact(event, schema)
+
+
+SERIALIZERS = {
+    "json": EventSerializer,
+    "msgpack": MsgpackSerializer,
+    "compact": CompactSerializer,
+}
+
+
+def get_serializer(name: str = "json") -> EventSerializer:
+    """
+    Get a serializer by format name
+
+    Args:
+        name: One of "json", "msgpack" or "compact"
+    """
+    try:
+        return SERIALIZERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown event format: {name}. Available: {', '.join(SERIALIZERS)}")
+
+
+def _decode_value(value: bytes) -> Any:
+    if not value or value[0] != MAGIC:
+        # Headerless JSON written before envelopes were introduced
+        return _load_json(value)
+
+    if len(value) < _HEADER.size:
+        raise SerializationError("Truncated event envelope")
+    _, format_id, schema_id, version = _HEADER.unpack_from(value)
+    body = memoryview(value)[_HEADER.size:]
+
+    if format_id == FORMAT_JSON:
+        return _load_json(body)
+    if format_id == FORMAT_MSGPACK:
+        if msgpack is None:
+            raise SerializationError("Received a msgpack event but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    if format_id == FORMAT_COMPACT:
+        if schema_id == GENERIC_SCHEMA_ID:
+            return _load_any(body)
+        schema = _SCHEMAS_BY_ID.get((schema_id, version))
+        if schema is None:
+            raise SerializationError(f"Unknown event schema {schema_id} v{version}")
+        return _decode_compact(body, schema)
+
+    raise SerializationError(f"Unknown event format {format_id}")
+
+
+def decode_event(value: bytes) -> Dict[str, Any]:
+    """
+    Decode a message value produced by any serializer or schema version
+
+    Args:
+        value: Raw Kafka message value
+
+    Returns:
+        The decoded event dict
+
+    Raises:
+        SerializationError: If the envelope is unknown, the body is malformed
+            or truncated, or it does not hold an event dict
+    """
+    try:
+        event = _decode_value(value)
+    except SerializationError:
+        raise
+    except (ValueError, TypeError, IndexError, struct.error) as e:
+        # Malformed bodies surface as whatever the decoder trips over first
+        raise SerializationError(f"Malformed event: {type(e).__name__}: {str(e)}") from e
+    if not isinstance(event, dict):
+        raise SerializationError(f"Expected an event object, got {type(event).__name__}")
+    return event
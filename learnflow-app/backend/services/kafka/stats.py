@@ -0,0 +1,85 @@
+"""
+Kafka Client Statistics for LearnFlow
+Condenses librdkafka statistics reports into the metrics the backend exposes
+
+librdkafka emits a large JSON document every `statistics.interval.ms` through
+the `stats_cb` callback (served by poll()/consume()). Only the parts needed to
+judge client health are kept: queue depth, batch sizes, broker round trips,
+retries and per-partition consumer lag.
+"""
+import json
+from typing import Any, Dict
+
+# Broker connection states that mean the client can talk to the broker
+BROKER_UP_STATES = {"UP"}
+
+
+def _ms(microseconds: float) -> float:
+    return round(microseconds / 1000, 3)
+
+
+def summarize_client_stats(raw: str) -> Dict[str, Any]:
+    """
+    Reduce a librdkafka statistics report
+
+    Args:
+        raw: JSON document passed to stats_cb
+
+    Returns:
+        Summary dict; "brokers_up" counts brokers with an established connection
+    """
+    stats = json.loads(raw)
+
+    brokers = {}
+    tx_retries = 0
+    for name, broker in stats.get("brokers", {}).items():
+        if broker.get("source") == "internal":
+            continue
+        tx_retries += broker.get("txretries", 0)
+        rtt = broker.get("rtt", {})
+        brokers[name] = {
+            "state": broker.get("state"),
+            "rtt_avg_ms": _ms(rtt.get("avg", 0)),
+            "rtt_p99_ms": _ms(rtt.get("p99", 0)),
+            "outbuf_messages": broker.get("outbuf_msg_cnt", 0),
+            "waiting_responses": broker.get("waitresp_cnt", 0),
+            "tx_errors": broker.get("txerrs", 0),
+            "request_timeouts": broker.get("req_timeouts", 0),
+        }
+
+    topics = {}
+    partition_lag = {}
+    for topic_name, topic in stats.get("topics", {}).items():
+        batch_size = topic.get("batchsize", {})
+        batch_count = topic.get("batchcnt", {})
+        topics[topic_name] = {
+            "batch_size_avg": batch_size.get("avg", 0),
+            "batch_size_p99": batch_size.get("p99", 0),
+            "batch_messages_avg": batch_count.get("avg", 0),
+        }
+        for partition_id, partition in topic.get("partitions", {}).items():
+            lag = partition.get("consumer_lag", -1)
+            if partition_id != "-1" and lag >= 0:
+                partition_lag[f"{topic_name}[{partition_id}]"] = lag
+
+    summary = {
+        "client": stats.get("name"),
+        "type": stats.get("type"),
+        "queue_messages": stats.get("msg_cnt", 0),
+        "queue_bytes": stats.get("msg_size", 0),
+        "tx_messages": stats.get("txmsgs", 0),
+        "rx_messages": stats.get("rxmsgs", 0),
+        "tx_retries": tx_retries,
+        "brokers_up": sum(1 for broker in brokers.values() if broker["state"] in BROKER_UP_STATES),
+        "brokers": brokers,
+        "topics": topics,
+    }
+
+    if stats.get("type") == "consumer":
+        group = stats.get("cgrp", {})
+        summary["group_state"] = group.get("state")
+        summary["rebalances"] = group.get("rebalance_cnt", 0)
+        summary["partition_lag"] = partition_lag
+        summary["total_lag"] = sum(partition_lag.values())
+
+    return summary
@@ -4,16 +4,20 @@ Integrates all services and handles business logic
 """
 import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+import os
+from typing import AsyncIterator, Dict, Any, List, Optional
 from datetime import datetime
 import uuid
 
 from .ai.ai_service import AIService
-from .code_execution.code_executor import execute_code
-from .kafka.kafka_service import kafka_service, send_user_interaction, send_progress_update, send_ai_interaction
+from .code_execution.code_executor import (execute_code, stream_code, cancel_code_stream, start_code_executor,
+                                           close_code_executor)
+from .code_execution.scheduler import SchedulerOverloaded
+from .kafka.kafka_service import (init_kafka_service, close_kafka_service, collect_events, send_user_interaction,
+                                  send_progress_update, send_ai_interaction)
 from .database.db_service import db_service, get_db_service
 from .dapr_service import dapr_service
-from .telemetry_service import analyze_student_telemetry
+from .telemetry_service import analyze_student_telemetry, run_telemetry_stage
 from ..models.user import UserCreate
 from ..models.progress import ProgressUpdate
 
@@ -22,11 +26,20 @@ logger = logging.getLogger(__name__)
 class LearnFlowService:
     def __init__(self):
         self.ai_service = AIService()
+        # "inline" analyzes telemetry inside the request, "stream" in a Kafka consumer stage
+        self.telemetry_mode = os.getenv("TELEMETRY_MODE", "inline")
+        self._telemetry_task: Optional[asyncio.Task] = None
 
     async def initialize(self):
         """Initialize all services"""
         # Initialize Kafka service
-        await kafka_service.init_kafka_service()
+        await init_kafka_service(os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"))
+
+        if self.telemetry_mode == "stream":
+            self._telemetry_task = asyncio.create_task(run_telemetry_stage())
+
+        # Start warm sandbox workers (no-op unless CODE_EXECUTOR_POOL_SIZE is set)
+        await start_code_executor()
 
         # Initialize database service
         # Note: This would normally be called separately during app startup
@@ -34,6 +47,19 @@ class LearnFlowService:
 
         logger.info("LearnFlow service initialized")
 
+    async def shutdown(self):
+        """Flush pending events and release service resources"""
+        if self._telemetry_task is not None:
+            self._telemetry_task.cancel()
+            try:
+                await self._telemetry_task
+            except asyncio.CancelledError:
+                pass
+            self._telemetry_task = None
+
+        await close_code_executor()
+        await close_kafka_service()
+
     async def process_tutor_request(self, user_id: str, message: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Process a tutoring request from a user
@@ -57,24 +83,26 @@ class LearnFlowService:
             # Process the request with the AI service
             ai_response = await self.ai_service.process_tutor_request(message, full_context)
 
-            # Send AI interaction event to Kafka
-            await send_ai_interaction(
-                user_id=user_id,
-                query=message,
-                response=ai_response.get("message", ""),
-                agent_type=ai_response.get("agent", "unknown")
-            )
+            # Both events go out as one coalesced record
+            async with collect_events():
+                # Send AI interaction event to Kafka
+                await send_ai_interaction(
+                    user_id=user_id,
+                    query=message,
+                    response=ai_response.get("message", ""),
+                    agent_type=ai_response.get("agent", "unknown")
+                )
 
-            # Send user interaction event to Kafka
-            await send_user_interaction(
-                user_id=user_id,
-                interaction_type="tutor_request",
-                data={
-                    "query": message,
-                    "response_agent": ai_response.get("agent"),
-                    "response_confidence": ai_response.get("confidence")
-                }
-            )
+                # Send user interaction event to Kafka
+                await send_user_interaction(
+                    user_id=user_id,
+                    interaction_type="tutor_request",
+                    data={
+                        "query": message,
+                        "response_agent": ai_response.get("agent"),
+                        "response_confidence": ai_response.get("confidence")
+                    }
+                )
 
             return ai_response
         except Exception as e:
@@ -96,11 +124,86 @@ class LearnFlowService:
 
         Returns:
             Execution results
+
+        Raises:
+            SchedulerOverloaded: If the executor is too busy to queue the run
         """
         try:
             # Execute the code
-            execution_result = await execute_code(code, input_data)
+            execution_result = await execute_code(code, input_data, user_id=user_id)
+        except SchedulerOverloaded:
+            raise
+        except Exception as e:
+            logger.error(f"Error executing user code: {str(e)}")
+            return {
+                "output": "",
+                "errors": str(e),
+                "status": "error",
+                "execution_time": 0,
+                "return_code": -1
+            }
+
+        await self._record_code_execution(user_id, code, execution_result)
+        return execution_result
+
+    async def stream_user_code(self, user_id: str, code: str, input_data: str = "") -> AsyncIterator[Dict[str, Any]]:
+        """
+        Execute code submitted by a user, yielding its output as it is produced
+
+        Args:
+            user_id: ID of the user submitting the code
+            code: Code to execute
+            input_data: Input data for the code
+
+        Returns:
+            Async iterator of "started", "stdout"/"stderr" and "result" events
+
+        Raises:
+            SchedulerOverloaded: If the executor is too busy to queue the run
+                (before the first event)
+        """
+        events = stream_code(code, input_data, user_id=user_id)
+        try:
+            first = await events.__anext__()
+        except SchedulerOverloaded:
+            raise
+        except Exception as e:
+            logger.error(f"Error executing user code: {str(e)}")
+            yield {
+                "event": "result",
+                "data": {
+                    "output": "",
+                    "errors": str(e),
+                    "status": "error",
+                    "execution_time": 0,
+                    "return_code": -1
+                }
+            }
+            return
 
+        yield first
+        try:
+            async for event in events:
+                if event["event"] == "result":
+                    await self._record_code_execution(user_id, code, event["data"])
+                yield event
+        finally:
+            # Stops the program if the client went away mid-run
+            await events.aclose()
+
+    def cancel_user_code(self, user_id: str, run_id: str) -> bool:
+        """
+        Cancel a user's streamed run
+
+        Returns:
+            Whether a running program was cancelled
+        """
+        return cancel_code_stream(run_id, user_id)
+
+    async def _record_code_execution(self, user_id: str, code: str, execution_result: Dict[str, Any]):
+        """Publish the interaction event and telemetry for a finished run"""
+        # Event publishing must never turn a finished run into a failed one
+        try:
             # Send user interaction event to Kafka
             await send_user_interaction(
                 user_id=user_id,
@@ -112,25 +215,17 @@ class LearnFlowService:
                 }
             )
 
-            # Add real-time telemetry analysis
-            await analyze_student_telemetry(user_id, {
-                "interaction_type": "code_execution",
-                "timestamp": datetime.utcnow().isoformat(),
-                "data": {
-                    "execution_status": execution_result["status"]
-                }
-            })
-
-            return execution_result
+            # Add real-time telemetry analysis, unless the streaming stage handles it
+            if self.telemetry_mode == "inline":
+                await analyze_student_telemetry(user_id, {
+                    "interaction_type": "code_execution",
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "data": {
+                        "execution_status": execution_result["status"]
+                    }
+                })
         except Exception as e:
-            logger.error(f"Error executing user code: {str(e)}")
-            return {
-                "output": "",
-                "errors": str(e),
-                "status": "error",
-                "execution_time": 0,
-                "return_code": -1
-            }
+            logger.warning(f"Failed to record code execution event for {user_id}: {str(e)}")
 
     async def get_user_progress(self, user_id: str) -> Dict[str, Any]:
         """
@@ -282,39 +377,42 @@ class LearnFlowService:
             logger.error(f"Error creating user: {str(e)}")
             raise
 
-    async def review_code(self, user_id: str, code: str) -> Dict[str, Any]:
+    async def review_code(self, user_id: str, code: str, course: Optional[str] = None) -> Dict[str, Any]:
         """
         Review code submitted by a user
 
         Args:
             user_id: ID of the user
             code: Code to review
+            course: Course the code was written for, which selects the review rules
 
         Returns:
             Code review results
         """
         try:
             # Review the code with AI
-            review_result = await self.ai_service.review_code(code)
+            review_result = await self.ai_service.review_code(code, course=course)
 
-            # Send user interaction event to Kafka
-            await send_user_interaction(
-                user_id=user_id,
-                interaction_type="code_review",
-                data={
-                    "code_preview": code[:100] + "..." if len(code) > 100 else code,
-                    "num_issues_found": len(review_result.get("review", {}).get("issues", [])),
-                    "num_suggestions": len(review_result.get("review", {}).get("suggestions", []))
-                }
-            )
+            # Both events go out as one coalesced record
+            async with collect_events():
+                # Send user interaction event to Kafka
+                await send_user_interaction(
+                    user_id=user_id,
+                    interaction_type="code_review",
+                    data={
+                        "code_preview": code[:100] + "..." if len(code) > 100 else code,
+                        "num_issues_found": len(review_result.get("review", {}).get("issues", [])),
+                        "num_suggestions": len(review_result.get("review", {}).get("suggestions", []))
+                    }
+                )
 
-            # Send AI interaction event to Kafka
-            await send_ai_interaction(
-                user_id=user_id,
-                query=f"Review this code: {code[:50]}...",
-                response=f"Found {len(review_result.get('review', {}).get('issues', []))} issues",
-                agent_type="code_review"
-            )
+                # Send AI interaction event to Kafka
+                await send_ai_interaction(
+                    user_id=user_id,
+                    query=f"Review this code: {code[:50]}...",
+                    response=f"Found {len(review_result.get('review', {}).get('issues', []))} issues",
+                    agent_type="code_review"
+                )
 
             return review_result
         except Exception as e:
@@ -338,7 +436,7 @@ class LearnFlowService:
         """
         try:
             # Debug the code with AI
-            debug_result = await self.ai_service.debug_code(code, error_msg)
+            debug_result = await self.ai_service.debug_code(code, error_msg, user_id=user_id)
 
             # Send user interaction event to Kafka
             await send_user_interaction(
@@ -373,32 +471,34 @@ class LearnFlowService:
         """
         try:
             # Evaluate the solution with AI
-            evaluation = await self.ai_service.evaluate_exercise_solution(exercise_id, solution)
-
-            # Update progress based on evaluation
-            if evaluation.get("evaluation", {}).get("is_correct"):
-                await self.update_user_progress(
+            evaluation = await self.ai_service.evaluate_exercise_solution(exercise_id, solution, user_id=user_id)
+
+            # Progress and interaction events go out as one coalesced record
+            async with collect_events():
+                # Update progress based on evaluation
+                if evaluation.get("evaluation", {}).get("is_correct"):
+                    await self.update_user_progress(
+                        user_id=user_id,
+                        lesson_id=exercise_id,
+                        progress_data={
+                            "status": "completed",
+                            "score": evaluation["evaluation"].get("score", 0),
+                            "attempts": 1
+                        }
+                    )
+
+                # Send user interaction event to Kafka
+                await send_user_interaction(
                     user_id=user_id,
-                    lesson_id=exercise_id,
-                    progress_data={
-                        "status": "completed",
-                        "score": evaluation["evaluation"].get("score", 0),
-                        "attempts": 1
+                    interaction_type="exercise_evaluation",
+                    data={
+                        "exercise_id": exercise_id,
+                        "solution_preview": solution[:100] + "..." if len(solution) > 100 else solution,
+                        "is_correct": evaluation.get("evaluation", {}).get("is_correct", False),
+                        "score": evaluation["evaluation"].get("score", 0)
                     }
                 )
 
-            # Send user interaction event to Kafka
-            await send_user_interaction(
-                user_id=user_id,
-                interaction_type="exercise_evaluation",
-                data={
-                    "exercise_id": exercise_id,
-                    "solution_preview": solution[:100] + "..." if len(solution) > 100 else solution,
-                    "is_correct": evaluation.get("evaluation", {}).get("is_correct", False),
-                    "score": evaluation["evaluation"].get("score", 0)
-                }
-            )
-
             return evaluation
         except Exception as e:
             logger.error(f"Error evaluating exercise solution: {str(e)}")
@@ -420,6 +520,14 @@ async def init_learnflow_service():
     logger.info("LearnFlow service initialized globally")
 
 
+async def shutdown_learnflow_service():
+    """
+    Shut down the LearnFlow service
+    """
+    await learnflow_service.shutdown()
+    logger.info("LearnFlow service shut down")
+
+
 def get_learnflow_service() -> LearnFlowService:
     """
     Get the LearnFlow service instance
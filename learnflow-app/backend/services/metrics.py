@@ -0,0 +1,211 @@
+"""
+Metrics Registry for LearnFlow
+In-process counters, gauges, latency windows and stats snapshots served by the /metrics endpoint
+
+Counters are cheap enough for hot paths (a lock and a dict update), so code
+that used to log every message should count instead and log a sample.
+Components that already keep their own stats register a source callable that
+is only evaluated when a snapshot is taken.
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f"{name}={value}" for name, value in key) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._values: Dict[LabelKey, int] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1, **labels) -> int:
+        """
+        Increment the counter
+
+        Returns:
+            The new value for these labels, e.g. for sampling log lines
+        """
+        key = _label_key(labels)
+        with self._lock:
+            value = self._values.get(key, 0) + amount
+            self._values[key] = value
+        return value
+
+    def value(self, **labels) -> int:
+        return self._values.get(_label_key(labels), 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {f"{self.name}{_format_labels(key)}": value for key, value in self._values.items()}
+
+
+class Gauge:
+    """Point-in-time value with optional labels"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[_label_key(labels)] = value
+
+    def value(self, **labels) -> Optional[float]:
+        return self._values.get(_label_key(labels))
+
+    def snapshot(self) -> Dict[str, float]:
+        return {f"{self.name}{_format_labels(key)}": value for key, value in list(self._values.items())}
+
+
+class LatencyWindow:
+    """Latency percentiles and rate over the most recent observations, per label set"""
+
+    def __init__(self, name: str, window: int = 2048):
+        self.name = name
+        self.window = window
+        self._samples: Dict[LabelKey, Deque[Tuple[float, float]]] = {}
+        self._counts: Dict[LabelKey, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append((time.monotonic(), seconds))
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def summary(self, **labels) -> Dict[str, float]:
+        """count, p50, p99 and per-second rate over the window"""
+        with self._lock:
+            samples = list(self._samples.get(_label_key(labels), ()))
+            count = self._counts.get(_label_key(labels), 0)
+        return self._summarize(samples, count)
+
+    @staticmethod
+    def _summarize(samples: list, count: int) -> Dict[str, float]:
+        if not samples:
+            return {"count": count, "p50": 0.0, "p99": 0.0, "rate": 0.0}
+        values = sorted(value for _, value in samples)
+        span = samples[-1][0] - samples[0][0]
+        return {
+            "count": count,
+            "p50": values[int(0.50 * (len(values) - 1))],
+            "p99": values[int(0.99 * (len(values) - 1))],
+            "rate": (len(samples) - 1) / span if span > 0 else 0.0,
+        }
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            items = [(key, list(samples), self._counts[key]) for key, samples in self._samples.items()]
+        return {f"{self.name}{_format_labels(key)}": self._summarize(samples, count) for key, samples, count in items}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._counters: Dict[str, Counter] = {}
+        self._gauges: Dict[str, Gauge] = {}
+        self._latencies: Dict[str, LatencyWindow] = {}
+        self._sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._stats: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str) -> Counter:
+        """Get or create a counter"""
+        with self._lock:
+            if name not in self._counters:
+                self._counters[name] = Counter(name)
+            return self._counters[name]
+
+    def gauge(self, name: str) -> Gauge:
+        """Get or create a gauge"""
+        with self._lock:
+            if name not in self._gauges:
+                self._gauges[name] = Gauge(name)
+            return self._gauges[name]
+
+    def latency(self, name: str) -> LatencyWindow:
+        """Get or create a latency window"""
+        with self._lock:
+            if name not in self._latencies:
+                self._latencies[name] = LatencyWindow(name)
+            return self._latencies[name]
+
+    def register_source(self, name: str, source: Callable[[], Dict[str, Any]]):
+        """
+        Register a callable whose result is included in every snapshot
+
+        Args:
+            name: Section name in the snapshot
+            source: Function returning a JSON-serializable dict
+        """
+        self._sources[name] = source
+
+    def unregister_source(self, name: str):
+        self._sources.pop(name, None)
+
+    def record_stats(self, name: str, stats: Dict[str, Any]):
+        """Store the latest stats report pushed by a component (e.g. a Kafka client)"""
+        self._stats[name] = (time.time(), stats)
+
+    def get_stats(self, name: str) -> Tuple[Optional[float], Optional[Dict[str, Any]]]:
+        """Latest stats report for `name` with the time it was recorded"""
+        return self._stats.get(name, (None, None))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything the registry knows, as a JSON-serializable dict"""
+        counters: Dict[str, int] = {}
+        for counter in list(self._counters.values()):
+            counters.update(counter.snapshot())
+        gauges: Dict[str, float] = {}
+        for gauge in list(self._gauges.values()):
+            gauges.update(gauge.snapshot())
+        latencies: Dict[str, Dict[str, float]] = {}
+        for latency in list(self._latencies.values()):
+            latencies.update(latency.snapshot())
+
+        sources = {}
+        for name, source in list(self._sources.items()):
+            try:
+                sources[name] = source()
+            except Exception as e:
+                sources[name] = {"error": str(e)}
+
+        now = time.time()
+        stats = {
+            name: {"age_seconds": round(now - recorded_at, 3), **values}
+            for name, (recorded_at, values) in list(self._stats.items())
+        }
+
+        return {
+            "timestamp": now,
+            "counters": counters,
+            "gauges": gauges,
+            "latencies": latencies,
+            "sources": sources,
+            "stats": stats,
+        }
+
+
+# Global metrics registry
+metrics = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get the global metrics registry"""
+    return metrics
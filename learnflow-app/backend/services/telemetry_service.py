@@ -1,7 +1,7 @@
 import asyncio
 import logging
-from typing import Dict, Any
-from .kafka.kafka_service import send_event
+from typing import Dict, Any, Optional
+from .kafka.kafka_service import send_event, process_stream
 from .dapr_service import dapr_service
 
 logger = logging.getLogger(__name__)
@@ -52,3 +52,26 @@ async def analyze_student_telemetry(user_id: str, event_data: Dict[str, Any]):
         return True
     
     return False
+
+
+async def _handle_interaction_event(event: Dict[str, Any]):
+    if event.get("interaction_type") == "code_execution" and event.get("user_id"):
+        await analyze_student_telemetry(event["user_id"], event)
+
+
+async def run_telemetry_stage(max_in_flight: int = 200, lanes: Optional[int] = None):
+    """
+    Run struggle detection as a streaming stage over the user-interactions topic,
+    instead of inline in the HTTP request that executed the code.
+
+    Events are spread over worker lanes by user_id, so different students are
+    analyzed in parallel while each student's events are seen in order.
+    """
+    logger.info("Starting telemetry streaming stage")
+    await process_stream(
+        ["user-interactions"],
+        _handle_interaction_event,
+        group_id="learnflow-telemetry",
+        max_in_flight=max_in_flight,
+        lanes=lanes
+    )